@@ -1,4 +1,9 @@
 from django.contrib import admin
-from .models import Assignment
+from .models import Assignment, FacetResult, GradingJob, GradingTask, OutcomeMatrix, Submission
 
 admin.site.register(Assignment)
+admin.site.register(GradingJob)
+admin.site.register(GradingTask)
+admin.site.register(Submission)
+admin.site.register(FacetResult)
+admin.site.register(OutcomeMatrix)
@@ -0,0 +1,153 @@
+"""
+Server-Sent Events stream of a grading job's progress.
+
+``job_events`` is an async view: under ASGI (``core/asgi.py``) a watcher waiting between
+polls holds no worker thread, so thousands of open streams cost little more than their
+sockets. Every ``GRADING_EVENTS_INTERVAL`` seconds the stream reads the tasks finished since
+its last poll and sends them as one ``results`` event (split at
+``GRADING_EVENTS_BATCH_SIZE``), followed by a ``progress`` event, so a burst of completions
+becomes a few large events rather than one per submission.
+
+Events::
+
+    event: results    data: [{"index": 0, "file_name": ..., "score": ...}, ...]
+    event: progress   data: {"status": "running", "finished": 120, "total": 1000}
+    event: done       data: {"status": "done", "finished": 1000, "total": 1000}
+
+Browsers' ``EventSource`` cannot set headers, so besides the usual ``Authorization: Token``
+header the stream accepts the ``events_token`` of the job's summary as a ``token`` query
+parameter. Query strings end up in access logs, so that token is signed for the one job
+and expires after ``GRADING_EVENTS_TOKEN_MAX_AGE`` seconds; the API token never appears in
+a URL.
+"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import GradingJob, GradingTask
+
+# Seconds between keep-alive comments on an idle stream.
+KEEPALIVE_SECONDS = 15
+
+# Tasks may commit slightly out of ``finished_at`` order (and workers' clocks may drift), so
+# each poll looks back this far and skips tasks it has already sent.
+POLL_OVERLAP = timedelta(seconds=2)
+
+
+EVENTS_TOKEN_SALT = 'assignments.events'
+
+
+def events_token(job):
+    """Sign a short-lived token that authenticates ``job_events`` for ``job`` only."""
+    return signing.dumps(str(job.pk), salt=EVENTS_TOKEN_SALT)
+
+
+def _token_owner(key, job_id):
+    try:
+        signed_job = signing.loads(key, salt=EVENTS_TOKEN_SALT,
+                                   max_age=settings.GRADING_EVENTS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if signed_job != str(job_id):
+        return None
+    job = GradingJob.objects.select_related('assignment__owner').filter(pk=job_id).first()
+    return job.assignment.owner if job else None
+
+
+def _authenticate(request, job_id):
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if result:
+        return result[0]
+    key = request.GET.get('token')
+    return _token_owner(key, job_id) if key else None
+
+
+def _get_job(user, assignment_id, job_id):
+    try:
+        return GradingJob.objects.get(pk=job_id, assignment__pk=assignment_id,
+                                      assignment__owner=user)
+    except GradingJob.DoesNotExist:
+        raise Http404('Grading job not found')
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class JobEventStream:
+    """The polling state of one watcher: what it has sent and where the next poll starts."""
+
+    def __init__(self, job):
+        self.job = job
+        self.cursor = None
+        self.sent = {}
+
+    def poll(self):
+        """Return the newly finished submissions and the job's progress."""
+        # Read the job first: once it is done, every task finished before this query.
+        job = GradingJob.objects.only('status', 'task_count').get(pk=self.job.pk)
+        tasks = GradingTask.objects.filter(job_id=self.job.pk, finished_at__isnull=False)
+        if self.cursor is not None:
+            tasks = tasks.filter(finished_at__gte=self.cursor - POLL_OVERLAP)
+        results = []
+        for task in tasks.order_by('finished_at', 'pk'):
+            if task.pk in self.sent:
+                continue
+            self.sent[task.pk] = task.finished_at
+            results.append({'index': task.index, **task.get_result()})
+            self.cursor = task.finished_at
+        if self.cursor is not None:
+            horizon = self.cursor - POLL_OVERLAP
+            self.sent = {pk: at for pk, at in self.sent.items() if at >= horizon}
+        finished = GradingTask.objects.filter(
+            job_id=job.pk, status__in=GradingTask.FINISHED_STATUSES).count()
+        progress = {'status': job.status, 'finished': finished, 'total': job.task_count}
+        return results, progress
+
+    async def events(self):
+        interval = settings.GRADING_EVENTS_INTERVAL
+        batch_size = settings.GRADING_EVENTS_BATCH_SIZE
+        yield f'retry: {int(interval * 1000)}\n\n'
+        last_sent = time.monotonic()
+        previous = None
+        while True:
+            results, progress = await sync_to_async(self.poll)()
+            for start in range(0, len(results), batch_size):
+                yield _event('results', results[start:start + batch_size])
+            if progress['status'] in (GradingJob.STATUS_DONE, GradingJob.STATUS_FAILED):
+                yield _event('done', progress)
+                return
+            if results or progress != previous:
+                yield _event('progress', progress)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            previous = progress
+            await asyncio.sleep(interval)
+
+
+async def job_events(request, pk, job_id):
+    """``GET /api/v1/assignments/<pk>/jobs/<job_id>/events/``: stream a job's progress."""
+    user = await sync_to_async(_authenticate)(request, job_id)
+    if user is None or not user.is_active:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=401)
+    job = await sync_to_async(_get_job)(user, pk, job_id)
+    response = StreamingHttpResponse(JobEventStream(job).events(),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,340 @@
+"""
+Streaming gradebook export.
+
+A gradebook has one row per graded submission and the columns of the browser export
+(``ExportSubmissionColumns`` in ``models/submission/submission.ts``): file name, points,
+max points, score, the submission's document properties, and the expected and provided
+value of every facet. Rows are produced from the database one at a time and written out as
+CSV or xlsx while they are produced, so memory stays flat however many submissions a job
+has and the first bytes reach the client straight away.
+"""
+import csv
+import math
+import re
+import zipfile
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import Prefetch
+
+from .grading.facets import FACET_TYPES
+from .grading.metadata import DATE_PROPERTIES
+from .grading.references import column_letters
+from .models import FacetResult, GradingTask, Submission
+
+BASE_COLUMNS = {
+    'fileName': 'File Name',
+    'points': 'Points',
+    'maxPoints': 'Max Points',
+    'score': 'Score',
+    'creator': 'Creator',
+    'company': 'Company',
+    'lastModifiedBy': 'Last Modified By',
+    'lastModified': 'Last Modified',
+    'created': 'Created',
+    'lastPrinted': 'Last Printed',
+    'manager': 'Manager',
+    'title': 'Title',
+    'subject': 'Subject',
+    'description': 'Description',
+    'keywords': 'Keywords',
+    'category': 'Category',
+}
+
+# Rows are batched into chunks of about this many bytes before being sent.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def gradebook_columns(questions):
+    """
+    Return ``{key: header}`` for every column a gradebook of ``questions`` can have.
+
+    Facet columns are keyed ``expected-<question>-<facet>`` and ``provided-<question>-<facet>``
+    (0-based indexes) and headed like the browser export's.
+    """
+    columns = dict(BASE_COLUMNS)
+    for question_index, question in enumerate(questions or []):
+        question_name = question.get('name') or f'Problem {question_index + 1}'
+        for facet_index, facet in enumerate(question.get('facets') or []):
+            facet_type = FACET_TYPES.get(facet.get('type'))
+            facet_name = facet.get('name') or (facet_type.default_name if facet_type else '')
+            suffix = f'{facet_name} (#{facet_index + 1})'
+            key = f'{question_index}-{facet_index}'
+            columns[f'expected-{key}'] = f'{question_name} Expected - {suffix}'
+            columns[f'provided-{key}'] = f'{question_name} Provided - {suffix}'
+    return columns
+
+
+def job_results(job):
+    """Yield the results of a job's submissions in upload order, reading rows in batches."""
+    tasks = (GradingTask.objects.filter(job=job).order_by('index')
+             .only('file_name', 'status', 'result', 'error'))
+    for task in tasks.iterator(chunk_size=500):
+        yield task.get_result()
+
+
+def assignment_results(assignment):
+    """
+    Yield the results of an assignment's stored submissions, oldest first, as ``grade_file``
+    results built from their ``Submission`` and ``FacetResult`` rows.
+
+    Those rows are kept current by regrades and rescores, which leave the ``GradingTask``
+    results of earlier jobs as they were graded.
+    """
+    facet_results = FacetResult.objects.only('submission_id', 'question', 'facet',
+                                             'provided_value', 'expected_value')
+    submissions = (Submission.objects.filter(assignment=assignment)
+                   .order_by('created_at', 'pk')
+                   .only('file_name', 'score', 'max_score', 'error', 'metadata')
+                   .prefetch_related(Prefetch('facet_results', queryset=facet_results)))
+    for submission in submissions.iterator(chunk_size=500):
+        if submission.score is None:
+            yield {'file_name': submission.file_name,
+                   'error': submission.error or 'Not graded yet',
+                   'metadata': submission.metadata}
+            continue
+        yield {
+            'file_name': submission.file_name,
+            'score': _number(submission.score),
+            'max_score': _number(submission.max_score),
+            'responses': [{'question': row.question, 'facet': row.facet,
+                           'provided_value': row.provided_value,
+                           'expected_value': row.expected_value}
+                          for row in submission.facet_results.all()],
+            'metadata': submission.metadata,
+        }
+
+
+def _number(value):
+    """A stored score as graded: integral points are ints, as ``Rubric.grade`` returns them."""
+    return int(value) if value.is_integer() else value
+
+
+def gradebook_row(result, columns):
+    """Return the values of ``columns`` for one ``grade_file`` result."""
+    values = {'fileName': result.get('file_name')}
+    if 'error' not in result:
+        points, max_points = result.get('score'), result.get('max_score')
+        values['points'] = points
+        values['maxPoints'] = max_points
+        values['score'] = points / max_points if max_points else None
+        for response in result.get('responses') or []:
+            key = f'{response["question"]}-{response["facet"]}'
+            values[f'expected-{key}'] = response.get('expected_value')
+            values[f'provided-{key}'] = response.get('provided_value')
+    values.update(result.get('metadata') or {})
+    return [values.get(column) for column in columns]
+
+
+# Leading characters that make a spreadsheet read a CSV cell as a formula.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Signed numbers such as "-3.5" start with a formula prefix but are read as numbers.
+_NUMBER_PATTERN = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) \
+            and not _NUMBER_PATTERN.fullmatch(value):
+        # Submitted text such as "=HYPERLINK(...)" must not run when the file is opened.
+        return f"'{value}"
+    return value
+
+
+def iter_csv(headers, rows):
+    """
+    Yield a CSV file as chunks of text, starting with the header row. Text that a
+    spreadsheet would read as a formula is prefixed with ``'``.
+    """
+    buffer = _Buffer('')
+    writer = csv.writer(buffer)
+    writer.writerow([_csv_value(header) for header in headers])
+    yield buffer.drain()
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.size >= STREAM_CHUNK_SIZE:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def _parse_date(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _xlsx_cell(reference, value):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return ''
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{reference}" s="1"><v>{serial!r}</v></c>'
+    text = _ILLEGAL_XML_CHARS.sub('', str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'<c r="{reference}" t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '<Override PartName="/docProps/core.xml" '
+    'ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" '
+    'Target="docProps/core.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Style 0 is the default, style 1 formats a date and time (built-in number format 22).
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs></styleSheet>'
+)
+
+
+def _workbook_xml(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name={quoteattr(sheet_name[:31])} sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _core_xml(title):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<cp:coreProperties '
+        'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:title>{escape(_ILLEGAL_XML_CHARS.sub("", title))}</dc:title>'
+        '</cp:coreProperties>'
+    )
+
+
+def date_column_indexes(columns):
+    """Return the positions of the document-property date columns in ``columns``."""
+    return [index for index, column in enumerate(columns) if column in DATE_PROPERTIES]
+
+
+def iter_xlsx(headers, rows, sheet_name='Submissions', title='', date_columns=()):
+    """
+    Yield an xlsx file as chunks of bytes, writing rows as they arrive.
+
+    The zip is written to a non-seekable buffer, so members carry data descriptors and
+    nothing is ever rewound; strings are stored inline instead of in a shared string table.
+    Memory therefore does not grow with the number of rows. Values in ``date_columns``
+    (indexes) that parse as ISO dates are written as Excel dates.
+    """
+    buffer = _Buffer(b'')
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('docProps/core.xml', _core_xml(title))
+        archive.writestr('xl/workbook.xml', _workbook_xml(sheet_name))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        letters = [column_letters(index) for index in range(1, len(headers) + 1)]
+        widths = ''.join(f'<col min="{index}" max="{index}" width="{len(str(header)) + 6}" '
+                         'customWidth="1"/>'
+                         for index, header in enumerate(headers, start=1))
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                f'<cols>{widths}</cols><sheetData>'
+            ).encode())
+            sheet.write(_xlsx_row(1, letters, headers).encode())
+            yield buffer.drain()
+            for number, row in enumerate(rows, start=2):
+                row = list(row)
+                for index in date_columns:
+                    if row[index]:
+                        row[index] = _parse_date(row[index])
+                sheet.write(_xlsx_row(number, letters, row).encode())
+                if buffer.size >= STREAM_CHUNK_SIZE:
+                    yield buffer.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+def _xlsx_row(number, letters, values):
+    cells = ''.join(_xlsx_cell(f'{letter}{number}', value)
+                    for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+class _Buffer:
+    """A write-only sink that hands back what has been written since the last drain."""
+
+    def __init__(self, empty):
+        self.empty = empty
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self.empty.join(self.parts)
+        self.parts, self.size = [], 0
+        return data
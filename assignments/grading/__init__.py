@@ -0,0 +1,35 @@
+"""
+Server-side grading engine for the rubrics stored in ``Assignment.questions``.
+"""
+from .archive import SubmissionArchive
+from .cache import ResultCache
+from .compiler import CompiledRubric, compile_rubric, evict_rubrics
+from .engine import Rubric, grade_file, load_master, rubric_counts, rubric_key
+from .exceptions import ArchiveError, GradingError, RegexTimeout, RubricError, WorkbookError
+from .executor import grade_many
+from .metadata import DocumentProperties, read_metadata, shared_origins
+from .reader import ReadPlan, load_workbook
+
+__all__ = [
+    'ArchiveError',
+    'CompiledRubric',
+    'DocumentProperties',
+    'GradingError',
+    'ReadPlan',
+    'RegexTimeout',
+    'ResultCache',
+    'Rubric',
+    'RubricError',
+    'SubmissionArchive',
+    'WorkbookError',
+    'compile_rubric',
+    'evict_rubrics',
+    'grade_file',
+    'grade_many',
+    'load_master',
+    'load_workbook',
+    'read_metadata',
+    'rubric_counts',
+    'rubric_key',
+    'shared_origins',
+]
@@ -0,0 +1,143 @@
+"""
+Reading a zip of submissions, such as an LMS bulk export, without extracting it.
+
+Members are listed from the central directory and read one at a time straight into memory,
+so ``grade_many`` can start grading the first files while later ones are still being read.
+Declared uncompressed sizes are checked against the per-member and total limits before
+anything is decompressed, and each read is capped at the member limit as well.
+
+``files`` opens members without reading them at all, for callers such as the scan that need
+only a few parts of each nested workbook.
+"""
+import posixpath
+import struct
+import zipfile
+import zlib
+
+from .exceptions import ArchiveError
+from .mapped import MappedFile
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Size of a zip local file header before its file name and extra field.
+LOCAL_HEADER_SIZE = 30
+
+SUBMISSION_EXTENSIONS = ('.xlsx',)
+
+
+def _is_submission(info):
+    if info.is_dir():
+        return False
+    name = info.filename
+    base = posixpath.basename(name)
+    if name.startswith('__MACOSX/') or base.startswith(('.', '~$')):
+        return False
+    return base.lower().endswith(SUBMISSION_EXTENSIONS)
+
+
+class SubmissionArchive:
+    """
+    The xlsx members of a zip archive.
+
+    Iterating yields ``(file_name, bytes)`` for each readable member, in archive order;
+    members that are encrypted, too large or corrupt are recorded in ``rejected`` as
+    ``{'file_name', 'error'}`` results instead.
+
+    Args:
+        source: A path or seekable binary file
+        max_member_size: Largest uncompressed size accepted for a single member
+        max_total_size: Largest combined uncompressed size of the accepted members
+
+    Raises:
+        ArchiveError: If the file is not a zip or its members exceed ``max_total_size``
+    """
+
+    def __init__(self, source, max_member_size, max_total_size):
+        try:
+            self.archive = zipfile.ZipFile(source)
+        except (zipfile.BadZipFile, OSError) as exc:
+            raise ArchiveError('File is not a valid zip archive') from exc
+        self.source = source
+        self.max_member_size = max_member_size
+        self.members = []
+        self.rejected = []
+        for info in self.archive.infolist():
+            if not _is_submission(info):
+                continue
+            if info.flag_bits & 0x1:
+                self._reject(info, 'File is encrypted')
+            elif info.file_size > max_member_size:
+                self._reject(info, f'File is larger than {max_member_size} bytes')
+            else:
+                self.members.append(info)
+        total = sum(info.file_size for info in self.members)
+        if total > max_total_size:
+            raise ArchiveError(f'Archive contents are larger than {max_total_size} bytes')
+
+    def _reject(self, info, error):
+        self.rejected.append({'file_name': info.filename, 'error': error})
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        for info in self.members:
+            data = self._read(info)
+            if data is not None:
+                yield info.filename, data
+
+    def files(self):
+        """
+        Yield ``(file_name, file)`` for each member, as a seekable file that is only read as
+        far as the caller reads it.
+
+        A stored member of an archive opened as a ``MappedFile`` is a slice of the mapping;
+        any other member is decompressed as it is read, never past its declared (and
+        already checked) size. Each file is closed before the next is yielded.
+        """
+        for info in self.members:
+            try:
+                member = self._open(info)
+            except (zipfile.BadZipFile, NotImplementedError) as exc:
+                self._reject(info, f'Could not read file from archive: {exc}')
+                continue
+            with member:
+                yield info.filename, member
+
+    def _open(self, info):
+        if info.compress_type != zipfile.ZIP_STORED or not isinstance(self.source, MappedFile):
+            return self.archive.open(info)
+        self.source.seek(info.header_offset)
+        header = self.source.read(LOCAL_HEADER_SIZE)
+        if len(header) < LOCAL_HEADER_SIZE or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile('Bad magic number for file header')
+        name_length, extra_length = struct.unpack('<HH', header[26:])
+        offset = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+        return self.source.section(offset, info.file_size)
+
+    def _read(self, info):
+        chunks, size = [], 0
+        try:
+            with self.archive.open(info) as member:
+                while True:
+                    chunk = member.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_member_size:
+                        self._reject(info, f'File is larger than {self.max_member_size} bytes')
+                        return None
+                    chunks.append(chunk)
+        except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError) as exc:
+            self._reject(info, f'Could not read file from archive: {exc}')
+            return None
+        return b''.join(chunks)
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
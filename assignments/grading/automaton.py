@@ -0,0 +1,80 @@
+"""
+Aho–Corasick multi-pattern matching, measured against per-facet substring scans by the
+``contains`` benchmark.
+
+Grading does not use it. Formula Contains facets each run ``needle in formula``: CPython's
+substring search is C code and class formulas are short, so one scan per facet beats a
+Python-level pass over the formula's bytes until a cell has about a hundred needles, more
+than any rubric stacks on one cell.
+"""
+from collections import deque
+
+
+def _encode(text):
+    # A UTF-8 substring is a substring of the decoded text and vice versa.
+    return text.encode('utf-8', 'surrogatepass')
+
+
+class AhoCorasick:
+    """
+    An automaton over a fixed set of needles. ``search(text)`` returns the needles that
+    occur in ``text``, as substrings, exactly as ``needle in text`` would for each one.
+
+    The automaton runs over the UTF-8 bytes of the text. Bytes are first mapped to the
+    handful of classes the needles distinguish (every byte no needle uses is class 0) with
+    ``bytes.translate``, and transitions are completed into a DFA of per-state lists, so
+    searching costs one list lookup per byte whatever the number of needles.
+    """
+
+    __slots__ = ('needles', '_classes', '_delta', '_output')
+
+    def __init__(self, needles):
+        self.needles = frozenset(needles)
+        encoded = {needle: _encode(needle) for needle in self.needles}
+        alphabet = sorted({byte for data in encoded.values() for byte in data})
+        classes = bytearray(256)
+        for index, byte in enumerate(alphabet, start=1):
+            classes[byte] = index
+        self._classes = bytes(classes)
+
+        goto, output = [{}], [set()]
+        for needle, data in encoded.items():
+            state = 0
+            for symbol in data.translate(self._classes):
+                following = goto[state].get(symbol)
+                if following is None:
+                    following = goto[state][symbol] = len(goto)
+                    goto.append({})
+                    output.append(set())
+                state = following
+            output[state].add(needle)
+
+        # Breadth-first, so a state's failure state (always shallower) is complete before
+        # the state copies its transitions and outputs.
+        width = len(alphabet) + 1
+        delta = [[0] * width for _ in goto]
+        for symbol, following in goto[0].items():
+            delta[0][symbol] = following
+        failure = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] |= output[failure[state]]
+            delta[state][:] = delta[failure[state]]
+            for symbol, following in goto[state].items():
+                failure[following] = delta[failure[state]][symbol]
+                delta[state][symbol] = following
+                queue.append(following)
+        self._delta = delta
+        self._output = [frozenset(names) for names in output]
+
+    def search(self, text):
+        """Return the set of needles occurring in ``text``."""
+        delta, output = self._delta, self._output
+        found = set(output[0])
+        state = 0
+        for symbol in _encode(text).translate(self._classes):
+            state = delta[state][symbol]
+            if output[state]:
+                found |= output[state]
+        return found
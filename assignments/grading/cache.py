@@ -0,0 +1,194 @@
+"""
+Content-addressed cache of grading results.
+
+A result is keyed by the SHA-256 of the normalized rubric and the SHA-256 of the submission
+bytes, so re-uploading an unchanged batch, or the same file under another name, is served
+without reading the workbook again. Results are stored without the file name and the
+master's expected values, which are filled back in on a hit.
+
+The cache lives in the Django cache named by ``GRADING_CACHE``; by default that is an
+``LRUFileBasedCache`` bounded by its ``MAX_ENTRIES`` option.
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+from .engine import OUTCOME_TIMEOUT
+
+# Bump when a change to the engine alters the results of an unchanged rubric.
+RESULT_VERSION = 4
+
+# Facet keys that do not change a facet's result.
+_IGNORED_FACET_KEYS = ('review',)
+
+# Facet keys that do not change whether a facet passes: its points only scale the score.
+_OUTCOME_FACET_KEYS = _IGNORED_FACET_KEYS + ('points',)
+
+_MISSING = object()
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    ``FileBasedCache`` that evicts the least recently used entries.
+
+    Reads touch the entry's modification time, and culling removes the oldest
+    ``1 / CULL_FREQUENCY`` of the entries instead of a random sample.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except OSError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        entries = []
+        for fname in filelist:
+            try:
+                entries.append((os.path.getmtime(fname), fname))
+            except OSError:
+                continue
+        entries.sort()
+        for _, fname in entries[:num_entries // self._cull_frequency]:
+            self._delete(fname)
+
+
+def rubric_digest(questions):
+    """
+    Hash the grading-relevant content of ``Assignment.questions``.
+
+    Question names and facets' review flags do not affect results and are left out.
+    """
+    normalized = [
+        [{key: value for key, value in facet.items() if key not in _IGNORED_FACET_KEYS}
+         if isinstance(facet, dict) else facet
+         for facet in (question.get('facets') or [])]
+        if isinstance(question, dict) else question
+        for question in questions or []
+    ]
+    text = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def facet_digest(facet):
+    """
+    Hash what decides whether one facet passes: its identity across edits of the rubric.
+
+    Points are left out, as every facet scores all or nothing: a facet whose points changed
+    passes or fails as before and is rescored, not evaluated again. The engine's
+    ``RESULT_VERSION`` is part of the hash, so results stored under an older engine never
+    match.
+    """
+    if isinstance(facet, dict):
+        facet = {key: value for key, value in facet.items() if key not in _OUTCOME_FACET_KEYS}
+    text = json.dumps([RESULT_VERSION, facet], sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def facet_digests(questions):
+    """Return the ``facet_digest`` of every facet of ``Assignment.questions``, in facet order."""
+    return [facet_digest(facet)
+            for question in questions or [] if isinstance(question, dict)
+            for facet in (question.get('facets') or [])]
+
+
+def submission_digest(source):
+    """Hash a submission given as bytes or as a file path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, 'rb') as handle:
+        return hashlib.file_digest(handle, 'sha256').hexdigest()
+
+
+class ResultCache:
+    """
+    Grading results for one rubric revision, with hit and miss counts.
+
+    Args:
+        questions: The assignment's ``questions`` JSON
+        alias: The Django cache to use (default ``GRADING_CACHE``)
+    """
+
+    def __init__(self, questions, alias=None):
+        self.cache = caches[alias or settings.GRADING_CACHE]
+        self.rubric = rubric_digest(questions)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, digest):
+        return f'grading:{self.rubric}:{digest}'
+
+    def get(self, digest):
+        """Return the cached result for a submission digest, or None."""
+        return self.cache.get(self._key(digest), version=RESULT_VERSION)
+
+    def get_many(self, digests):
+        """Return ``{digest: result}`` for the cached digests."""
+        keys = {self._key(digest): digest for digest in digests}
+        found = self.cache.get_many(list(keys), version=RESULT_VERSION)
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, digest, result):
+        """
+        Store a result. Unreadable files and crashed workers are not cached, nor are results
+        with a timed-out regex search, which another run may well finish.
+        """
+        if 'error' in result or any(response.get('outcome') == OUTCOME_TIMEOUT
+                                    for response in result['responses']):
+            return
+        value = {key: item for key, item in result.items() if key != 'file_name'}
+        value['responses'] = [{**response, 'expected_value': None}
+                              for response in result['responses']]
+        self.cache.set(self._key(digest), value, timeout=None, version=RESULT_VERSION)
+
+    @staticmethod
+    def restore(value, file_name, expected=None):
+        """Rebuild a ``grade_file`` result from a cached value."""
+        responses = value['responses']
+        if expected:
+            responses = [{**response, 'expected_value': expected[index]}
+                         for index, response in enumerate(responses)]
+        return {'file_name': file_name, **value, 'responses': responses}
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def cached_workbook(digest, plan, load, alias=None):
+    """
+    Return a submission's parsed ``Workbook`` holding at least the cells ``plan`` reads.
+
+    Parsed workbooks are kept in the grading cache by file digest, together with the plan
+    they were read with. A cached workbook is used as is when its plan covers ``plan``;
+    otherwise ``load(plan)`` reads the file again for the cells of both plans and the
+    result replaces the entry. Without a grading cache, this is ``load(plan)``.
+    """
+    alias = alias or settings.GRADING_CACHE
+    if not alias:
+        return load(plan)
+    cache = caches[alias]
+    key = f'grading:cells:{digest}'
+    entry = cache.get(key, version=RESULT_VERSION)
+    if entry is not None:
+        read_with, workbook = entry
+        if read_with.covers(plan):
+            return workbook
+        plan = read_with.merge(plan)
+    workbook = load(plan)
+    cache.set(key, (plan, workbook), timeout=None, version=RESULT_VERSION)
+    return workbook
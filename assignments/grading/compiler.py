@@ -0,0 +1,90 @@
+"""
+Rubric compilation: ``Assignment.questions`` analysed once per revision.
+
+Building a ``Rubric`` parses every target address, compiles and vets every regex and works
+out which cells a submission must be read for. ``compile_rubric`` does that once per rubric
+revision (``rubric_key``: the assignment's uuid and ``updated_at``) and keeps the result in
+a small in-process LRU, so grading N submissions, in the web process or in a worker,
+analyses the rubric once rather than N times.
+
+Editing an assignment changes its ``updated_at`` and so its key; ``evict_rubrics`` also
+drops the superseded revisions from this process straight away rather than leaving them to
+age out. Other processes never look the old key up again and evict it in time.
+"""
+import threading
+from collections import OrderedDict
+
+from .engine import Rubric
+
+# Rubric revisions each process keeps compiled.
+RUBRIC_CACHE_SIZE = 32
+
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+class CompiledRubric:
+    """
+    An immutable execution plan for one rubric revision.
+
+    Attributes:
+        key: The rubric revision, from ``rubric_key``
+        rubric: The ``Rubric`` with its facets built and validated
+        plan: The frozen ``ReadPlan`` of the cells the facets read
+        cells: ``{sheet_name: ((row, col), ...)}``, the deduplicated target cells in
+            reading order
+        max_score: The rubric's total points
+    """
+
+    __slots__ = ('key', 'rubric', 'plan', 'cells', 'max_score')
+
+    def __init__(self, key, questions):
+        rubric = Rubric(questions)
+        plan = rubric.read_plan().freeze()
+        for name, value in (
+            ('key', key),
+            ('rubric', rubric),
+            ('plan', plan),
+            ('cells', {sheet: tuple(sorted(positions))
+                       for sheet, positions in plan.cells.items()}),
+            ('max_score', rubric.get_max_score()),
+        ):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledRubric is immutable')
+
+    def __repr__(self):
+        return f'CompiledRubric({self.key!r})'
+
+
+def compile_rubric(key, questions):
+    """
+    Return the ``CompiledRubric`` for a rubric revision, compiling it on first use.
+
+    Raises ``RubricError`` if the rubric cannot be graded; failures are not cached.
+    """
+    with _lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+    compiled = CompiledRubric(key, questions)
+    with _lock:
+        compiled = _compiled.setdefault(key, compiled)
+        while len(_compiled) > RUBRIC_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def evict_rubrics(assignment_pk):
+    """Drop every compiled revision of an assignment's rubric from this process."""
+    prefix = f'{assignment_pk}:'
+    with _lock:
+        for key in [key for key in _compiled if key.startswith(prefix)]:
+            del _compiled[key]
+
+
+def clear_compiled_rubrics():
+    with _lock:
+        _compiled.clear()
@@ -0,0 +1,204 @@
+"""
+Grading engine: applies the rubric stored in ``Assignment.questions`` to submissions.
+
+The response shape matches ``SubmissionResponse`` in the Angular app
+(``models/submission/submission.ts``): one entry per facet with its score, max score,
+the submission's value (``provided_value``) and the master workbook's value
+(``expected_value``).
+"""
+from .exceptions import RegexTimeout, RubricError, WorkbookError
+from .facets import (
+    FACET_TYPES, REGEX_TIMEOUT_LIMIT, FormulaListFacet, FormulaMatchFacet, build_facet,
+)
+from .mapped import open_stored
+from .reader import ReadPlan, load_workbook
+
+# ``outcome`` of a facet response: graded normally, or a regex search that ran out of time
+# (scored 0).
+OUTCOME_GRADED = 'graded'
+OUTCOME_TIMEOUT = 'timeout'
+
+
+class Question:
+    """A named group of facets, as stored in ``Assignment.questions``."""
+
+    def __init__(self, data):
+        if not isinstance(data, dict):
+            raise RubricError('Questions must be objects')
+        self.name = data.get('name')
+        facets = data.get('facets') or []
+        if not isinstance(facets, list):
+            raise RubricError('Question facets must be a list')
+        self.facets = [build_facet(facet) for facet in facets]
+
+    def get_max_score(self):
+        return sum(facet.get_max_score() for facet in self.facets)
+
+
+class Rubric:
+    """
+    The gradeable form of ``Assignment.questions``.
+
+    Raises ``RubricError`` on construction if any facet could not be evaluated, so a bad
+    rubric is rejected once instead of failing every submission.
+    """
+
+    def __init__(self, questions):
+        if not isinstance(questions, list):
+            raise RubricError('Questions must be a list')
+        self.questions = [Question(question) for question in questions]
+        self.formula_list_targets = [facet.target.key for facet in self.facets()
+                                     if isinstance(facet, FormulaListFacet)]
+
+    def get_max_score(self):
+        return sum(question.get_max_score() for question in self.questions)
+
+    def facets(self):
+        for question in self.questions:
+            yield from question.facets
+
+    def formula_stats(self):
+        """
+        Return ``(lookups, evaluations)``: formula-matching facet outcomes asked for and
+        actually computed so far, as counted by each facet's ``FormulaMemo``.
+        """
+        memos = [facet.memo for facet in self.facets() if isinstance(facet, FormulaMatchFacet)]
+        return (sum(memo.lookups for memo in memos),
+                sum(memo.evaluations for memo in memos))
+
+    def read_plan(self, positions=None):
+        """
+        Build the ``ReadPlan`` covering every cell the rubric's facets read, or only the
+        facets at ``positions`` (indexes in facet order).
+        """
+        plan = ReadPlan()
+        for position, facet in enumerate(self.facets()):
+            if positions is None or position in positions:
+                facet.add_to_plan(plan)
+        return plan
+
+    def expected_values(self, master):
+        """
+        Return the master workbook's value for every facet, in facet order.
+
+        Computed once per batch so that workers grading submissions never need the master.
+        """
+        if master is None:
+            return None
+        return [facet.get_provided_value(master) for facet in self.facets()]
+
+    def grade(self, workbook, expected=None, positions=None, timeouts=None):
+        """
+        Grade a parsed submission.
+
+        Args:
+            workbook: The submission ``Workbook``
+            expected: The master workbook's values, from ``expected_values``
+            positions: Grade only the facets at these indexes (in facet order); the result
+                then has their responses only, and ``score`` is their total
+            timeouts: A ``Counter`` of timed-out searches by facet index, shared by the
+                submissions of one grading run; a facet that reaches
+                ``REGEX_TIMEOUT_LIMIT`` stops searching for the rest of the run
+
+        Returns:
+            dict: ``score``, ``max_score`` and the per-facet ``responses``. A response's
+            ``outcome`` is ``timeout`` if its regex search exceeded the time budget.
+        """
+        targets = self.formula_list_targets
+        if positions is not None:
+            targets = [facet.target.key for position, facet in enumerate(self.facets())
+                       if position in positions and isinstance(facet, FormulaListFacet)]
+        if targets:
+            # One traversal of the precedent graph answers every formula-list facet.
+            workbook.precedent_graph().resolve(targets)
+        responses = []
+        position = -1
+        for question_index, question in enumerate(self.questions):
+            for facet_index, facet in enumerate(question.facets):
+                position += 1
+                if positions is not None and position not in positions:
+                    continue
+                try:
+                    if timeouts is not None and timeouts[position] >= REGEX_TIMEOUT_LIMIT:
+                        score = facet.evaluate_score(workbook, search=False)
+                    else:
+                        score = facet.evaluate_score(workbook)
+                    outcome = OUTCOME_GRADED
+                except RegexTimeout:
+                    score, outcome = 0, OUTCOME_TIMEOUT
+                    if timeouts is not None:
+                        timeouts[position] += 1
+                responses.append({
+                    'question': question_index,
+                    'facet': facet_index,
+                    'type': facet.type,
+                    'name': facet.name,
+                    'score': score,
+                    'outcome': outcome,
+                    'max_score': facet.get_max_score(),
+                    'provided_value': facet.get_provided_value(workbook),
+                    'expected_value': expected[position] if expected else None,
+                })
+        return {
+            'score': sum(response['score'] for response in responses),
+            'max_score': self.get_max_score(),
+            'responses': responses,
+        }
+
+
+def rubric_counts(questions):
+    """
+    Count the questions, facets and invalid facets of ``Assignment.questions``, where a
+    facet is invalid if the rubric editor would flag it (``Facet.is_valid``). Facets are
+    checked on their JSON alone, without being built.
+    """
+    if not isinstance(questions, list):
+        return 0, 0, 0
+    facet_count = invalid = 0
+    for question in questions:
+        facets = question.get('facets') if isinstance(question, dict) else None
+        if not isinstance(facets, list):
+            continue
+        for data in facets:
+            facet_count += 1
+            facet_type = FACET_TYPES.get(data.get('type')) if isinstance(data, dict) else None
+            if facet_type is None or not facet_type.is_valid(data):
+                invalid += 1
+    return len(questions), facet_count, invalid
+
+
+def rubric_key(assignment):
+    """Identify a revision of an assignment's rubric."""
+    updated_at = assignment.updated_at
+    return f'{assignment.pk}:{updated_at.isoformat() if updated_at else ""}'
+
+
+def grade_file(rubric, source, file_name, expected=None, plan=None, timeouts=None):
+    """
+    Read and grade a single submission file. The result carries the file's document
+    properties as ``metadata`` for the gradebook export; ``timeouts`` is passed on to
+    ``Rubric.grade``.
+
+    Only the cells in ``plan`` (by default the rubric's own ``read_plan``) are read; the
+    result's ``bytes_skipped`` is the size of the worksheets that were never decompressed.
+    Unreadable files produce an ``error`` entry instead of raising, so one corrupt upload
+    does not fail the rest of a batch.
+    """
+    try:
+        workbook = load_workbook(source, plan or rubric.read_plan())
+    except WorkbookError as exc:
+        return {'file_name': file_name, 'error': str(exc)}
+    return {'file_name': file_name, **rubric.grade(workbook, expected, timeouts=timeouts),
+            'metadata': workbook.properties.as_dict() if workbook.properties else {},
+            'bytes_skipped': workbook.bytes_skipped}
+
+
+def load_master(assignment, plan=None):
+    """Load an assignment's master workbook, or None if it is encrypted or unreadable."""
+    if assignment.encrypted or not assignment.file:
+        return None
+    try:
+        with open_stored(assignment.file) as source:
+            return load_workbook(source, plan)
+    except (WorkbookError, OSError):
+        return None
@@ -0,0 +1,23 @@
+"""
+Exceptions raised by the server-side grading engine.
+"""
+
+
+class GradingError(Exception):
+    """Base class for all grading engine errors."""
+
+
+class RubricError(GradingError):
+    """Raised when the facet JSON stored in ``Assignment.questions`` cannot be graded."""
+
+
+class WorkbookError(GradingError):
+    """Raised when a submission is not a readable xlsx workbook."""
+
+
+class ArchiveError(GradingError):
+    """Raised when a zip of submissions is unreadable or exceeds the configured size limits."""
+
+
+class RegexTimeout(GradingError):
+    """Raised when a Formula Regex search exceeds ``GRADING_REGEX_TIMEOUT`` seconds."""
@@ -0,0 +1,197 @@
+"""
+Process-pool execution for batch grading.
+
+Submissions are fanned out to a long-lived pool of worker processes in chunks of
+``GRADING_CHUNK_SIZE``. Each worker keeps the rubrics it has recently graded compiled
+(``compiler.compile_rubric``, keyed by ``rubric_key``), so the ``questions`` JSON is only
+analysed once per worker rather than once per file.
+"""
+import io
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .cache import submission_digest
+from .compiler import compile_rubric
+from .engine import grade_file
+from .mapped import open_mapped
+
+# Chunks queued per worker before reading more submissions waits on a result.
+MAX_PENDING_CHUNKS_PER_WORKER = 2
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _grade_chunk(key, questions, expected, chunk, timeouts=None):
+    """
+    Worker entry point: grade ``(index, file_name, source)`` items with a compiled rubric.
+
+    ``timeouts`` counts timed-out regex searches for ``Rubric.grade``; a pool worker counts
+    them per chunk, as a chunk is all it sees of a batch. Returns the ``(index, result)``
+    pairs and the formula lookups and evaluations (``Rubric.formula_stats``) they took.
+    """
+    compiled = compile_rubric(key, questions)
+    timeouts = Counter() if timeouts is None else timeouts
+    lookups, evaluations = compiled.rubric.formula_stats()
+    results = []
+    for index, file_name, source in chunk:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            result = grade_file(compiled.rubric, io.BytesIO(source), file_name, expected,
+                                compiled.plan, timeouts)
+        else:
+            # File paths are read through a mapping rather than copied into memory.
+            try:
+                with open_mapped(source) as mapped:
+                    result = grade_file(compiled.rubric, mapped, file_name, expected,
+                                        compiled.plan, timeouts)
+            except OSError:
+                result = {'file_name': file_name, 'error': 'Submission file is missing'}
+        results.append((index, result))
+    after = compiled.rubric.formula_stats()
+    return results, after[0] - lookups, after[1] - evaluations
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # Workers never touch the database, but spawning keeps them from inheriting the
+            # parent's connections and locks.
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the worker pool; the next batch starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _chunked(submissions, chunk_size):
+    chunk = []
+    for index, (name, source, *_) in enumerate(submissions):
+        chunk.append((index, name, source))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _chunk_results(future, chunk, stats):
+    try:
+        results, lookups, evaluations = future.result()
+    except BrokenProcessPool:
+        shutdown_pool()
+        return [(index, {'file_name': name, 'error': 'Grading worker crashed'})
+                for index, name, _ in chunk]
+    _count(stats, lookups, evaluations)
+    return results
+
+
+def _count(stats, lookups, evaluations):
+    if stats is not None:
+        stats['lookups'] += lookups
+        stats['evaluations'] += evaluations
+
+
+def grade_many(key, questions, submissions, expected=None, workers=None, chunk_size=None,
+               cache=None, stats=None):
+    """
+    Grade many submissions, yielding ``(index, result)`` pairs in completion order.
+
+    ``submissions`` is consumed lazily: each chunk is handed to a worker as soon as it is
+    full, at most ``MAX_PENDING_CHUNKS_PER_WORKER`` chunks per worker are in flight, and
+    results are yielded while later submissions are still being read. With a
+    ``ResultCache``, cached submissions are not read at all and a file repeated within the
+    batch is graded once.
+
+    Args:
+        key: The rubric revision, from ``rubric_key``
+        questions: The assignment's ``questions`` JSON
+        submissions: ``(file_name, source)`` pairs; sources are bytes or file paths, which
+            are memory-mapped rather than read. A ``(file_name, source, digest)`` triple
+            gives the source's ``submission_digest``, which the cache then does not compute
+        expected: The master workbook's values, from ``Rubric.expected_values``
+        workers: Worker processes (default ``GRADING_WORKERS``); 1 or fewer grades in-process
+        chunk_size: Submissions per task (default ``GRADING_CHUNK_SIZE``)
+        cache: A ``ResultCache`` for the rubric, updated with hits, misses and new results
+        stats: A ``Counter`` to add the formula ``lookups`` and ``evaluations`` of the
+            graded submissions to, wherever they were graded
+    """
+    if cache is not None:
+        yield from _grade_cached(key, questions, submissions, expected, workers, chunk_size,
+                                 cache, stats)
+        return
+    workers = settings.GRADING_WORKERS if workers is None else workers
+    chunk_size = max(1, settings.GRADING_CHUNK_SIZE if chunk_size is None else chunk_size)
+    chunks = _chunked(submissions, chunk_size)
+
+    if workers <= 1:
+        # Regex timeouts count for the whole call, not against later calls.
+        timeouts = Counter()
+        for chunk in chunks:
+            results, lookups, evaluations = _grade_chunk(key, questions, expected, chunk,
+                                                         timeouts)
+            _count(stats, lookups, evaluations)
+            yield from results
+        return
+
+    pool = _get_pool(workers)
+    futures = {}
+    for chunk in chunks:
+        futures[pool.submit(_grade_chunk, key, questions, expected, chunk)] = chunk
+        if len(futures) >= workers * MAX_PENDING_CHUNKS_PER_WORKER:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in futures if future.done()]
+        for future in done:
+            yield from _chunk_results(future, futures.pop(future), stats)
+    for future in as_completed(futures):
+        yield from _chunk_results(future, futures[future], stats)
+
+
+def _grade_cached(key, questions, submissions, expected, workers, chunk_size, cache, stats):
+    # Hits found while the miss stream is being consumed are parked in ``ready`` and
+    # yielded alongside the graded results.
+    ready, pending, waiting = [], [], {}
+
+    def misses():
+        for index, (name, source, *digest) in enumerate(submissions):
+            digest = digest[0] if digest else submission_digest(source)
+            if digest in waiting:
+                cache.hits += 1
+                waiting[digest].append((index, name))
+                continue
+            value = cache.get(digest)
+            if value is not None:
+                cache.hits += 1
+                ready.append((index, cache.restore(value, name, expected)))
+                continue
+            cache.misses += 1
+            waiting[digest] = [(index, name)]
+            pending.append(digest)
+            yield name, source
+
+    for position, result in grade_many(key, questions, misses(), expected, workers,
+                                       chunk_size, stats=stats):
+        hits, ready[:] = ready[:], []
+        yield from hits
+        digest = pending[position]
+        cache.set(digest, result)
+        for index, name in waiting.pop(digest):
+            yield index, {**result, 'file_name': name}
+    yield from ready
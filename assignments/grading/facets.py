@@ -0,0 +1,408 @@
+"""
+Server-side implementations of the six facet types.
+
+Each class mirrors the ``evaluateScore`` of its Angular counterpart in
+``public/src/app/models/question/facet/types`` and reads the same JSON that
+``getSerializable`` stores in ``Assignment.questions``.
+"""
+import math
+import re
+
+from .exceptions import RegexTimeout, RubricError
+from .patterns import BoundedPattern
+from .references import parse_cell, strip_function_prefixes
+from .workbook import js_length, js_string, js_to_number, safe_value
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Same limit the ``safe-regex`` package uses in the browser.
+REGEX_REPETITION_LIMIT = 25
+
+# Distinct formulas whose outcome each formula-matching facet remembers.
+FORMULA_MEMO_SIZE = 4096
+
+# Timed-out searches after which a Formula Regex facet stops running its pattern for the
+# rest of a grading run (``Rubric.grade``'s ``timeouts``) and reports every formula it has
+# not already matched as timed out.
+REGEX_TIMEOUT_LIMIT = 3
+
+_NAMED_GROUP_PATTERN = re.compile(r'(?<!\\)\(\?<(?![=!])')
+_NAMED_BACKREFERENCE_PATTERN = re.compile(r'\\k<([A-Za-z_][A-Za-z0-9_]*)>')
+_QUOTED_SECTION_PATTERN = re.compile(r'"([^"]*")')
+
+
+def _number(value):
+    """Convert a JSON number (or numeric string) to an int when it is integral."""
+    number = js_to_number(value)
+    if math.isnan(number) or math.isinf(number):
+        return number
+    return int(number) if number.is_integer() else number
+
+
+def _length(value):
+    """Parse an optional length bound; unset and non-numeric bounds count as unset (falsy)."""
+    if value is None:
+        return None
+    number = _number(value)
+    return None if math.isnan(number) else number
+
+
+class TargetCell:
+    """The ``ICellAddress`` a facet grades: sheet name plus 1-based row and column."""
+
+    __slots__ = ('sheet_name', 'address', 'row', 'col')
+
+    def __init__(self, sheet_name, address, row, col):
+        self.sheet_name = sheet_name
+        self.address = address
+        self.row = row
+        self.col = col
+
+    @classmethod
+    def from_json(cls, data):
+        if not isinstance(data, dict) or not data.get('sheetName'):
+            raise RubricError('Target cell not set')
+        row, col = data.get('row'), data.get('col')
+        if not isinstance(row, int) or not isinstance(col, int):
+            position = parse_cell(str(data.get('address', '')))
+            if position is None:
+                raise RubricError('Target cell not set')
+            row, col = position
+        return cls(data['sheetName'], data.get('address'), row, col)
+
+    @property
+    def key(self):
+        return self.sheet_name, self.row, self.col
+
+
+class Facet:
+    """Base class for server-side facets."""
+
+    type = None
+    default_name = None
+
+    def __init__(self, data):
+        self.name = data.get('name') or self.default_name
+        points = data.get('points')
+        self.points = 1 if points is None else _number(points)
+        if math.isnan(self.points):
+            raise RubricError(f'{self.name}: points must be a number')
+        self.target = TargetCell.from_json(data.get('targetCell'))
+
+    @classmethod
+    def is_valid(cls, data):
+        """
+        Whether the rubric editor counts serialized ``data`` as complete: the facet's
+        ``isValid``, on the JSON alone. Points never fail it there, as the Angular facet
+        coerces them to a number, and targets are only checked for being set.
+        """
+        return data.get('targetCell') is not None
+
+    def evaluate_score(self, workbook):
+        raise NotImplementedError
+
+    def add_to_plan(self, plan):
+        """Register the cells this facet reads with a ``ReadPlan``."""
+        plan.add_cell(*self.target.key)
+
+    def get_max_score(self):
+        return self.points
+
+    def get_target_cell(self, workbook):
+        return workbook.calculate_cell(*self.target.key)
+
+    def get_provided_value(self, workbook):
+        cell = self.get_target_cell(workbook)
+        if cell is None:
+            return None
+        return safe_value(cell)
+
+    def get_target_formula(self, workbook):
+        """Return the target cell's formula with Excel's function prefixes stripped."""
+        cell = self.get_target_cell(workbook)
+        if cell is None or not cell.formula:
+            return None
+        return strip_function_prefixes(cell.formula)
+
+
+class ValueFacet(Facet):
+    type = 'ValueFacet'
+    default_name = 'Value Equals'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.value = data.get('value')
+        self.expected = None if self.value is None else js_string(self.value)
+
+    @classmethod
+    def is_valid(cls, data):
+        return super().is_valid(data) and data.get('value') is not None
+
+    def evaluate_score(self, workbook):
+        cell = self.get_target_cell(workbook)
+        if cell is None or self.expected is None:
+            return 0
+        return self.points if safe_value(cell) == self.expected else 0
+
+
+class ValueRangeFacet(Facet):
+    type = 'ValueRangeFacet'
+    default_name = 'Value Range'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.lower_bounds = data.get('lowerBounds')
+        self.upper_bounds = data.get('upperBounds')
+        for bound in (self.lower_bounds, self.upper_bounds):
+            if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+                raise RubricError(f'{self.name}: boundaries not set')
+
+    @classmethod
+    def is_valid(cls, data):
+        return (super().is_valid(data) and data.get('lowerBounds') is not None
+                and data.get('upperBounds') is not None)
+
+    def evaluate_score(self, workbook):
+        cell = self.get_target_cell(workbook)
+        if cell is None:
+            return 0
+        value = js_to_number(safe_value(cell))
+        if math.isnan(value):
+            return 0
+        return self.points if self.lower_bounds <= value <= self.upper_bounds else 0
+
+
+class ValueLengthFacet(Facet):
+    type = 'ValueLengthFacet'
+    default_name = 'Value Length'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.min_length = _length(data.get('minLength'))
+        self.max_length = _length(data.get('maxLength'))
+        if not self.min_length and not self.max_length:
+            raise RubricError(f'{self.name}: at least one of min or max length must be set')
+        if self.min_length and self.max_length and self.max_length < self.min_length:
+            raise RubricError(f'{self.name}: max length less than min')
+
+    @classmethod
+    def is_valid(cls, data):
+        return super().is_valid(data) and (data.get('minLength') is not None
+                                           or data.get('maxLength') is not None)
+
+    def evaluate_score(self, workbook):
+        cell = self.get_target_cell(workbook)
+        if cell is None:
+            return 0
+        length = js_length(safe_value(cell))
+        if self.min_length and length < self.min_length:
+            return 0
+        if self.max_length and length > self.max_length:
+            return 0
+        return self.points
+
+
+class FormulaMemo:
+    """
+    The outcomes of one formula-matching facet, by the formula text it was given.
+
+    Most of a class writes the same few formulas in a graded cell, so a facet compiled once
+    per rubric revision (``compile_rubric``) matches each distinct formula once for a whole
+    job. ``lookups`` and ``evaluations`` count the formulas graded and actually matched.
+    """
+
+    __slots__ = ('outcomes', 'lookups', 'evaluations')
+
+    def __init__(self):
+        self.outcomes = {}
+        self.lookups = 0
+        self.evaluations = 0
+
+    def outcome(self, formula, match=None):
+        """
+        Return ``match(formula)``, calling it only for a formula not seen before.
+
+        A ``RegexTimeout`` is not remembered: how long a search takes depends on the load
+        of the machine, so the next submission with the formula searches again. Without
+        ``match``, a formula not seen before raises ``RegexTimeout``.
+        """
+        self.lookups += 1
+        outcome = self.outcomes.get(formula)
+        if outcome is None:
+            if match is None:
+                raise RegexTimeout
+            self.evaluations += 1
+            outcome = bool(match(formula))
+            if len(self.outcomes) < FORMULA_MEMO_SIZE:
+                self.outcomes[formula] = outcome
+        return outcome
+
+
+class FormulaMatchFacet(Facet):
+    """
+    Base class for facets graded on the target cell's formula text alone.
+
+    The score depends on nothing but that text (with Excel's function prefixes stripped),
+    so outcomes are memoized on it. ``$``, case and whitespace are kept: the browser
+    grader matches them literally, and two formulas differing only there can score
+    differently.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.memo = FormulaMemo()
+
+    def matches(self, formula):
+        raise NotImplementedError
+
+    def evaluate_score(self, workbook, search=True):
+        """
+        Score the target cell's formula; with ``search`` False, only from the memo, raising
+        ``RegexTimeout`` for a formula not matched before.
+        """
+        formula = self.get_target_formula(workbook)
+        if formula is None:
+            return 0
+        outcome = self.memo.outcome(formula, self.matches if search else None)
+        return self.points if outcome else 0
+
+
+class FormulaContainsFacet(FormulaMatchFacet):
+    type = 'FormulaContainsFacet'
+    default_name = 'Formula Contains'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.formula = data.get('formula')
+        if not self.formula:
+            raise RubricError(f'{self.name}: formula not set')
+        self.needle = _QUOTED_SECTION_PATTERN.sub('', str(self.formula))
+
+    @classmethod
+    def is_valid(cls, data):
+        return super().is_valid(data) and data.get('formula') is not None
+
+    def matches(self, formula):
+        return self.needle in formula
+
+
+def _walk_pattern(pattern, star_height, counter):
+    """Check a parsed pattern against the ``safe-regex`` heuristics."""
+    for op, av in pattern:
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                  getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            counter[0] += 1
+            height = star_height + (1 if av[1] == sre_parse.MAXREPEAT else 0)
+            if height > 1 or counter[0] > REGEX_REPETITION_LIMIT:
+                return False
+            if not _walk_pattern(av[2], height, counter):
+                return False
+            continue
+        for child in (av if isinstance(av, (list, tuple)) else (av,)):
+            children = child if isinstance(child, list) else [child]
+            for item in children:
+                if isinstance(item, sre_parse.SubPattern) and not _walk_pattern(
+                        item, star_height, counter):
+                    return False
+    return True
+
+
+def is_safe_pattern(expression):
+    """
+    Port of the ``safe-regex`` heuristics used by the browser grader: reject patterns with
+    nested unbounded repetition (star height > 1) or more than 25 repetitions.
+    """
+    try:
+        parsed = sre_parse.parse(expression)
+    except (re.error, RecursionError):
+        return False
+    return _walk_pattern(parsed, 0, [0])
+
+
+def js_regex_source(expression):
+    """Translate a JavaScript regular expression's named groups to Python's syntax."""
+    expression = _NAMED_GROUP_PATTERN.sub('(?P<', expression)
+    return _NAMED_BACKREFERENCE_PATTERN.sub(r'(?P=\1)', expression)
+
+
+def compile_js_regex(expression):
+    """Compile a JavaScript regular expression with Python's ``re``."""
+    return re.compile(js_regex_source(expression), re.ASCII)
+
+
+class FormulaRegexFacet(FormulaMatchFacet):
+    type = 'FormulaRegexFacet'
+    default_name = 'Formula Regex'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.expression = data.get('expression')
+        if not self.expression:
+            raise RubricError(f'{self.name}: expression not set')
+        try:
+            self.pattern = compile_js_regex(str(self.expression))
+        except (re.error, RecursionError) as exc:
+            raise RubricError(f'{self.name}: error parsing regex') from exc
+        if not is_safe_pattern(self.pattern.pattern):
+            raise RubricError(f'{self.name}: regex pattern is potentially unsafe')
+        self.matcher = BoundedPattern(self.pattern)
+
+    @classmethod
+    def is_valid(cls, data):
+        # Parsed, not compiled: ``is_safe_pattern`` rejects patterns that do not parse.
+        expression = data.get('expression')
+        return (super().is_valid(data) and bool(expression)
+                and is_safe_pattern(js_regex_source(str(expression))))
+
+    def matches(self, formula):
+        return self.matcher.search(formula)
+
+
+class FormulaListFacet(Facet):
+    type = 'FormulaListFacet'
+    default_name = 'Formula List'
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.formulas = data.get('formulas')
+        if self.formulas is None:
+            raise RubricError(f'{self.name}: formulas not set')
+        self.formulas = tuple(str(formula) for formula in self.formulas)
+
+    @classmethod
+    def is_valid(cls, data):
+        formulas = data.get('formulas')
+        return (super().is_valid(data) and isinstance(formulas, (list, str))
+                and len(formulas) > 0)
+
+    def add_to_plan(self, plan):
+        super().add_to_plan(plan)
+        plan.keep_formulas()
+
+    def evaluate_score(self, workbook):
+        cell = self.get_target_cell(workbook)
+        if cell is None or cell.formula is None:
+            return 0
+        functions = workbook.precedent_graph().transitive_functions(self.target.key)
+        return self.points if all(name in functions for name in self.formulas) else 0
+
+
+FACET_TYPES = {
+    facet.type: facet for facet in (
+        ValueFacet, ValueRangeFacet, ValueLengthFacet,
+        FormulaContainsFacet, FormulaRegexFacet, FormulaListFacet,
+    )
+}
+
+
+def build_facet(data):
+    """Instantiate the facet class matching a serialized facet's ``type``."""
+    if not isinstance(data, dict):
+        raise RubricError('Facets must be objects')
+    facet_class = FACET_TYPES.get(data.get('type'))
+    if facet_class is None:
+        raise RubricError(f'Unknown facet type: {data.get("type")}')
+    return facet_class(data)
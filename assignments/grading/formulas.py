@@ -0,0 +1,1172 @@
+"""
+Formula evaluation for cells saved without a cached value.
+
+Excel stores the last result of every formula in the cell's ``<v>`` and the value facets
+compare against it. Workbooks saved by LibreOffice, generated by scripts or saved with
+manual calculation often carry no result at all, so ``FormulaEvaluator`` computes those
+cells on demand. Only the uncached cells a target depends on are evaluated, in dependency
+order, and each result is written back into its ``Cell`` so it is computed once. Range
+arguments are read through the sheet's sparse index and aggregated as NumPy arrays.
+
+A formula using syntax or a function outside ``FUNCTIONS`` is left unevaluated, as are the
+cells that depend on it, so those cells keep the browser grader's fallback to the formula
+text rather than getting a wrong value.
+"""
+import math
+import re
+from datetime import datetime
+from decimal import ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+import numpy as np
+
+from .references import (
+    MAX_COL, MAX_ROW, Reference, column_index, strip_function_prefixes, unquote_sheet_name,
+)
+from .workbook import BOOLEAN, DATE, ERROR, NULL, NUMBER, STRING
+
+_EPOCH = datetime(1899, 12, 30)
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A))
+  | (?P<reference>
+        (?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z_][A-Za-z0-9_.]*)!)?
+        (?:
+            (?P<cells>\$?[A-Za-z]{1,3}\$?[0-9]+(?::\$?[A-Za-z]{1,3}\$?[0-9]+)?)
+          | (?P<cols>\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3})
+          | (?P<rows>\$?[0-9]+:\$?[0-9]+)
+        )
+        (?![A-Za-z0-9_.(!])
+    )
+  | (?P<number>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+  | (?P<function>[A-Za-z_][A-Za-z0-9_.]*(?=\())
+  | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+  | (?P<operator><>|<=|>=|[-+*/^&=<>%(),])
+""", re.VERBOSE)
+
+_CELL_PATTERN = re.compile(r'\$?([A-Za-z]{1,3})\$?([0-9]+)')
+_CRITERION_PATTERN = re.compile(r'(<=|>=|<>|<|>|=)?(.*)', re.DOTALL)
+
+_COMPARISONS = {
+    '=': lambda order: order == 0,
+    '<>': lambda order: order != 0,
+    '<': lambda order: order < 0,
+    '>': lambda order: order > 0,
+    '<=': lambda order: order <= 0,
+    '>=': lambda order: order >= 0,
+}
+
+
+class ExcelError(Exception):
+    """An Excel error value such as ``#DIV/0!``; raised to propagate, stored as a value."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+
+NULL_ERROR = '#NULL!'
+DIV_ERROR = '#DIV/0!'
+VALUE_ERROR = '#VALUE!'
+REF_ERROR = '#REF!'
+NUM_ERROR = '#NUM!'
+NA_ERROR = '#N/A'
+
+
+class Unsupported(Exception):
+    """Raised for syntax or functions the evaluator does not implement."""
+
+
+# =============================================================================
+# Parsing
+# =============================================================================
+
+def _reference(match):
+    sheet = match.group('sheet')
+    sheet = unquote_sheet_name(sheet) if sheet else None
+    if match.group('cells'):
+        corners = [(int(row), column_index(letters))
+                   for letters, row in _CELL_PATTERN.findall(match.group('cells'))]
+        (first_row, first_col), (last_row, last_col) = corners[0], corners[-1]
+        return Reference(sheet, min(first_row, last_row), min(first_col, last_col),
+                         max(first_row, last_row), max(first_col, last_col))
+    if match.group('cols'):
+        first, last = (column_index(part.strip('$')) for part in match.group('cols').split(':'))
+        return Reference(sheet, None, min(first, last), None, max(first, last))
+    first, last = (int(part.strip('$')) for part in match.group('rows').split(':'))
+    return Reference(sheet, min(first, last), None, max(first, last), None)
+
+
+def tokenize(formula):
+    """Split a formula (without its leading ``=``) into ``(kind, value)`` tokens."""
+    tokens, position = [], 0
+    while position < len(formula):
+        match = _TOKEN_PATTERN.match(formula, position)
+        if match is None:
+            raise Unsupported(f'Unexpected character: {formula[position]!r}')
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ('sheet', 'cells', 'cols', 'rows'):
+            kind = 'reference'
+        if kind == 'space':
+            continue
+        if kind == 'string':
+            tokens.append(('string', match.group()[1:-1].replace('""', '"')))
+        elif kind == 'reference':
+            tokens.append(('reference', _reference(match)))
+        elif kind == 'number':
+            tokens.append(('number', float(match.group())))
+        elif kind == 'function':
+            tokens.append((kind, strip_function_prefixes(match.group()).upper()))
+        elif kind == 'name':
+            tokens.append((kind, match.group().upper()))
+        else:
+            tokens.append((kind, match.group()))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over Excel's operator precedence, lowest first: comparisons, ``&``,
+    ``+ -``, ``* /``, ``^``, then unary minus and ``%``.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        if self.next() != ('operator', value):
+            raise Unsupported(f'Expected {value!r}')
+
+    def parse(self):
+        node = self.comparison()
+        if self.position != len(self.tokens):
+            raise Unsupported('Unexpected trailing tokens')
+        return node
+
+    def _binary(self, operators, operand):
+        node = operand()
+        while self.peek()[0] == 'operator' and self.peek()[1] in operators:
+            operator = self.next()[1]
+            node = ('operator', operator, node, operand())
+        return node
+
+    def comparison(self):
+        return self._binary(_COMPARISONS, self.concatenation)
+
+    def concatenation(self):
+        return self._binary(('&',), self.additive)
+
+    def additive(self):
+        return self._binary(('+', '-'), self.multiplicative)
+
+    def multiplicative(self):
+        return self._binary(('*', '/'), self.power)
+
+    def power(self):
+        return self._binary(('^',), self.unary)
+
+    def unary(self):
+        if self.peek() == ('operator', '-'):
+            self.next()
+            return ('negate', self.unary())
+        if self.peek() == ('operator', '+'):
+            self.next()
+            return self.unary()
+        node = self.primary()
+        while self.peek() == ('operator', '%'):
+            self.next()
+            node = ('percent', node)
+        return node
+
+    def primary(self):
+        kind, value = self.next()
+        if kind in ('number', 'string', 'reference'):
+            return (kind, value)
+        if kind == 'error':
+            return ('error', value)
+        if kind == 'name' and value in ('TRUE', 'FALSE'):
+            return ('boolean', value == 'TRUE')
+        if kind == 'function':
+            return self.call(value)
+        if (kind, value) == ('operator', '('):
+            node = self.comparison()
+            self.expect(')')
+            return node
+        raise Unsupported(f'Unsupported token: {value!r}')
+
+    def call(self, name):
+        self.expect('(')
+        arguments = []
+        if self.peek() == ('operator', ')'):
+            self.next()
+            return ('call', name, arguments)
+        while True:
+            if self.peek() in (('operator', ','), ('operator', ')')):
+                arguments.append(('missing',))
+            else:
+                arguments.append(self.comparison())
+            kind, value = self.next()
+            if (kind, value) == ('operator', ')'):
+                return ('call', name, arguments)
+            if (kind, value) != ('operator', ','):
+                raise Unsupported('Expected "," or ")"')
+
+
+@lru_cache(maxsize=4096)
+def parse_formula(formula):
+    """Parse a formula into a tuple tree, or return None if it cannot be evaluated."""
+    try:
+        return _Parser(tokenize(formula.lstrip('='))).parse()
+    except (Unsupported, RecursionError):
+        return None
+
+
+# =============================================================================
+# Values
+# =============================================================================
+
+class RangeValue:
+    """
+    The populated cells of a range argument, keyed by 0-based position within the range.
+
+    Blank cells are absent. ``numbers`` returns the numeric cells as a NumPy array for the
+    aggregate functions.
+    """
+
+    __slots__ = ('rows', 'cols', 'cells', '_numbers', '_lines')
+
+    def __init__(self, rows, cols, cells):
+        self.rows = rows
+        self.cols = cols
+        self.cells = cells
+        self._numbers = None
+        self._lines = {}
+
+    def get(self, row, col):
+        return self.cells.get((row, col))
+
+    def values(self):
+        return self.cells.values()
+
+    def numbers(self):
+        """Return the numeric cells as a float array, raising the first error cell."""
+        if self._numbers is None:
+            for value in self.cells.values():
+                if isinstance(value, ExcelError):
+                    raise value
+            self._numbers = np.fromiter(
+                (value for value in self.cells.values() if type(value) is float), float)
+        return self._numbers
+
+    def line(self, axis, index):
+        """Return the populated ``(position, value)`` pairs of one column (axis 0) or row."""
+        key = (axis, index)
+        line = self._lines.get(key)
+        if line is None:
+            if axis == 0:
+                line = sorted((row, value) for (row, col), value in self.cells.items()
+                              if col == index)
+            else:
+                line = sorted((col, value) for (row, col), value in self.cells.items()
+                              if row == index)
+            self._lines[key] = line
+        return line
+
+    def vector(self):
+        """The populated pairs of a single row or column range."""
+        if self.cols == 1:
+            return self.line(0, 0)
+        if self.rows == 1:
+            return self.line(1, 0)
+        raise ExcelError(NA_ERROR)
+
+    def dense(self, rows, cols):
+        """Return the top-left ``rows x cols`` block as a float array, non-numbers as 0."""
+        array = np.zeros((rows, cols))
+        for (row, col), value in self.cells.items():
+            if isinstance(value, ExcelError):
+                raise value
+            if type(value) is float and row < rows and col < cols:
+                array[row, col] = value
+        return array
+
+
+def _scalar(value):
+    """Reduce a single-cell range to its value, raising error values."""
+    if isinstance(value, RangeValue):
+        if value.rows != 1 or value.cols != 1:
+            # Implicit intersection and array formulas are not implemented.
+            raise Unsupported('Range used as a single value')
+        value = value.get(0, 0)
+    if isinstance(value, ExcelError):
+        raise value
+    return value
+
+
+def _peek(value):
+    """Like ``_scalar``, but return error values instead of raising them."""
+    try:
+        return _scalar(value)
+    except ExcelError as error:
+        return error
+
+
+def to_number(value):
+    value = _scalar(value)
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, float):
+        return value
+    try:
+        return float(value.strip())
+    except ValueError:
+        raise ExcelError(VALUE_ERROR)
+
+
+def to_integer(value):
+    return int(to_number(value))
+
+
+def number_text(number):
+    """Format a number as Excel's General format does, to 15 significant digits."""
+    if number.is_integer() and abs(number) < 1e15:
+        return str(int(number))
+    text = f'{number:.15g}'
+    if 'e' in text:
+        mantissa, exponent = text.split('e')
+        return f'{mantissa}E{int(exponent):+03d}'
+    return text
+
+
+def to_text(value):
+    value = _scalar(value)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return number_text(value)
+    return value
+
+
+def to_boolean(value):
+    value = _scalar(value)
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        return value != 0
+    if value.upper() in ('TRUE', 'FALSE'):
+        return value.upper() == 'TRUE'
+    raise ExcelError(VALUE_ERROR)
+
+
+def _rank(value):
+    if isinstance(value, bool):
+        return 2
+    return 1 if isinstance(value, str) else 0
+
+
+def compare(left, right):
+    """Order two scalars as Excel does: numbers < text < booleans, text case-insensitive."""
+    if left is None:
+        left = right.__class__() if right is not None else 0.0
+    if right is None:
+        right = left.__class__()
+    if _rank(left) != _rank(right):
+        return -1 if _rank(left) < _rank(right) else 1
+    if isinstance(left, str):
+        left, right = left.casefold(), right.casefold()
+    return (left > right) - (left < right)
+
+
+def _finite(number):
+    if math.isnan(number) or math.isinf(number):
+        raise ExcelError(NUM_ERROR)
+    return number
+
+
+def _divide(left, right):
+    if right == 0:
+        raise ExcelError(DIV_ERROR)
+    return left / right
+
+
+def _power(left, right):
+    if left == 0 and right < 0:
+        raise ExcelError(DIV_ERROR)
+    try:
+        result = left ** right
+    except OverflowError:
+        raise ExcelError(NUM_ERROR)
+    if isinstance(result, complex):
+        raise ExcelError(NUM_ERROR)
+    return result
+
+
+_ARITHMETIC = {
+    '+': lambda left, right: left + right,
+    '-': lambda left, right: left - right,
+    '*': lambda left, right: left * right,
+    '/': _divide,
+    '^': _power,
+}
+
+
+@lru_cache(maxsize=256)
+def _wildcard(pattern):
+    parts, escaped = [], False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '~':
+            escaped = True
+        elif char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _text_matches(pattern, text):
+    if any(char in pattern for char in '*?~'):
+        return _wildcard(pattern).fullmatch(text) is not None
+    return pattern.casefold() == text.casefold()
+
+
+def _lookup_equal(value, lookup):
+    if isinstance(lookup, str):
+        return isinstance(value, str) and _text_matches(lookup, value)
+    return _rank(value) == _rank(lookup) and value == lookup
+
+
+def _criterion(criterion):
+    """Build the predicate of a COUNTIF-style criterion such as ``">5"`` or ``"a*"``."""
+    criterion = _scalar(criterion)
+    operator = '='
+    if isinstance(criterion, str):
+        operator, operand = _CRITERION_PATTERN.fullmatch(criterion).groups()
+        operator = operator or '='
+        try:
+            criterion = float(operand)
+        except ValueError:
+            criterion = operand
+            if operand.upper() in ('TRUE', 'FALSE'):
+                criterion = operand.upper() == 'TRUE'
+    elif criterion is None:
+        criterion = 0.0
+    test = _COMPARISONS[operator]
+    if isinstance(criterion, str) and operator in ('=', '<>'):
+        if criterion == '':
+            def matches(value):
+                return (value is None or value == '') == (operator == '=')
+        else:
+            def matches(value):
+                found = isinstance(value, str) and _text_matches(criterion, value)
+                return found == (operator == '=')
+        return matches
+
+    def matches(value):
+        if value is None or isinstance(value, ExcelError) or _rank(value) != _rank(criterion):
+            return operator == '<>'
+        return test(compare(value, criterion))
+    return matches
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+def _numbers(arguments):
+    """Collect the numbers of aggregate arguments: numeric cells of ranges, coerced scalars."""
+    parts = []
+    for argument in arguments:
+        if isinstance(argument, RangeValue):
+            parts.append(argument.numbers())
+        elif argument is not None:
+            parts.append(np.array([to_number(argument)]))
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def _sum(*arguments):
+    return float(np.sum(_numbers(arguments)))
+
+
+def _average(*arguments):
+    numbers = _numbers(arguments)
+    if not len(numbers):
+        raise ExcelError(DIV_ERROR)
+    return float(np.mean(numbers))
+
+
+def _extreme(reduce):
+    def extreme(*arguments):
+        numbers = _numbers(arguments)
+        return float(reduce(numbers)) if len(numbers) else 0.0
+    return extreme
+
+
+def _product(*arguments):
+    numbers = _numbers(arguments)
+    return _finite(float(np.prod(numbers))) if len(numbers) else 0.0
+
+
+def _median(*arguments):
+    numbers = _numbers(arguments)
+    if not len(numbers):
+        raise ExcelError(NUM_ERROR)
+    return float(np.median(numbers))
+
+
+def _spread(reduce, ddof):
+    def spread(*arguments):
+        numbers = _numbers(arguments)
+        if len(numbers) <= ddof or not len(numbers):
+            raise ExcelError(DIV_ERROR)
+        return float(reduce(numbers, ddof=ddof))
+    return spread
+
+
+def _count(*arguments):
+    count = 0
+    for argument in arguments:
+        if isinstance(argument, RangeValue):
+            count += sum(1 for value in argument.values() if type(value) is float)
+        elif argument is not None and not isinstance(argument, ExcelError):
+            try:
+                to_number(argument)
+            except ExcelError:
+                continue
+            count += 1
+    return float(count)
+
+
+def _counta(*arguments):
+    count = 0
+    for argument in arguments:
+        if isinstance(argument, RangeValue):
+            count += len(argument.cells)
+        elif argument is not None:
+            count += 1
+    return float(count)
+
+
+def _countblank(area):
+    blank = sum(1 for value in area.values() if value == '')
+    return float(area.rows * area.cols - len(area.cells) + blank)
+
+
+def _sumproduct(*arrays):
+    for array in arrays:
+        if not isinstance(array, RangeValue):
+            raise Unsupported('SUMPRODUCT of scalars')
+        if (array.rows, array.cols) != (arrays[0].rows, arrays[0].cols):
+            raise ExcelError(VALUE_ERROR)
+    # Only the populated extent can contribute, so whole-column ranges stay small.
+    rows = max((row for array in arrays for row, _ in array.cells), default=-1) + 1
+    cols = max((col for array in arrays for _, col in array.cells), default=-1) + 1
+    product = np.ones((rows, cols))
+    for array in arrays:
+        product *= array.dense(rows, cols)
+    return float(np.sum(product))
+
+
+def _conditional(pairs, area=None):
+    """Positions of ``area`` (or of the ranges) where every ``(range, criterion)`` holds."""
+    predicates = []
+    for criteria_range, criterion in pairs:
+        if not isinstance(criteria_range, RangeValue):
+            raise ExcelError(VALUE_ERROR)
+        predicates.append((criteria_range, _criterion(criterion)))
+    positions = set()
+    for criteria_range, _ in predicates:
+        positions.update(criteria_range.cells)
+    if area is not None:
+        positions.update(area.cells)
+    matched = sorted(position for position in positions
+                     if all(matches(criteria_range.cells.get(position))
+                            for criteria_range, matches in predicates))
+    blanks_match = all(matches(None) for _, matches in predicates)
+    first = predicates[0][0]
+    unvisited = first.rows * first.cols - len(positions) if blanks_match else 0
+    return matched, unvisited
+
+
+def _pairs(arguments):
+    if len(arguments) % 2:
+        raise Unsupported('Criteria must come in pairs')
+    return list(zip(arguments[::2], arguments[1::2]))
+
+
+def _matched_numbers(area, positions):
+    return np.fromiter((value for value in (area.cells.get(position) for position in positions)
+                        if type(value) is float), float)
+
+
+def _countifs(*arguments):
+    matched, unvisited = _conditional(_pairs(arguments))
+    return float(len(matched) + unvisited)
+
+
+def _sumifs(area, *arguments):
+    matched, _ = _conditional(_pairs(arguments), area)
+    return float(np.sum(_matched_numbers(area, matched)))
+
+
+def _averageifs(area, *arguments):
+    matched, _ = _conditional(_pairs(arguments), area)
+    numbers = _matched_numbers(area, matched)
+    if not len(numbers):
+        raise ExcelError(DIV_ERROR)
+    return float(np.mean(numbers))
+
+
+def _countif(area, criterion):
+    return _countifs(area, criterion)
+
+
+def _sumif(area, criterion, sum_area=None):
+    return _sumifs(sum_area if sum_area is not None else area, area, criterion)
+
+
+def _averageif(area, criterion, average_area=None):
+    return _averageifs(average_area if average_area is not None else area, area, criterion)
+
+
+def _round_with(rounding):
+    def round_number(number, digits=None):
+        number, digits = to_number(number), to_integer(digits)
+        try:
+            quantum = Decimal(1).scaleb(-digits)
+            return float(Decimal(repr(number)).quantize(quantum, rounding=rounding))
+        except InvalidOperation:
+            return number
+    return round_number
+
+
+def _int(number):
+    return float(math.floor(to_number(number)))
+
+
+def _trunc(number, digits=None):
+    return _round_with(ROUND_DOWN)(number, digits)
+
+
+def _mod(number, divisor):
+    number, divisor = to_number(number), to_number(divisor)
+    if divisor == 0:
+        raise ExcelError(DIV_ERROR)
+    return number - divisor * math.floor(number / divisor)
+
+
+def _sqrt(number):
+    number = to_number(number)
+    if number < 0:
+        raise ExcelError(NUM_ERROR)
+    return math.sqrt(number)
+
+
+def _logarithm(number, base=None):
+    number = to_number(number)
+    base = 10.0 if base is None else to_number(base)
+    if number <= 0 or base <= 0:
+        raise ExcelError(NUM_ERROR)
+    if base == 1:
+        raise ExcelError(DIV_ERROR)
+    return math.log(number, base)
+
+
+def _ln(number):
+    number = to_number(number)
+    if number <= 0:
+        raise ExcelError(NUM_ERROR)
+    return math.log(number)
+
+
+def _unary(function):
+    def apply(number):
+        try:
+            return _finite(float(function(to_number(number))))
+        except OverflowError:
+            raise ExcelError(NUM_ERROR)
+    return apply
+
+
+def _logical(reduce):
+    def logical(*arguments):
+        values = []
+        for argument in arguments:
+            if isinstance(argument, RangeValue):
+                for value in argument.values():
+                    if isinstance(value, ExcelError):
+                        raise value
+                    if isinstance(value, (bool, float)):
+                        values.append(bool(value))
+            elif argument is not None:
+                values.append(to_boolean(argument))
+        if not values:
+            raise ExcelError(VALUE_ERROR)
+        return reduce(values)
+    return logical
+
+
+def _concatenate(*arguments):
+    return ''.join(to_text(argument) for argument in arguments)
+
+
+def _concat(*arguments):
+    parts = []
+    for argument in arguments:
+        if isinstance(argument, RangeValue):
+            parts.extend(to_text(value) for _, value in sorted(argument.cells.items()))
+        else:
+            parts.append(to_text(argument))
+    return ''.join(parts)
+
+
+def _left(text, count=None):
+    count = 1 if count is None else to_integer(count)
+    if count < 0:
+        raise ExcelError(VALUE_ERROR)
+    return to_text(text)[:count]
+
+
+def _right(text, count=None):
+    count = 1 if count is None else to_integer(count)
+    if count < 0:
+        raise ExcelError(VALUE_ERROR)
+    text = to_text(text)
+    return text[len(text) - count:] if count else ''
+
+
+def _mid(text, start, count):
+    start, count = to_integer(start), to_integer(count)
+    if start < 1 or count < 0:
+        raise ExcelError(VALUE_ERROR)
+    return to_text(text)[start - 1:start - 1 + count]
+
+
+def _trim(text):
+    return ' '.join(part for part in to_text(text).split(' ') if part)
+
+
+def _value(text):
+    value = _scalar(text)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            raise ExcelError(VALUE_ERROR)
+    return to_number(value)
+
+
+def _is(test):
+    def check(value):
+        return test(_peek(value))
+    return check
+
+
+def _na():
+    raise ExcelError(NA_ERROR)
+
+
+def _approximate(pairs, lookup, descending=False):
+    """The position of the last item not past ``lookup`` in a sorted line, as Excel finds it."""
+    found = None
+    for position, value in pairs:
+        if _rank(value) != _rank(lookup):
+            continue
+        order = compare(value, lookup)
+        if (order > 0) if not descending else (order < 0):
+            break
+        found = position
+    return found
+
+
+def _lookup(area, lookup, index, approximate, axis):
+    lookup = _scalar(lookup)
+    if lookup is None:
+        raise ExcelError(NA_ERROR)
+    if not isinstance(area, RangeValue):
+        raise ExcelError(VALUE_ERROR)
+    index = to_integer(index)
+    if index < 1:
+        raise ExcelError(VALUE_ERROR)
+    if index > (area.cols if axis == 0 else area.rows):
+        raise ExcelError(REF_ERROR)
+    approximate = True if approximate is None else to_boolean(approximate)
+    pairs = area.line(axis, 0)
+    if approximate:
+        found = _approximate(pairs, lookup)
+    else:
+        found = next((position for position, value in pairs
+                      if _lookup_equal(value, lookup)), None)
+    if found is None:
+        raise ExcelError(NA_ERROR)
+    return area.get(found, index - 1) if axis == 0 else area.get(index - 1, found)
+
+
+def _vlookup(lookup, area, index, approximate=None):
+    return _lookup(area, lookup, index, approximate, 0)
+
+
+def _hlookup(lookup, area, index, approximate=None):
+    return _lookup(area, lookup, index, approximate, 1)
+
+
+def _match(lookup, area, match_type=None):
+    lookup = _scalar(lookup)
+    if lookup is None or not isinstance(area, RangeValue):
+        raise ExcelError(NA_ERROR)
+    match_type = 1 if match_type is None else to_integer(match_type)
+    pairs = area.vector()
+    if match_type == 0:
+        found = next((position for position, value in pairs
+                      if _lookup_equal(value, lookup)), None)
+    else:
+        found = _approximate(pairs, lookup, descending=match_type < 0)
+    if found is None:
+        raise ExcelError(NA_ERROR)
+    return float(found + 1)
+
+
+def _index(area, row, col=None):
+    if not isinstance(area, RangeValue):
+        raise ExcelError(VALUE_ERROR)
+    row = 0 if row is None else to_integer(row)
+    col = None if col is None else to_integer(col)
+    if col is None:
+        if area.rows == 1:
+            row, col = 1, row
+        else:
+            col = 1 if area.cols == 1 else 0
+    if row < 0 or col < 0:
+        raise ExcelError(VALUE_ERROR)
+    if not row or not col:
+        raise Unsupported('INDEX of a whole row or column')
+    if row > area.rows or col > area.cols:
+        raise ExcelError(REF_ERROR)
+    return area.get(row - 1, col - 1)
+
+
+def _shape(axis):
+    def size(area):
+        if not isinstance(area, RangeValue):
+            return 1.0
+        return float(area.rows if axis == 0 else area.cols)
+    return size
+
+
+# name: (function, minimum arguments, maximum arguments)
+FUNCTIONS = {
+    'SUM': (_sum, 1, 255),
+    'AVERAGE': (_average, 1, 255),
+    'MIN': (_extreme(np.min), 1, 255),
+    'MAX': (_extreme(np.max), 1, 255),
+    'PRODUCT': (_product, 1, 255),
+    'MEDIAN': (_median, 1, 255),
+    'STDEV': (_spread(np.std, 1), 1, 255),
+    'STDEV.S': (_spread(np.std, 1), 1, 255),
+    'STDEVP': (_spread(np.std, 0), 1, 255),
+    'STDEV.P': (_spread(np.std, 0), 1, 255),
+    'VAR': (_spread(np.var, 1), 1, 255),
+    'VAR.S': (_spread(np.var, 1), 1, 255),
+    'VARP': (_spread(np.var, 0), 1, 255),
+    'VAR.P': (_spread(np.var, 0), 1, 255),
+    'COUNT': (_count, 1, 255),
+    'COUNTA': (_counta, 1, 255),
+    'COUNTBLANK': (_countblank, 1, 1),
+    'SUMPRODUCT': (_sumproduct, 1, 255),
+    'COUNTIF': (_countif, 2, 2),
+    'COUNTIFS': (_countifs, 2, 254),
+    'SUMIF': (_sumif, 2, 3),
+    'SUMIFS': (_sumifs, 3, 255),
+    'AVERAGEIF': (_averageif, 2, 3),
+    'AVERAGEIFS': (_averageifs, 3, 255),
+    'ROUND': (_round_with(ROUND_HALF_UP), 2, 2),
+    'ROUNDUP': (_round_with(ROUND_UP), 2, 2),
+    'ROUNDDOWN': (_round_with(ROUND_DOWN), 2, 2),
+    'TRUNC': (_trunc, 1, 2),
+    'INT': (_int, 1, 1),
+    'MOD': (_mod, 2, 2),
+    'ABS': (_unary(abs), 1, 1),
+    'SIGN': (_unary(lambda number: (number > 0) - (number < 0)), 1, 1),
+    'SQRT': (_sqrt, 1, 1),
+    'EXP': (_unary(math.exp), 1, 1),
+    'LN': (_ln, 1, 1),
+    'LOG': (_logarithm, 1, 2),
+    'LOG10': (_logarithm, 1, 1),
+    'POWER': (lambda number, power: _finite(_power(to_number(number), to_number(power))), 2, 2),
+    'PI': (lambda: math.pi, 0, 0),
+    'AND': (_logical(all), 1, 255),
+    'OR': (_logical(any), 1, 255),
+    'NOT': (lambda value: not to_boolean(value), 1, 1),
+    'TRUE': (lambda: True, 0, 0),
+    'FALSE': (lambda: False, 0, 0),
+    'CONCATENATE': (_concatenate, 1, 255),
+    'CONCAT': (_concat, 1, 254),
+    'LEN': (lambda text: float(len(to_text(text))), 1, 1),
+    'LEFT': (_left, 1, 2),
+    'RIGHT': (_right, 1, 2),
+    'MID': (_mid, 3, 3),
+    'UPPER': (lambda text: to_text(text).upper(), 1, 1),
+    'LOWER': (lambda text: to_text(text).lower(), 1, 1),
+    'TRIM': (_trim, 1, 1),
+    'EXACT': (lambda left, right: to_text(left) == to_text(right), 2, 2),
+    'VALUE': (_value, 1, 1),
+    'ISBLANK': (_is(lambda value: value is None), 1, 1),
+    'ISNUMBER': (_is(lambda value: type(value) is float), 1, 1),
+    'ISTEXT': (_is(lambda value: isinstance(value, str)), 1, 1),
+    'ISERROR': (_is(lambda value: isinstance(value, ExcelError)), 1, 1),
+    'ISNA': (_is(lambda value: value == ExcelError(NA_ERROR)), 1, 1),
+    'NA': (_na, 0, 0),
+    'VLOOKUP': (_vlookup, 3, 4),
+    'HLOOKUP': (_hlookup, 3, 4),
+    'MATCH': (_match, 2, 3),
+    'INDEX': (_index, 2, 3),
+    'ROWS': (_shape(0), 1, 1),
+    'COLUMNS': (_shape(1), 1, 1),
+}
+
+# Functions that evaluate only the arguments they need; handled by ``FormulaEvaluator``.
+LAZY_FUNCTIONS = {'IF': (2, 3), 'IFERROR': (2, 2), 'IFNA': (2, 2), 'CHOOSE': (2, 255)}
+
+
+# =============================================================================
+# Evaluation
+# =============================================================================
+
+def _date_serial(text):
+    try:
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return text
+    return (moment - _EPOCH).total_seconds() / 86400
+
+
+def _store(cell, value):
+    """Write an evaluated value into a cell the way the reader would have read it."""
+    if isinstance(value, RangeValue):
+        value = value.get(0, 0) if value.rows == value.cols == 1 else ExcelError(VALUE_ERROR)
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        value = ExcelError(NUM_ERROR)
+    if isinstance(value, ExcelError):
+        cell.kind, cell.value = ERROR, value.code
+    elif isinstance(value, bool):
+        cell.kind, cell.value = BOOLEAN, value
+    elif isinstance(value, str):
+        cell.kind, cell.value = STRING, value
+    else:
+        # A formula pointing at a blank cell shows 0.
+        cell.kind, cell.value = NUMBER, 0.0 if value is None else float(value)
+
+
+class FormulaEvaluator:
+    """
+    Computes formula cells that have no cached value, writing results into the cells.
+
+    ``calculate`` evaluates a cell's uncached precedents first, in an order taken from the
+    workbook's ``PrecedentGraph`` (iteratively, so long chains cannot overflow the stack);
+    cells outside that dependency cone are never evaluated. Within a circular reference, a
+    cell not yet computed reads as blank.
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self._done = set()
+        self._active = set()
+        self._scheduled = set()
+        self._unsupported = set()
+
+    def _pending(self, key, cell):
+        return (cell is not None and cell.has_formula and cell.kind == NULL
+                and key not in self._done)
+
+    def calculate(self, key):
+        """Return the cell at ``key``, evaluating its formula first if it has no value."""
+        cell = self.workbook.get_cell(*key)
+        if not self._pending(key, cell):
+            return cell
+        order = self._evaluation_order(key)
+        self._scheduled.update(order)
+        try:
+            for node in order:
+                if node not in self._done:
+                    self._evaluate(node)
+        finally:
+            self._scheduled.clear()
+        return cell
+
+    def _evaluation_order(self, key):
+        """Post-order of the uncached cells ``key`` depends on, ending with ``key``."""
+        graph = self.workbook.precedent_graph()
+        order, seen = [], {key}
+        stack = [(key, iter(graph.precedents(key)))]
+        while stack:
+            node, successors = stack[-1]
+            for successor in successors:
+                if successor not in seen and self._pending(
+                        successor, self.workbook.get_cell(*successor)):
+                    seen.add(successor)
+                    stack.append((successor, iter(graph.precedents(successor))))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        return order
+
+    def _evaluate(self, key):
+        cell = self.workbook.get_cell(*key)
+        self._active.add(key)
+        try:
+            node = parse_formula(cell.formula)
+            if node is None:
+                raise Unsupported(cell.formula)
+            value = self._eval(node, key[0])
+        except ExcelError as error:
+            value = error
+        except (Unsupported, RecursionError):
+            self._unsupported.add(key)
+            return
+        finally:
+            self._active.discard(key)
+            self._done.add(key)
+        _store(cell, value)
+
+    def _cell_value(self, key, cell):
+        if cell.kind == NULL:
+            if self._pending(key, cell):
+                if key in self._active or key in self._scheduled:
+                    # A circular reference, or a precedent that comes later in the order.
+                    return None
+                # A precedent the graph's reference pattern did not see.
+                self._evaluate(key)
+                return self._cell_value(key, cell)
+            if key in self._unsupported:
+                raise Unsupported(cell.formula)
+            return None
+        if cell.kind == NUMBER:
+            return float(cell.value)
+        if cell.kind == BOOLEAN:
+            return bool(cell.value)
+        if cell.kind == ERROR:
+            return ExcelError(cell.value)
+        if cell.kind == DATE:
+            return _date_serial(cell.value)
+        return cell.value
+
+    def _range(self, reference, default_sheet):
+        sheet = self.workbook.get_sheet(reference.sheet or default_sheet)
+        if sheet is None:
+            raise ExcelError(REF_ERROR)
+        min_row, min_col = reference.min_row or 1, reference.min_col or 1
+        max_row, max_col = reference.max_row or MAX_ROW, reference.max_col or MAX_COL
+        cells = {}
+        for row, col, cell in sheet.iter_range(reference):
+            value = self._cell_value((sheet.name, row, col), cell)
+            if value is not None:
+                cells[(row - min_row, col - min_col)] = value
+        return RangeValue(max_row - min_row + 1, max_col - min_col + 1, cells)
+
+    def _argument(self, node, sheet):
+        """Evaluate a function argument: references stay ranges, errors become values."""
+        try:
+            if node[0] == 'reference':
+                return self._range(node[1], sheet)
+            if node[0] == 'missing':
+                return None
+            return self._eval(node, sheet)
+        except ExcelError as error:
+            return error
+
+    def _eval(self, node, sheet):
+        kind = node[0]
+        if kind in ('number', 'string', 'boolean'):
+            return node[1]
+        if kind == 'error':
+            raise ExcelError(node[1])
+        if kind == 'reference':
+            reference = node[1]
+            if reference.is_cell:
+                sheet_name = reference.sheet or sheet
+                if self.workbook.get_sheet(sheet_name) is None:
+                    raise ExcelError(REF_ERROR)
+                key = (sheet_name, reference.min_row, reference.min_col)
+                cell = self.workbook.get_cell(*key)
+                return None if cell is None else self._cell_value(key, cell)
+            return self._range(reference, sheet)
+        if kind == 'negate':
+            return -to_number(self._eval(node[1], sheet))
+        if kind == 'percent':
+            return to_number(self._eval(node[1], sheet)) / 100
+        if kind == 'operator':
+            return self._operator(node, sheet)
+        if kind == 'call':
+            return self._call(node[1], node[2], sheet)
+        raise Unsupported(kind)
+
+    def _operator(self, node, sheet):
+        _, operator, left, right = node
+        left, right = self._eval(left, sheet), self._eval(right, sheet)
+        if operator in _ARITHMETIC:
+            return _finite(_ARITHMETIC[operator](to_number(left), to_number(right)))
+        if operator == '&':
+            return to_text(left) + to_text(right)
+        return _COMPARISONS[operator](compare(_scalar(left), _scalar(right)))
+
+    def _call(self, name, arguments, sheet):
+        if name in LAZY_FUNCTIONS:
+            minimum, maximum = LAZY_FUNCTIONS[name]
+            if not minimum <= len(arguments) <= maximum:
+                raise Unsupported(name)
+            return self._lazy_call(name, arguments, sheet)
+        if name not in FUNCTIONS:
+            raise Unsupported(name)
+        function, minimum, maximum = FUNCTIONS[name]
+        if not minimum <= len(arguments) <= maximum:
+            raise Unsupported(name)
+        return function(*(self._argument(argument, sheet) for argument in arguments))
+
+    def _lazy_call(self, name, arguments, sheet):
+        if name == 'IF':
+            condition = to_boolean(self._argument(arguments[0], sheet))
+            if condition:
+                return self._argument(arguments[1], sheet)
+            if len(arguments) < 3:
+                return False
+            return self._argument(arguments[2], sheet)
+        if name == 'CHOOSE':
+            index = to_integer(self._argument(arguments[0], sheet))
+            if not 1 <= index < len(arguments):
+                raise ExcelError(VALUE_ERROR)
+            return self._argument(arguments[index], sheet)
+        value = _peek(self._argument(arguments[0], sheet))
+        if isinstance(value, ExcelError) and (name == 'IFERROR' or value.code == NA_ERROR):
+            return self._argument(arguments[1], sheet)
+        return value
@@ -0,0 +1,124 @@
+"""
+Formula precedent graph for a parsed workbook.
+
+Edges point from a formula cell to the formula cells its formula references, keyed by
+``(sheet, row, col)``. The graph is built lazily and once per workbook, and the set of
+functions reachable from a cell is memoized per strongly connected component, so shared
+precedents are visited once and circular references terminate.
+"""
+from .references import function_names, iter_references, strip_function_prefixes
+
+
+class PrecedentGraph:
+    """Adjacency index and transitive function sets for the formula cells of a workbook."""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self._edges = {}
+        self._functions = {}
+        self._closures = {}
+
+    def precedents(self, key):
+        """Return the keys of the formula cells referenced by the cell at ``key``."""
+        edges = self._edges.get(key)
+        if edges is None:
+            edges = self._edges[key] = tuple(self._find_precedents(key))
+        return edges
+
+    def functions(self, key):
+        """Return the functions called directly by the cell at ``key``."""
+        functions = self._functions.get(key)
+        if functions is None:
+            cell = self.workbook.get_cell(*key)
+            group = getattr(cell, 'group', None)
+            if group is not None:
+                functions = group.functions()
+            else:
+                formula = cell.formula if cell is not None else None
+                functions = frozenset(function_names(strip_function_prefixes(formula))
+                                      if formula else ())
+            self._functions[key] = functions
+        return functions
+
+    def transitive_functions(self, key):
+        """Return every function called by the cell at ``key`` or any of its precedents."""
+        closure = self._closures.get(key)
+        if closure is None:
+            self.resolve((key,))
+            closure = self._closures[key]
+        return closure
+
+    def resolve(self, roots):
+        """
+        Compute transitive function sets for ``roots`` and everything they reach in one
+        traversal (an iterative Tarjan SCC walk, so deep chains cannot overflow the stack).
+        """
+        closures = self._closures
+        index, low = {}, {}
+        stack, on_stack = [], set()
+        counter = 0
+        for root in roots:
+            if root in closures or root in index:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.precedents(root)))]
+            while work:
+                node, successors = work[-1]
+                descended = False
+                for successor in successors:
+                    if successor in closures:
+                        continue
+                    if successor not in index:
+                        index[successor] = low[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.precedents(successor))))
+                        descended = True
+                        break
+                    if successor in on_stack and index[successor] < low[node]:
+                        low[node] = index[successor]
+                if descended:
+                    continue
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] == index[node]:
+                    self._close_component(node, stack, on_stack)
+
+    def _close_component(self, root, stack, on_stack):
+        members = []
+        while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            members.append(member)
+            if member == root:
+                break
+        component = set(members)
+        functions = set()
+        for member in members:
+            functions |= self.functions(member)
+            for successor in self.precedents(member):
+                if successor not in component:
+                    functions |= self._closures[successor]
+        closure = frozenset(functions)
+        for member in members:
+            self._closures[member] = closure
+
+    def _find_precedents(self, key):
+        cell = self.workbook.get_cell(*key)
+        if cell is None or not cell.has_formula:
+            return
+        seen = set()
+        for reference in iter_references(strip_function_prefixes(cell.formula), key[0]):
+            sheet = self.workbook.get_sheet(reference.sheet)
+            if sheet is None:
+                continue
+            for row, col, precedent in sheet.iter_range(reference):
+                precedent_key = (sheet.name, row, col)
+                if precedent.has_formula and precedent_key not in seen:
+                    seen.add(precedent_key)
+                    yield precedent_key
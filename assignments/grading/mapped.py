@@ -0,0 +1,110 @@
+"""
+Zero-copy reads of stored workbooks.
+
+Files on local storage are memory-mapped read-only and handed to ``zipfile`` through
+``MappedFile``, so a workbook is never copied whole into a Python ``bytes``: the reader
+decompresses each worksheet straight from the mapping, pages it never reaches (sheets a
+``ReadPlan`` skips) are never loaded, and every process reading the same file shares its
+pages through the page cache.
+
+Stored files are written once under a new name and never modified in place, which is what
+makes mapping them safe; a file truncated while mapped would fault its reader.
+"""
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+
+class MappedFile(io.RawIOBase):
+    """A read-only, seekable file object over a buffer; ``read`` copies only what it returns."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._position = offset
+        return offset
+
+    def read(self, size=-1):
+        start = min(self._position, len(self._view))
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        self._position = end
+        return self._view[start:end].tobytes()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def section(self, offset, size):
+        """Return a ``MappedFile`` over ``size`` bytes from ``offset``, without copying them."""
+        return MappedFile(self._view[offset:offset + size])
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+@contextmanager
+def open_mapped(path):
+    """Open the file at ``path`` as a ``MappedFile`` over a read-only mapping of it."""
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            # Empty files cannot be mapped.
+            mapping = b''
+        else:
+            mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        with MappedFile(mapping) as source:
+            yield source
+    finally:
+        if isinstance(mapping, mmap.mmap):
+            mapping.close()
+
+
+def local_path(field_file):
+    """Return the filesystem path of a ``FieldFile``, or None if its storage is remote."""
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None
+
+
+@contextmanager
+def open_upload(upload):
+    """Open an ``UploadedFile`` for reading: mapped if Django spooled it to disk."""
+    if hasattr(upload, 'temporary_file_path'):
+        with open_mapped(upload.temporary_file_path()) as source:
+            yield source
+    else:
+        yield upload
+
+
+@contextmanager
+def open_stored(field_file):
+    """Open a ``FieldFile`` for reading: mapped on local storage, streamed otherwise."""
+    path = local_path(field_file)
+    if path is None:
+        with field_file.open('rb') as source:
+            yield source
+    else:
+        with open_mapped(path) as source:
+            yield source
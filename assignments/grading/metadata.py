@@ -0,0 +1,165 @@
+"""
+Document properties of a submission, from ``docProps/core.xml`` and ``docProps/app.xml``.
+
+These are what the browser grader exports next to each score (``creator``,
+``lastModifiedBy``, ``created``, ...), named as in ``ExportSubmissionColumns``
+(``models/submission/submission.ts``), plus the edit statistics Excel records in
+``app.xml``. ``read_metadata`` reads only those two members through the zip central
+directory, so scanning a submission costs two small inflates no matter how large its
+worksheets are.
+"""
+import zipfile
+import zlib
+from datetime import datetime
+from xml.etree import ElementTree
+
+from .exceptions import WorkbookError
+
+CP_NS = 'http://schemas.openxmlformats.org/package/2006/metadata/core-properties'
+DC_NS = 'http://purl.org/dc/elements/1.1/'
+DCTERMS_NS = 'http://purl.org/dc/terms/'
+APP_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/extended-properties'
+
+CORE_PROPERTIES = {
+    'creator': f'{{{DC_NS}}}creator',
+    'title': f'{{{DC_NS}}}title',
+    'subject': f'{{{DC_NS}}}subject',
+    'description': f'{{{DC_NS}}}description',
+    'keywords': f'{{{CP_NS}}}keywords',
+    'category': f'{{{CP_NS}}}category',
+    'lastModifiedBy': f'{{{CP_NS}}}lastModifiedBy',
+    'lastPrinted': f'{{{CP_NS}}}lastPrinted',
+    'revision': f'{{{CP_NS}}}revision',
+    'created': f'{{{DCTERMS_NS}}}created',
+    'lastModified': f'{{{DCTERMS_NS}}}modified',
+}
+
+APP_PROPERTIES = {
+    'company': f'{{{APP_NS}}}Company',
+    'manager': f'{{{APP_NS}}}Manager',
+    'application': f'{{{APP_NS}}}Application',
+    'appVersion': f'{{{APP_NS}}}AppVersion',
+    'totalTime': f'{{{APP_NS}}}TotalTime',
+}
+
+DATE_PROPERTIES = ('created', 'lastModified', 'lastPrinted')
+INTEGER_PROPERTIES = ('revision', 'totalTime')
+
+
+def _parse_date(text):
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def _parse_integer(text):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+class DocumentProperties:
+    """
+    A submission's document properties. Unset properties are None.
+
+    Dates (``created``, ``lastModified``, ``lastPrinted``) are ``datetime``s, ``revision``
+    and ``totalTime`` (minutes spent editing) are ints, and everything else is a string.
+    """
+
+    __slots__ = tuple(CORE_PROPERTIES) + tuple(APP_PROPERTIES)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_archive(cls, archive):
+        """Read the properties of an open xlsx ``ZipFile``."""
+        values = {
+            **_read_part(archive, 'docProps/core.xml', CORE_PROPERTIES),
+            **_read_part(archive, 'docProps/app.xml', APP_PROPERTIES),
+        }
+        for name in DATE_PROPERTIES:
+            if name in values:
+                values[name] = _parse_date(values[name])
+        for name in INTEGER_PROPERTIES:
+            if name in values:
+                values[name] = _parse_integer(values[name])
+        return cls(**values)
+
+    def as_dict(self):
+        """Return the set properties as JSON-ready values, dates as ISO 8601 strings."""
+        values = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, datetime):
+                value = value.isoformat().replace('+00:00', 'Z')
+            values[name] = value
+        return values
+
+    def __eq__(self, other):
+        if not isinstance(other, DocumentProperties):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f'DocumentProperties({self.as_dict()!r})'
+
+
+def _read_part(archive, name, properties):
+    # Properties are informational: a missing or malformed part just yields none.
+    try:
+        with archive.open(name) as stream:
+            root = ElementTree.parse(stream).getroot()
+    except (KeyError, ElementTree.ParseError, zipfile.BadZipFile, zlib.error, EOFError):
+        return {}
+    values = {}
+    for key, tag in properties.items():
+        element = root.find(tag)
+        if element is not None and element.text and element.text.strip():
+            values[key] = element.text.strip()
+    return values
+
+
+def read_metadata(source):
+    """
+    Read the document properties of an xlsx file (a path or a binary file object).
+
+    Raises ``WorkbookError`` if the file is not a zip package.
+    """
+    try:
+        archive = zipfile.ZipFile(source)
+    except (zipfile.BadZipFile, OSError, ValueError, zlib.error, EOFError) as exc:
+        raise WorkbookError('Not an xlsx workbook') from exc
+    with archive:
+        return DocumentProperties.from_archive(archive)
+
+
+def shared_origins(scanned, template=None):
+    """
+    Group scanned submissions that were created at the same instant.
+
+    Excel keeps ``created`` when a workbook is copied, so distinct students' files sharing
+    one usually began as the same file. The ``template`` properties' ``created`` (the
+    workbook handed out to the class) is not a suspicious origin and is ignored.
+
+    Args:
+        scanned: ``(file_name, DocumentProperties)`` pairs
+        template: The master workbook's ``DocumentProperties``, if known
+
+    Returns:
+        list: ``{'created', 'file_names'}`` for each instant shared by two or more files
+    """
+    ignored = template.created if template is not None else None
+    groups = {}
+    for file_name, properties in scanned:
+        created = properties.created
+        if created is not None and created != ignored:
+            groups.setdefault(created, []).append(file_name)
+    return [{'created': DocumentProperties(created=created).as_dict()['created'],
+             'file_names': file_names}
+            for created, file_names in groups.items() if len(file_names) > 1]
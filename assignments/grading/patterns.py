@@ -0,0 +1,312 @@
+"""
+Time-bounded execution of the instructor-supplied regexes of Formula Regex facets.
+
+Python's ``re`` backtracks, and some patterns the ``safe-regex`` heuristics accept, such as
+``(a|a)*b``, still take exponential time on a long enough formula. ``BoundedPattern``
+therefore runs a pattern one of two ways:
+
+* Patterns made only of regular constructs (literals, classes, groups, alternation,
+  repetition and the ``^``/``$``/``\\b`` anchors) are compiled to a Thompson NFA and
+  searched by simulating every thread at once (a Pike VM without captures), which takes
+  time linear in the formula's length whatever the pattern.
+* Anything else (backreferences, lookaround, possessive repetition, inline flags) is run
+  with ``re`` in a forked child that is killed once ``GRADING_REGEX_TIMEOUT`` passes.
+
+Either way, a search that exceeds the budget raises ``RegexTimeout``.
+"""
+import os
+import re
+import select
+import signal
+import time
+
+from django.conf import settings
+
+from .exceptions import RegexTimeout
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Default seconds a single search may take.
+DEFAULT_REGEX_TIMEOUT = 1.0
+
+# Largest linear program compiled; bounded repetition (``a{1,500}``) is expanded, so
+# beyond this the pattern is run with ``re`` instead.
+MAX_PROGRAM_SIZE = 4000
+
+# The linear matcher checks the clock once per this many characters.
+_CLOCK_INTERVAL = 64
+
+_DIGITS = frozenset('0123456789')
+_SPACES = frozenset(' \t\n\r\f\v')
+_WORD = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: (_DIGITS, False),
+    sre_constants.CATEGORY_NOT_DIGIT: (_DIGITS, True),
+    sre_constants.CATEGORY_SPACE: (_SPACES, False),
+    sre_constants.CATEGORY_NOT_SPACE: (_SPACES, True),
+    sre_constants.CATEGORY_WORD: (_WORD, False),
+    sre_constants.CATEGORY_NOT_WORD: (_WORD, True),
+}
+_ANCHORS = (
+    sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END,
+    sre_constants.AT_END_STRING, sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY,
+)
+# Flags that do not change what a pattern matches here (``compile_js_regex`` sets ASCII).
+_NEUTRAL_FLAGS = re.ASCII | re.UNICODE
+
+_CHAR, _SPLIT, _JUMP, _ASSERT, _MATCH = range(5)
+
+
+class NotLinear(Exception):
+    """A pattern uses a construct the linear matcher does not implement."""
+
+
+class CharacterClass:
+    """A set of characters from a parsed ``[...]``, ``.``, escape or literal."""
+
+    __slots__ = ('chars', 'ranges', 'categories', 'negate', '_cache')
+
+    def __init__(self, chars=(), ranges=(), categories=(), negate=False):
+        self.chars = frozenset(chars)
+        self.ranges = tuple(ranges)
+        self.categories = tuple(categories)
+        self.negate = negate
+        self._cache = {}
+
+    def __contains__(self, char):
+        result = self._cache.get(char)
+        if result is None:
+            code = ord(char)
+            result = (char in self.chars
+                      or any(low <= code <= high for low, high in self.ranges)
+                      or any((char in members) != inverted
+                             for members, inverted in self.categories)) != self.negate
+            self._cache[char] = result
+        return result
+
+    @classmethod
+    def from_set(cls, items):
+        chars, ranges, categories, negate = [], [], [], False
+        for op, av in items:
+            if op is sre_constants.NEGATE:
+                negate = True
+            elif op is sre_constants.LITERAL:
+                chars.append(chr(av))
+            elif op is sre_constants.RANGE:
+                ranges.append(av)
+            elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+                categories.append(_CATEGORIES[av])
+            else:
+                raise NotLinear(op)
+        return cls(chars, ranges, categories, negate)
+
+
+class _Compiler:
+    """Compile a parsed pattern to instructions for ``LinearPattern``."""
+
+    def __init__(self):
+        self.program = []
+
+    def emit(self, *instruction):
+        if len(self.program) >= MAX_PROGRAM_SIZE:
+            raise NotLinear('program too large')
+        self.program.append(list(instruction))
+        return len(self.program) - 1
+
+    def compile(self, items):
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                self.emit(_CHAR, CharacterClass((chr(av),)))
+            elif op is sre_constants.NOT_LITERAL:
+                self.emit(_CHAR, CharacterClass((chr(av),), negate=True))
+            elif op is sre_constants.ANY:
+                self.emit(_CHAR, CharacterClass(('\n',), negate=True))
+            elif op is sre_constants.IN:
+                self.emit(_CHAR, CharacterClass.from_set(av))
+            elif op is sre_constants.SUBPATTERN:
+                _group, add_flags, del_flags, pattern = av
+                if (add_flags | del_flags) & ~_NEUTRAL_FLAGS:
+                    raise NotLinear('inline flags')
+                self.compile(pattern)
+            elif op is sre_constants.BRANCH:
+                self.branch(av[1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                # Greedy and lazy repetition match the same strings, and only whether
+                # there is a match matters.
+                self.repeat(*av)
+            elif op is sre_constants.AT and av in _ANCHORS:
+                self.emit(_ASSERT, av)
+            else:
+                raise NotLinear(op)
+
+    def branch(self, alternatives):
+        jumps = []
+        for alternative in alternatives[:-1]:
+            split = self.emit(_SPLIT, None, None)
+            self.program[split][1] = len(self.program)
+            self.compile(alternative)
+            jumps.append(self.emit(_JUMP, None))
+            self.program[split][2] = len(self.program)
+        self.compile(alternatives[-1])
+        for jump in jumps:
+            self.program[jump][1] = len(self.program)
+
+    def repeat(self, minimum, maximum, item):
+        for _ in range(minimum):
+            self.compile(item)
+        if maximum == sre_constants.MAXREPEAT:
+            split = self.emit(_SPLIT, None, None)
+            self.program[split][1] = len(self.program)
+            self.compile(item)
+            self.emit(_JUMP, split)
+            self.program[split][2] = len(self.program)
+            return
+        splits = []
+        for _ in range(maximum - minimum):
+            split = self.emit(_SPLIT, None, None)
+            self.program[split][1] = len(self.program)
+            splits.append(split)
+            self.compile(item)
+        for split in splits:
+            self.program[split][2] = len(self.program)
+
+
+def _is_word(text, index):
+    return 0 <= index < len(text) and text[index] in _WORD
+
+
+def _holds(anchor, text, position):
+    if anchor is sre_constants.AT_BEGINNING or anchor is sre_constants.AT_BEGINNING_STRING:
+        return position == 0
+    if anchor is sre_constants.AT_END_STRING:
+        return position == len(text)
+    if anchor is sre_constants.AT_END:
+        return position == len(text) or (position == len(text) - 1 and text[-1] == '\n')
+    boundary = _is_word(text, position - 1) != _is_word(text, position)
+    return boundary if anchor is sre_constants.AT_BOUNDARY else not boundary
+
+
+class LinearPattern:
+    """
+    A regular pattern searched in ``O(len(text) * len(program))`` time.
+
+    Raises ``NotLinear`` on construction if the pattern needs backtracking semantics.
+    """
+
+    __slots__ = ('program',)
+
+    def __init__(self, expression, flags=re.ASCII):
+        parsed = sre_parse.parse(expression, flags)
+        # Character categories are implemented with their ASCII meaning only.
+        if parsed.state.flags & ~_NEUTRAL_FLAGS or not parsed.state.flags & re.ASCII:
+            raise NotLinear('flags')
+        compiler = _Compiler()
+        compiler.compile(parsed)
+        compiler.emit(_MATCH)
+        self.program = compiler.program
+
+    def _add(self, threads, seen, pc, text, position):
+        # Follow jumps, splits and anchors from ``pc``; collect character tests in
+        # ``threads``. Returns True if the match instruction is reached.
+        stack = [pc]
+        while stack:
+            pc = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+            instruction = self.program[pc]
+            op = instruction[0]
+            if op == _CHAR:
+                threads.append(pc)
+            elif op == _SPLIT:
+                stack.append(instruction[2])
+                stack.append(instruction[1])
+            elif op == _JUMP:
+                stack.append(instruction[1])
+            elif op == _ASSERT:
+                if _holds(instruction[1], text, position):
+                    stack.append(pc + 1)
+            else:
+                return True
+        return False
+
+    def search(self, text, deadline=None):
+        """
+        Return whether the pattern matches anywhere in ``text``.
+
+        Raises ``RegexTimeout`` if ``deadline`` (a ``time.perf_counter`` value) passes.
+        """
+        program = self.program
+        threads, seen = [], set()
+        for position in range(len(text) + 1):
+            # A new thread starts at every position, as ``re.search`` tries each in turn.
+            if self._add(threads, seen, 0, text, position):
+                return True
+            if position == len(text):
+                return False
+            if deadline is not None and position % _CLOCK_INTERVAL == 0 \
+                    and time.perf_counter() > deadline:
+                raise RegexTimeout
+            char = text[position]
+            following, seen = [], set()
+            for pc in threads:
+                if char in program[pc][1] and self._add(following, seen, pc + 1, text,
+                                                        position + 1):
+                    return True
+            threads = following
+        return False
+
+
+def _search_in_child(pattern, text, timeout):
+    """Run ``pattern.search(text)`` in a forked child, killing it after ``timeout``."""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover - runs in the child
+        os.close(read_end)
+        try:
+            os.write(write_end, b'1' if pattern.search(text) else b'0')
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    try:
+        ready, _, _ = select.select([read_end], [], [], timeout)
+        if not ready:
+            os.kill(pid, signal.SIGKILL)
+            raise RegexTimeout
+        return os.read(read_end, 1) == b'1'
+    finally:
+        os.close(read_end)
+        os.waitpid(pid, 0)
+
+
+class BoundedPattern:
+    """
+    A compiled Formula Regex pattern whose searches are bounded by
+    ``GRADING_REGEX_TIMEOUT`` seconds.
+
+    Attributes:
+        pattern: The compiled ``re`` pattern
+        linear: The ``LinearPattern`` used to search, or None if ``re`` runs in a child
+    """
+
+    __slots__ = ('pattern', 'linear')
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        try:
+            self.linear = LinearPattern(pattern.pattern, pattern.flags)
+        except (NotLinear, re.error, RecursionError):
+            self.linear = None
+
+    def search(self, text):
+        """Return whether the pattern matches in ``text``; raises ``RegexTimeout``."""
+        timeout = getattr(settings, 'GRADING_REGEX_TIMEOUT', DEFAULT_REGEX_TIMEOUT)
+        if self.linear is not None:
+            return self.linear.search(text, time.perf_counter() + timeout)
+        if not hasattr(os, 'fork'):
+            return self.pattern.search(text) is not None
+        return _search_in_child(self.pattern, text, timeout)
@@ -0,0 +1,165 @@
+"""
+Cell address and formula reference helpers shared by the grading engine.
+
+The patterns here mirror the ones used by the Angular facets so that a rubric grades the
+same way in the browser and on the server.
+"""
+import re
+
+MAX_ROW = 1048576
+MAX_COL = 16384
+
+# Mirrors ``match()`` in formula-list.facet.ts: an optional sheet prefix followed by a
+# single cell (A4), a bounded range (A2:B3) or a whole column/row range (A:B, 2:3).
+REFERENCE_PATTERN = re.compile(
+    r"(?:(?P<sheet>'(?:[^']|'')*'|[_A-Za-z0-9-]+)!)?"
+    r"(?:(?P<start>[A-Z]+[0-9]+)(?::(?P<end>[A-Z]+[0-9]+))?"
+    r"|(?P<cols>[A-Z]+:[A-Z]+)"
+    r"|(?P<rows>[0-9]+:[0-9]+))"
+)
+
+# Function names as matched by ``FormulaListFacet.recurse``.
+FUNCTION_PATTERN = re.compile(r'[A-Z.]+(?=\()')
+
+# Excel stores newer functions (STDEV.S, CONCAT, IFS, ...) with an internal prefix.
+FUNCTION_PREFIX_PATTERN = re.compile(r'_xl(?:fn|ws)\.')
+
+CELL_PATTERN = re.compile(r'^\$?([A-Za-z]{1,3})\$?([0-9]+)$')
+
+# Relative cell references inside a formula, skipping string literals and quoted sheet names.
+_TRANSLATABLE_PATTERN = re.compile(
+    r'"(?:[^"]|"")*"'
+    r"|'(?:[^']|'')*'!"
+    r'|(?<![A-Za-z0-9_.$])(\$?)([A-Z]{1,3})(\$?)([0-9]+)(?![A-Za-z0-9_(])'
+)
+
+
+def column_index(letters):
+    """Convert column letters (``A``, ``AB``) to a 1-based column index."""
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + (ord(char) - 64)
+    return index
+
+
+def column_letters(index):
+    """Convert a 1-based column index to column letters."""
+    letters = ''
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def parse_cell(address):
+    """
+    Parse an A1-style cell address into a ``(row, col)`` tuple.
+
+    Returns None if the address is not a single cell reference.
+    """
+    match = CELL_PATTERN.match(address)
+    if not match:
+        return None
+    return int(match.group(2)), column_index(match.group(1))
+
+
+def cell_address(row, col):
+    """Format a 1-based ``(row, col)`` pair as an A1-style address."""
+    return f'{column_letters(col)}{row}'
+
+
+def strip_function_prefixes(formula):
+    """Remove Excel's ``_xlfn.``/``_xlws.`` function prefixes from a formula."""
+    return FUNCTION_PREFIX_PATTERN.sub('', formula)
+
+
+def unquote_sheet_name(name):
+    """Strip the single quotes Excel puts around sheet names containing spaces."""
+    if len(name) >= 2 and name[0] == "'" and name[-1] == "'":
+        return name[1:-1].replace("''", "'")
+    return name
+
+
+def function_names(formula):
+    """Return every function name called by a formula, in order of appearance."""
+    return FUNCTION_PATTERN.findall(formula)
+
+
+class Reference:
+    """
+    A rectangular block of cells referenced by a formula.
+
+    Whole column (``A:A``) and whole row (``2:2``) references are unbounded on one axis;
+    the missing bounds are stored as None.
+    """
+
+    __slots__ = ('sheet', 'min_row', 'min_col', 'max_row', 'max_col')
+
+    def __init__(self, sheet, min_row, min_col, max_row, max_col):
+        self.sheet = sheet
+        self.min_row = min_row
+        self.min_col = min_col
+        self.max_row = max_row
+        self.max_col = max_col
+
+    @property
+    def is_cell(self):
+        return (self.min_row is not None and self.min_row == self.max_row
+                and self.min_col is not None and self.min_col == self.max_col)
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f'Reference({self.sheet!r}, {self.min_row}, {self.min_col}, {self.max_row}, {self.max_col})'
+
+    def _key(self):
+        return self.sheet, self.min_row, self.min_col, self.max_row, self.max_col
+
+
+def iter_references(formula, default_sheet):
+    """
+    Yield a ``Reference`` for every cell or range a formula points at.
+
+    ``$`` anchors are ignored and references without a sheet prefix resolve against
+    ``default_sheet``.
+    """
+    for match in REFERENCE_PATTERN.finditer(formula.replace('$', '')):
+        sheet = match.group('sheet')
+        sheet = unquote_sheet_name(sheet) if sheet else default_sheet
+        if match.group('start'):
+            start = parse_cell(match.group('start'))
+            end = parse_cell(match.group('end')) if match.group('end') else start
+            yield Reference(sheet, min(start[0], end[0]), min(start[1], end[1]),
+                            max(start[0], end[0]), max(start[1], end[1]))
+        elif match.group('cols'):
+            first, last = (column_index(part) for part in match.group('cols').split(':'))
+            yield Reference(sheet, None, min(first, last), None, max(first, last))
+        else:
+            first, last = (int(part) for part in match.group('rows').split(':'))
+            yield Reference(sheet, min(first, last), None, max(first, last), None)
+
+
+def translate_formula(formula, row_offset, col_offset):
+    """
+    Shift the relative cell references of a formula, as Excel does when filling down.
+
+    Used to expand shared formulas, which xlsx stores once on the master cell.
+    """
+    if not row_offset and not col_offset:
+        return formula
+
+    def shift(match):
+        if match.group(2) is None:
+            return match.group(0)
+        col_abs, letters, row_abs, digits = match.groups()
+        col = column_index(letters) if col_abs else column_index(letters) + col_offset
+        row = int(digits) if row_abs else int(digits) + row_offset
+        if not (1 <= col <= MAX_COL and 1 <= row <= MAX_ROW):
+            return '#REF!'
+        return f'{col_abs}{column_letters(col)}{row_abs}{row}'
+
+    return _TRANSLATABLE_PATTERN.sub(shift, formula)
@@ -0,0 +1,150 @@
+"""
+Synthetic workbooks for tests and benchmarks.
+
+``build_xlsx`` writes just enough SpreadsheetML for the grading reader (and Excel) to open
+the result; ``synthetic_corpus`` produces a class worth of varied submissions for the
+``grading_benchmark`` management command.
+"""
+import io
+import random
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from .references import column_letters
+
+
+def _xlsx_cell(reference, value, shared_strings):
+    """Render a single ``<c>`` element for ``build_xlsx``."""
+    formula, cached = None, value
+    if isinstance(value, tuple):
+        formula, cached = value
+    elif isinstance(value, str) and value.startswith('='):
+        formula, cached = value, None
+    parts = []
+    if formula is not None:
+        parts.append(f'<f>{escape(formula.lstrip("="))}</f>')
+    attrs = ''
+    if isinstance(cached, bool):
+        attrs = ' t="b"'
+        parts.append(f'<v>{int(cached)}</v>')
+    elif isinstance(cached, (int, float)):
+        parts.append(f'<v>{cached!r}</v>')
+    elif isinstance(cached, str):
+        if formula is not None:
+            attrs = ' t="str"'
+            parts.append(f'<v>{escape(cached)}</v>')
+        else:
+            attrs = ' t="s"'
+            shared_strings.append(cached)
+            parts.append(f'<v>{len(shared_strings) - 1}</v>')
+    return f'<c r="{reference}"{attrs}>{"".join(parts)}</c>'
+
+
+def build_xlsx(sheets, extra_parts=None):
+    """
+    Build a minimal xlsx workbook in memory.
+
+    ``sheets`` maps sheet names to ``{address: value}``. Strings starting with ``=`` are
+    formulas without a cached value, ``(formula, cached)`` tuples are formulas with one,
+    and any other value is stored as a constant. ``extra_parts`` adds or replaces raw
+    archive members.
+    """
+    main_ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    rel_ns = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    shared_strings = []
+    parts = {}
+    sheet_entries, rel_entries = [], []
+    for index, (name, cells) in enumerate(sheets.items(), start=1):
+        rows = {}
+        for reference, value in cells.items():
+            row = int(re.sub(r'[A-Z]+', '', reference))
+            rows.setdefault(row, []).append(_xlsx_cell(reference, value, shared_strings))
+        body = ''.join(
+            f'<row r="{row}">{"".join(rows[row])}</row>' for row in sorted(rows)
+        )
+        parts[f'xl/worksheets/sheet{index}.xml'] = (
+            f'<worksheet xmlns="{main_ns}"><sheetData>{body}</sheetData></worksheet>'
+        )
+        sheet_entries.append(f'<sheet name="{escape(name)}" sheetId="{index}" r:id="rId{index}"/>')
+        rel_entries.append(
+            f'<Relationship Id="rId{index}" Type="{rel_ns}/worksheet" '
+            f'Target="worksheets/sheet{index}.xml"/>'
+        )
+    parts['xl/workbook.xml'] = (
+        f'<workbook xmlns="{main_ns}" xmlns:r="{rel_ns}"><sheets>{"".join(sheet_entries)}'
+        '</sheets></workbook>'
+    )
+    parts['xl/_rels/workbook.xml.rels'] = (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'{"".join(rel_entries)}</Relationships>'
+    )
+    parts['xl/sharedStrings.xml'] = (
+        f'<sst xmlns="{main_ns}">'
+        + ''.join(f'<si><t>{escape(text)}</t></si>' for text in shared_strings)
+        + '</sst>'
+    )
+    parts.update(extra_parts or {})
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in parts.items():
+            # A fixed timestamp, so the same cells always build the same bytes.
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), content,
+                             compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+def synthetic_rubric(data_rows=2000):
+    """A rubric exercising every facet type against ``synthetic_submission`` workbooks."""
+    def target(address, row, col):
+        return {'sheetName': 'Sheet1', 'address': address, 'row': row, 'col': col}
+
+    return [
+        {'name': 'Totals', 'facets': [
+            {'type': 'ValueFacet', 'points': 2, 'targetCell': target('C1', 1, 3),
+             'value': str(sum(range(1, data_rows + 1)))},
+            {'type': 'FormulaContainsFacet', 'points': 1, 'targetCell': target('C1', 1, 3),
+             'formula': 'SUM('},
+        ]},
+        {'name': 'Statistics', 'facets': [
+            {'type': 'ValueRangeFacet', 'points': 2, 'targetCell': target('C2', 2, 3),
+             'lowerBounds': data_rows / 2, 'upperBounds': data_rows / 2 + 1},
+            {'type': 'FormulaRegexFacet', 'points': 1, 'targetCell': target('C2', 2, 3),
+             'expression': r'^ROUND\(AVERAGE\(A\d+:A\d+\),\s*\d\)$'},
+            {'type': 'FormulaListFacet', 'points': 3, 'targetCell': target('C4', 4, 3),
+             'formulas': ['SUM', 'ROUND', 'AVERAGE']},
+        ]},
+        {'name': 'Label', 'facets': [
+            {'type': 'ValueLengthFacet', 'points': 1, 'targetCell': target('C3', 3, 3),
+             'minLength': 3, 'maxLength': 20},
+        ]},
+    ]
+
+
+def synthetic_submission(seed, data_rows=2000):
+    """
+    Build one student workbook: a pasted data column, a scratch sheet and a few answer
+    formulas, some of them deliberately wrong depending on ``seed``.
+    """
+    rng = random.Random(seed)
+    total = sum(range(1, data_rows + 1))
+    average = round(total / data_rows, 2)
+    cells = {f'A{row}': row for row in range(1, data_rows + 1)}
+    cells.update({f'B{row}': f'note {rng.randint(0, 50)}' for row in range(1, data_rows + 1, 7)})
+    if rng.random() < 0.8:
+        cells['C1'] = (f'SUM(A1:A{data_rows})', total)
+    else:
+        cells['C1'] = total
+    function = 'AVERAGE' if rng.random() < 0.85 else 'MEDIAN'
+    cells['C2'] = (f'ROUND({function}(A1:A{data_rows}),{rng.choice([1, 2])})', average)
+    cells['C3'] = rng.choice(['Answer', 'ok', 'Final answer here'])
+    cells['C4'] = ('C1+C2', total + average)
+    scratch = {f'{column_letters(col)}{row}': rng.random()
+               for row in range(1, 200) for col in range(1, 6)}
+    return build_xlsx({'Sheet1': cells, 'Scratch': scratch})
+
+
+def synthetic_corpus(count, data_rows=2000):
+    """Return ``count`` ``(file_name, xlsx_bytes)`` submissions."""
+    return [(f'student-{index:04d}.xlsx', synthetic_submission(index, data_rows))
+            for index in range(count)]
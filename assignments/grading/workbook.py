@@ -0,0 +1,514 @@
+"""
+In-memory workbook model used by the grading engine, and the value conversions the
+facets rely on.
+
+``safe_value`` reproduces ``FancyWorkbook.getCellSafeValue(cell).value`` so that values
+are compared exactly the way the browser grader compares them.
+"""
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+from .graph import PrecedentGraph
+from .references import function_names, strip_function_prefixes, translate_formula
+
+NULL = 'null'
+NUMBER = 'number'
+STRING = 'string'
+BOOLEAN = 'boolean'
+DATE = 'date'
+ERROR = 'error'
+
+_JS_NUMBER_PATTERN = re.compile(
+    r'^[+-]?(?:(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|Infinity)$'
+)
+_JS_RADIX_PATTERN = re.compile(r'^0(?:[xX][0-9a-fA-F]+|[oO][0-7]+|[bB][01]+)$')
+
+
+def js_number_string(number):
+    """Format a float the way JavaScript's ``Number.prototype.toString`` does."""
+    if math.isnan(number):
+        return 'NaN'
+    if math.isinf(number):
+        return 'Infinity' if number > 0 else '-Infinity'
+    if number == 0:
+        return '0'
+    sign = '-' if number < 0 else ''
+    _, digit_tuple, exponent = Decimal(repr(abs(number))).as_tuple()
+    digits = ''.join(str(d) for d in digit_tuple).rstrip('0')
+    exponent += len(digit_tuple) - len(digits)
+    k = len(digits)
+    n = exponent + k
+    if k <= n <= 21:
+        return sign + digits + '0' * (n - k)
+    if 0 < n <= 21:
+        return sign + digits[:n] + '.' + digits[n:]
+    if -6 < n <= 0:
+        return sign + '0.' + '0' * -n + digits
+    mantissa = digits if k == 1 else f'{digits[0]}.{digits[1:]}'
+    return f'{sign}{mantissa}e{"+" if n - 1 >= 0 else "-"}{abs(n - 1)}'
+
+
+def js_string(value):
+    """Convert a JSON scalar to a string the way a JavaScript template literal would."""
+    if value is None:
+        return 'undefined'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return js_number_string(float(value))
+    return str(value)
+
+
+def js_to_number(value):
+    """
+    Convert a value to a float the way JavaScript's unary ``+`` does.
+
+    Returns NaN for values JavaScript cannot convert.
+    """
+    if value is None:
+        return math.nan
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if not text:
+        return 0.0
+    if _JS_NUMBER_PATTERN.match(text):
+        return float(text.replace('Infinity', 'inf'))
+    if _JS_RADIX_PATTERN.match(text):
+        return float(int(text, 0))
+    return math.nan
+
+
+def js_length(text):
+    """Return the length of a string as JavaScript counts it (UTF-16 code units)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+class Cell:
+    """A single populated cell: its value kind, its (cached) value and its formula, if any."""
+
+    __slots__ = ('kind', 'value', 'formula')
+
+    def __init__(self, kind=NULL, value=None, formula=None):
+        self.kind = kind
+        self.value = value
+        self.formula = formula
+
+    @property
+    def has_formula(self):
+        """Whether the cell has a formula, without expanding a shared one."""
+        return self.formula is not None
+
+    def __repr__(self):
+        return f'Cell({self.kind!r}, {self.value!r}, formula={self.formula!r})'
+
+
+class SharedFormula:
+    """
+    A shared formula group (``<f t="shared" si="...">``): the formula as written on the
+    group's first cell and that cell's position.
+
+    Filled-down cells reference the group instead of carrying their own formula text; a
+    member's formula is translated from the master the first time it is read and memoized
+    by offset. The functions a group calls are the same for every member, so they are
+    extracted once from the master.
+    """
+
+    __slots__ = ('text', 'row', 'col', '_translations', '_functions')
+
+    def __init__(self, text, row, col):
+        self.text = text
+        self.row = row
+        self.col = col
+        self._translations = {}
+        self._functions = None
+
+    def translate(self, row, col):
+        """Return the group's formula as it reads in the cell at ``(row, col)``."""
+        offset = (row - self.row, col - self.col)
+        formula = self._translations.get(offset)
+        if formula is None:
+            formula = self._translations[offset] = translate_formula(self.text, *offset)
+        return formula
+
+    def functions(self):
+        if self._functions is None:
+            self._functions = frozenset(function_names(strip_function_prefixes(self.text)))
+        return self._functions
+
+
+class StringPool:
+    """
+    The interned strings of one workbook: string values and formula texts are stored once
+    and referred to by their index in ``strings``.
+    """
+
+    __slots__ = ('strings', '_indexes')
+
+    def __init__(self):
+        self.strings = []
+        self._indexes = {}
+
+    def intern(self, text):
+        """Return the index of ``text``, adding it on first use."""
+        index = self._indexes.get(text)
+        if index is None:
+            index = self._indexes[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+
+# Value kinds in the order of their codes in ``Worksheet``'s kind column.
+KINDS = (NULL, NUMBER, STRING, BOOLEAN, DATE, ERROR)
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+_NULL_CODE, _NUMBER_CODE, _BOOLEAN_CODE = (_KIND_CODES[kind] for kind in (NULL, NUMBER, BOOLEAN))
+
+# Formula column entries: -1 for no formula, a pool index, or ``-2 - n`` for the nth
+# ``SharedFormula`` group of the sheet.
+_NO_FORMULA = -1
+
+
+def pack_position(row, col):
+    """Pack a 1-based ``(row, col)`` into one int ordered row-major (at most 16384 columns)."""
+    return row << 14 | col - 1
+
+
+def unpack_position(key):
+    return key >> 14, (key & 0x3FFF) + 1
+
+
+class StoredCell:
+    """
+    A cell of a ``Worksheet``, read from and written through to the sheet's columns.
+
+    It behaves like a ``Cell``: ``kind`` and ``value`` can be assigned (the formula
+    evaluator stores its results this way), and a member of a shared formula group has its
+    ``formula`` translated from the group on first access. Views of the same cell compare
+    equal. A view remembers its slot in the columns and finds it again should a cell be
+    inserted before it.
+    """
+
+    __slots__ = ('sheet', 'slot', 'key')
+
+    def __init__(self, sheet, slot, key):
+        self.sheet = sheet
+        self.slot = slot
+        self.key = key
+
+    def _locate(self):
+        # Cells are never removed, so the slot can only have moved up.
+        keys = self.sheet._keys
+        slot = self.slot
+        if keys[slot] != self.key:
+            slot = self.slot = bisect_left(keys, self.key, slot)
+        return slot
+
+    @property
+    def kind(self):
+        sheet, slot = self.sheet, self.slot
+        if sheet._keys[slot] != self.key:
+            slot = self._locate()
+        return KINDS[sheet._kinds[slot]]
+
+    @kind.setter
+    def kind(self, kind):
+        self.sheet._kinds[self._locate()] = _KIND_CODES[kind]
+
+    @property
+    def value(self):
+        return self.sheet._read_value(self._locate())
+
+    @value.setter
+    def value(self, value):
+        slot = self._locate()
+        self.sheet._write_value(slot, self.sheet._kinds[slot], value)
+
+    @property
+    def formula(self):
+        sheet, slot = self.sheet, self._locate()
+        entry = sheet._formulas[slot]
+        if entry == _NO_FORMULA:
+            return None
+        if entry >= 0:
+            return sheet.pool.strings[entry]
+        return sheet._groups[-2 - entry].translate(*unpack_position(self.key))
+
+    @property
+    def has_formula(self):
+        """Whether the cell has a formula, without expanding a shared one."""
+        sheet, slot = self.sheet, self.slot
+        if sheet._keys[slot] != self.key:
+            slot = self._locate()
+        return sheet._formulas[slot] != _NO_FORMULA
+
+    @property
+    def group(self):
+        """The cell's ``SharedFormula`` group, or None."""
+        entry = self.sheet._formulas[self._locate()]
+        return self.sheet._groups[-2 - entry] if entry < _NO_FORMULA else None
+
+    def __eq__(self, other):
+        if not isinstance(other, StoredCell):
+            return NotImplemented
+        return self.sheet is other.sheet and self.key == other.key
+
+    def __hash__(self):
+        return hash((id(self.sheet), self.key))
+
+    def __repr__(self):
+        return f'Cell({self.kind!r}, {self.value!r}, formula={self.formula!r})'
+
+
+class Worksheet:
+    """
+    The populated cells of a single sheet, addressed by 1-based ``(row, col)``.
+
+    Cells are stored in columns rather than as one object each: a sorted array of packed
+    positions (``pack_position``), searched by bisection, and parallel arrays of kind codes,
+    numbers (numbers and booleans) and indexes into the workbook's ``StringPool`` (text
+    values and formulas). A filled-down shared formula is stored as a reference to its
+    ``SharedFormula`` group. ``get_cell`` returns a ``StoredCell`` view; ``set_cell`` copies
+    a ``Cell`` in.
+
+    The reader appends cells in row-major order, which keeps the position array sorted
+    at no cost; a cell set out of order is inserted in place. Ranges are answered by
+    bisecting each row of the range, or, for ranges spanning more rows than the sheet has
+    cells, by walking a lazily built index of the populated rows, so
+    ``A:A`` or ``A:XFD`` costs the cells that exist rather than every address the range
+    covers.
+    """
+
+    __slots__ = ('name', 'pool', 'max_row', 'max_col', '_keys', '_kinds', '_numbers', '_texts',
+                 '_formulas', '_groups', '_group_indexes', '_rows')
+
+    def __init__(self, name, pool=None):
+        self.name = name
+        self.pool = pool if pool is not None else StringPool()
+        self.max_row = 0
+        self.max_col = 0
+        self._keys = array('q')
+        self._kinds = array('b')
+        self._numbers = array('d')
+        self._texts = array('i')
+        self._formulas = array('i')
+        self._groups = []
+        self._group_indexes = {}
+        self._rows = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def store(self, row, col, kind, value, formula=None):
+        """
+        Store a cell and return its ``StoredCell``. ``formula`` is the formula text, a
+        ``SharedFormula`` group or None.
+        """
+        key = pack_position(row, col)
+        keys = self._keys
+        if not keys or key > keys[-1]:
+            slot = len(keys)
+            self._append()
+        else:
+            slot = bisect_left(keys, key)
+            if keys[slot] != key:
+                self._insert(slot)
+        keys[slot] = key
+        self._write_value(slot, _KIND_CODES[kind], value)
+        self._formulas[slot] = self._formula_entry(formula)
+        if row > self.max_row:
+            self.max_row = row
+        if col > self.max_col:
+            self.max_col = col
+        return StoredCell(self, slot, key)
+
+    def _append(self):
+        self._keys.append(0)
+        self._kinds.append(_NULL_CODE)
+        self._numbers.append(0.0)
+        self._texts.append(-1)
+        self._formulas.append(_NO_FORMULA)
+        self._rows = None
+
+    def _insert(self, slot):
+        self._keys.insert(slot, 0)
+        self._kinds.insert(slot, _NULL_CODE)
+        self._numbers.insert(slot, 0.0)
+        self._texts.insert(slot, -1)
+        self._formulas.insert(slot, _NO_FORMULA)
+        self._rows = None
+
+    def _formula_entry(self, formula):
+        if formula is None:
+            return _NO_FORMULA
+        if isinstance(formula, SharedFormula):
+            index = self._group_indexes.get(formula)
+            if index is None:
+                index = self._group_indexes[formula] = len(self._groups)
+                self._groups.append(formula)
+            return -2 - index
+        return self.pool.intern(formula)
+
+    def _write_value(self, slot, code, value):
+        self._kinds[slot] = code
+        if code == _NUMBER_CODE or code == _BOOLEAN_CODE:
+            self._numbers[slot] = 0.0 if value is None else float(value)
+            self._texts[slot] = -1
+        else:
+            self._numbers[slot] = 0.0
+            self._texts[slot] = -1 if value is None else self.pool.intern(value)
+
+    def _read_value(self, slot):
+        code = self._kinds[slot]
+        if code == _NUMBER_CODE:
+            return self._numbers[slot]
+        if code == _BOOLEAN_CODE:
+            return self._numbers[slot] != 0.0
+        index = self._texts[slot]
+        return None if index < 0 else self.pool.strings[index]
+
+    def set_cell(self, row, col, cell):
+        group = getattr(cell, 'group', None)
+        self.store(row, col, cell.kind, cell.value, cell.formula if group is None else group)
+
+    def get_cell(self, row, col):
+        key = row << 14 | col - 1
+        keys = self._keys
+        slot = bisect_left(keys, key)
+        if slot < len(keys) and keys[slot] == key:
+            return StoredCell(self, slot, key)
+        return None
+
+    @property
+    def cells(self):
+        """A ``{(row, col): StoredCell}`` snapshot of the populated cells."""
+        return {unpack_position(key): StoredCell(self, slot, key)
+                for slot, key in enumerate(self._keys)}
+
+    def formula_texts(self):
+        """Return the distinct formula texts on the sheet, shared groups by their master."""
+        pool = self.pool.strings
+        texts = {pool[entry] for entry in set(self._formulas) if entry >= 0}
+        texts.update(group.text for group in self._groups)
+        return texts
+
+    def _row_index(self):
+        # The populated rows in order and, for each, the slot its cells start at.
+        if self._rows is None:
+            rows, starts, previous = array('q'), array('q'), 0
+            for slot, key in enumerate(self._keys):
+                row = key >> 14
+                if row != previous:
+                    rows.append(row)
+                    starts.append(slot)
+                    previous = row
+            starts.append(len(self._keys))
+            self._rows = (rows, starts)
+        return self._rows
+
+    def iter_range(self, reference):
+        """Yield ``(row, col, cell)`` for the populated cells inside a ``Reference``."""
+        min_row = reference.min_row or 1
+        max_row = min(reference.max_row or self.max_row, self.max_row)
+        min_col = reference.min_col or 1
+        max_col = min(reference.max_col or self.max_col, self.max_col)
+        if min_row > max_row or min_col > max_col:
+            return
+        if min_row == max_row and min_col == max_col:
+            cell = self.get_cell(min_row, min_col)
+            if cell is not None:
+                yield min_row, min_col, cell
+            return
+        keys = self._keys
+        if max_row - min_row + 1 <= len(keys):
+            spans = ((row, 0, len(keys)) for row in range(min_row, max_row + 1))
+        else:
+            rows, starts = self._row_index()
+            spans = ((rows[index], starts[index], starts[index + 1])
+                     for index in range(bisect_left(rows, min_row), bisect_right(rows, max_row)))
+        for row, low, high in spans:
+            start = bisect_left(keys, pack_position(row, min_col), low, high)
+            stop = bisect_right(keys, pack_position(row, max_col), start, high)
+            for slot in range(start, stop):
+                key = keys[slot]
+                yield row, (key & 0x3FFF) + 1, StoredCell(self, slot, key)
+
+
+class Workbook:
+    """
+    A parsed xlsx workbook: an ordered mapping of sheet name to ``Worksheet``, plus its
+    document ``properties`` (a ``DocumentProperties``, or None if not read) and the
+    uncompressed size of the worksheet parts the reader left unread (``bytes_skipped``).
+    """
+
+    __slots__ = ('sheets', 'pool', 'properties', 'bytes_skipped', '_precedent_graph',
+                 '_evaluator')
+
+    def __init__(self):
+        self.sheets = {}
+        self.pool = StringPool()
+        self.properties = None
+        self.bytes_skipped = 0
+        self._precedent_graph = None
+        self._evaluator = None
+
+    def __getstate__(self):
+        # The precedent graph and evaluator are rebuilt on demand after unpickling.
+        state = {name: getattr(self, name) for name in self.__slots__}
+        return {**state, '_precedent_graph': None, '_evaluator': None}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def precedent_graph(self):
+        """Return the workbook's ``PrecedentGraph``, built on first use and then shared."""
+        if self._precedent_graph is None:
+            self._precedent_graph = PrecedentGraph(self)
+        return self._precedent_graph
+
+    def calculate_cell(self, sheet_name, row, col):
+        """
+        Return a cell like ``get_cell``, first evaluating its formula if the file carries no
+        cached value for it (see ``formulas.FormulaEvaluator``).
+        """
+        if self._evaluator is None:
+            from .formulas import FormulaEvaluator
+            self._evaluator = FormulaEvaluator(self)
+        return self._evaluator.calculate((sheet_name, row, col))
+
+    def add_sheet(self, name):
+        sheet = Worksheet(name, self.pool)
+        self.sheets[name] = sheet
+        return sheet
+
+    def get_sheet(self, name):
+        return self.sheets.get(name)
+
+    def get_cell(self, sheet_name, row, col):
+        sheet = self.sheets.get(sheet_name)
+        if sheet is None:
+            return None
+        return sheet.get_cell(row, col)
+
+
+def safe_value(cell):
+    """
+    Return the string value a facet compares against.
+
+    Formula cells use their cached result (or the one ``Workbook.calculate_cell`` computed);
+    a formula without either yields its formula text, matching the browser grader.
+    """
+    if cell.kind == NULL:
+        if cell.formula is not None:
+            return cell.formula
+        return ''
+    if cell.kind == NUMBER:
+        return js_number_string(cell.value)
+    if cell.kind == BOOLEAN:
+        return 'true' if cell.value else 'false'
+    return str(cell.value)
@@ -0,0 +1,519 @@
+"""
+Database-backed grading queue.
+
+The grade endpoints queue a ``GradingJob`` with one ``GradingTask`` per submission and
+return at once; ``manage.py grading_worker`` processes, on any number of nodes, claim
+pending tasks in batches and grade them.
+
+Claiming selects candidate rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it (PostgreSQL), so concurrent workers skip each other's rows instead of
+queueing on them. The claim itself is a conditional ``UPDATE`` that stamps a fresh lease
+token, which keeps it safe on databases without row locks (SQLite): a row claimed by
+another worker in the meantime no longer matches and is simply not won. A task whose lease
+expires, because its worker crashed or was killed, becomes claimable again until it has
+been attempted ``GRADING_TASK_MAX_ATTEMPTS`` times.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .events import events_token
+from .grading import (
+    ResultCache, Rubric, RubricError, compile_rubric, grade_many, load_master, rubric_key,
+)
+from .grading.cache import facet_digests, submission_digest
+from .grading.mapped import local_path
+from .models import Assignment, GradingJob, GradingTask, Submission
+from .outcomes import rescore
+from .submissions import regrade, save_submissions, update_submissions
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    """Identify this process in ``GradingTask.worker``."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def master_values(assignment, compiled):
+    """
+    Return the master workbook's expected values for the rubric revision ``compiled``.
+
+    With the grading cache enabled the values are kept there, keyed by the revision and
+    the stored file, so the master is parsed once per revision rather than once per job
+    and every process sharing the cache reads the same entry. A master that could not be
+    read is not cached.
+    """
+    if not settings.GRADING_CACHE:
+        return compiled.rubric.expected_values(load_master(assignment, compiled.plan))
+    cache = caches[settings.GRADING_CACHE]
+    key = f'grading:master:{compiled.key}'
+    entry = cache.get(key)
+    if entry is not None and entry[0] == assignment.file.name:
+        return entry[1]
+    expected = compiled.rubric.expected_values(load_master(assignment, compiled.plan))
+    if expected is not None:
+        cache.set(key, (assignment.file.name, expected))
+    return expected
+
+
+def create_job(assignment, compiled, task_count):
+    """
+    Create the job for a batch of ``task_count`` submissions, before any are added.
+
+    ``compiled`` is the assignment's ``CompiledRubric``. The rubric and the master
+    workbook's expected values are snapshotted on the job, so editing the assignment while
+    it runs does not change its results.
+    """
+    return GradingJob.objects.create(
+        assignment=assignment,
+        rubric_key=compiled.key,
+        questions=assignment.questions,
+        expected=master_values(assignment, compiled),
+        max_score=compiled.max_score,
+        task_count=task_count,
+    )
+
+
+def add_tasks(job, submissions, start=0, rejected=()):
+    """
+    Queue ``(file_name, bytes)`` submissions on a job, numbered from ``start``, and return
+    how many tasks were added.
+
+    Cached submissions are finished (and saved) at once; ``rejected`` entries are failed.
+    """
+    cache = ResultCache(job.questions) if settings.GRADING_CACHE else None
+    kept = Submission._meta.get_field('file')
+    tasks, graded, index = [], [], start
+    for file_name, data in submissions:
+        task = GradingTask(job=job, index=index, file_name=file_name)
+        digest = submission_digest(data) if cache else None
+        value = cache.get(digest) if cache else None
+        if value is not None:
+            cache.hits += 1
+            task.status = GradingTask.STATUS_DONE
+            task.result = ResultCache.restore(value, file_name, job.expected)
+            task.finished_at = timezone.now()
+            # Kept for regrades, as the worker keeps the files it grades.
+            name = kept.storage.save(kept.generate_filename(None, file_name.rsplit('/', 1)[-1]),
+                                     ContentFile(data))
+            graded.append((digest, task.result, name))
+        else:
+            if cache:
+                cache.misses += 1
+            task.file.save(file_name.rsplit('/', 1)[-1], ContentFile(data), save=False)
+        tasks.append(task)
+        index += 1
+    for entry in rejected:
+        tasks.append(GradingTask(job=job, index=index, file_name=entry['file_name'],
+                                 status=GradingTask.STATUS_FAILED, error=entry['error'],
+                                 finished_at=timezone.now()))
+        index += 1
+    with transaction.atomic():
+        GradingTask.objects.bulk_create(tasks)
+        _save_graded(job, graded)
+        if cache:
+            GradingJob.objects.filter(pk=job.pk).update(
+                cache_hits=F('cache_hits') + cache.hits,
+                cache_misses=F('cache_misses') + cache.misses)
+    finish_job_if_complete(job.pk)
+    return len(tasks)
+
+
+def claim_tasks(worker, limit, lease_seconds=None):
+    """
+    Claim up to ``limit`` runnable tasks for ``worker``.
+
+    Runnable tasks are pending ones and running ones whose lease has expired. Returns the
+    claimed tasks with their jobs, all sharing one new lease token.
+    """
+    if lease_seconds is None:
+        lease_seconds = settings.GRADING_TASK_LEASE_SECONDS
+    now = timezone.now()
+    expired = Q(status=GradingTask.STATUS_RUNNING, lease_expires_at__lt=now)
+    _fail_exhausted(expired)
+    runnable = Q(status=GradingTask.STATUS_PENDING) | expired
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        candidates = GradingTask.objects.filter(runnable).order_by('created_at', 'index')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        GradingTask.objects.filter(runnable, pk__in=ids).update(
+            status=GradingTask.STATUS_RUNNING,
+            worker=worker,
+            lease_token=token,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+        tasks = list(GradingTask.objects.filter(pk__in=ids, lease_token=token)
+                     .select_related('job', 'submission').order_by('job_id', 'index'))
+        GradingJob.objects.filter(pk__in={task.job_id for task in tasks},
+                                  status=GradingJob.STATUS_PENDING).update(
+            status=GradingJob.STATUS_RUNNING)
+    return tasks
+
+
+def _fail_exhausted(expired):
+    """Give up on expired tasks that have used all their attempts."""
+    max_attempts = settings.GRADING_TASK_MAX_ATTEMPTS
+    exhausted = GradingTask.objects.filter(expired, attempts__gte=max_attempts)
+    job_ids = set(exhausted.values_list('job_id', flat=True))
+    if not job_ids:
+        return
+    exhausted.update(status=GradingTask.STATUS_FAILED, lease_token='', finished_at=Now(),
+                     error=f'Grading failed after {max_attempts} attempts')
+    for job_id in job_ids:
+        finish_job_if_complete(job_id)
+
+
+def complete_task(task, result, keep_file=False):
+    """
+    Record a claimed task's result, unless its lease has since passed to another worker.
+
+    The task's file is deleted, unless ``keep_file``: a graded file is kept as its
+    ``Submission``'s file instead. Returns True if the result was recorded.
+    """
+    failed = 'error' in result
+    updated = GradingTask.objects.filter(pk=task.pk, lease_token=task.lease_token,
+                                         status=GradingTask.STATUS_RUNNING).update(
+        status=GradingTask.STATUS_FAILED if failed else GradingTask.STATUS_DONE,
+        result=None if failed else result,
+        error=result.get('error', ''),
+        lease_expires_at=None,
+        file='',
+        finished_at=Now(),
+    )
+    if not updated:
+        return False
+    if task.file and not keep_file:
+        task.file.storage.delete(task.file.name)
+    # Checked after the update has committed, so of two workers finishing a job's last
+    # tasks at the same time at least one sees both.
+    finish_job_if_complete(task.job_id)
+    return True
+
+
+def finish_job_if_complete(job_id):
+    """Mark a job done once every one of its tasks has finished."""
+    job = GradingJob.objects.filter(pk=job_id).only('task_count').first()
+    if job is None:
+        return
+    finished = GradingTask.objects.filter(job_id=job_id,
+                                          status__in=GradingTask.FINISHED_STATUSES).count()
+    if finished >= job.task_count:
+        GradingJob.objects.filter(
+            pk=job_id, status__in=[GradingJob.STATUS_PENDING, GradingJob.STATUS_RUNNING],
+        ).update(status=GradingJob.STATUS_DONE, finished_at=timezone.now())
+
+
+def job_summary(job, results=False):
+    """Serialize a job's progress and, with ``results``, its finished submissions."""
+    tasks = GradingTask.objects.filter(job=job, status__in=GradingTask.FINISHED_STATUSES)
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'max_score': job.max_score,
+        'total': job.task_count,
+        'finished': tasks.count(),
+        'cache': {'hits': job.cache_hits, 'misses': job.cache_misses},
+        'formulas': {
+            'lookups': job.formula_lookups,
+            'evaluations': job.formula_evaluations,
+            'dedup_ratio': (round(job.formula_lookups / job.formula_evaluations, 2)
+                            if job.formula_evaluations else None),
+        },
+        'bytes_skipped': job.bytes_skipped,
+        'events_token': events_token(job),
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+    if results:
+        data['submissions'] = [task.get_result() for task in tasks.order_by('index')]
+    return data
+
+
+def fail_job(job, error):
+    """Abandon a job whose submissions could not all be queued."""
+    GradingTask.objects.filter(job=job, status=GradingTask.STATUS_PENDING).update(
+        status=GradingTask.STATUS_FAILED, error=error, finished_at=Now())
+    GradingJob.objects.filter(pk=job.pk).update(status=GradingJob.STATUS_FAILED,
+                                                finished_at=timezone.now())
+
+
+def _submission_source(task):
+    """
+    Return what ``grade_many`` reads a task's file from: its path on local storage, which
+    is memory-mapped rather than copied, or else its bytes. None if the file is missing.
+    """
+    path = local_path(task.file) if task.file else None
+    if path is not None:
+        return path if os.path.isfile(path) else None
+    try:
+        with task.file.open('rb') as source:
+            return source.read()
+    except (OSError, ValueError):
+        return None
+
+
+class Lease:
+    """
+    The lease on a batch of claimed tasks, renewed while they are graded.
+
+    ``renew`` extends the lease of the batch's running tasks once half of it has passed, so
+    a batch that takes longer to grade than one lease is not reclaimed by another worker.
+    A lease only has to cover the time between two renewals: one chunk of submissions
+    (``GRADING_CHUNK_SIZE``).
+    """
+
+    def __init__(self, tasks, seconds=None):
+        self.tokens = {task.lease_token for task in tasks}
+        self.seconds = seconds or settings.GRADING_TASK_LEASE_SECONDS
+        self.renewed = time.monotonic()
+
+    def renew(self):
+        if time.monotonic() - self.renewed < self.seconds / 2:
+            return
+        GradingTask.objects.filter(lease_token__in=self.tokens,
+                                   status=GradingTask.STATUS_RUNNING).update(
+            lease_expires_at=timezone.now() + timedelta(seconds=self.seconds))
+        self.renewed = time.monotonic()
+
+
+def process_tasks(tasks, workers=1, lease_seconds=None):
+    """
+    Grade claimed tasks, one job at a time, and record their results.
+
+    Args:
+        tasks: Tasks from ``claim_tasks``
+        workers: Worker processes to grade on (``grade_many``); 1 grades in this process
+        lease_seconds: The tasks' lease, renewed while they are graded (default
+            ``GRADING_TASK_LEASE_SECONDS``)
+    """
+    lease = Lease(tasks, lease_seconds)
+    jobs = {}
+    for task in tasks:
+        jobs.setdefault(task.job_id, (task.job, []))[1].append(task)
+    for job, job_tasks in jobs.values():
+        try:
+            rubric = compile_rubric(job.rubric_key, job.questions).rubric
+        except RubricError as exc:
+            for task in job_tasks:
+                complete_task(task, {'file_name': task.file_name, 'error': str(exc)})
+            continue
+        regrades = [task for task in job_tasks if task.submission_id]
+        if regrades:
+            _regrade_tasks(job, rubric, regrades, lease)
+        readable, submissions = [], []
+        for task in job_tasks:
+            if task.submission_id:
+                continue
+            source = _submission_source(task)
+            if source is None:
+                complete_task(task, {'file_name': task.file_name,
+                                     'error': 'Submission file is missing'})
+                continue
+            # Hashed once, here: the cache looks results up by it, and the saved
+            # ``Submission`` records it after the task's file is gone.
+            submissions.append((task.file_name, source, submission_digest(source)))
+            readable.append(task)
+        cache = ResultCache(job.questions) if settings.GRADING_CACHE else None
+        # Facets remember the outcome of every formula they have matched for this rubric
+        # revision, in this process or in each pool worker; ``stats`` counts how often.
+        stats, bytes_skipped, graded = Counter(), 0, []
+        for position, result in grade_many(job.rubric_key, job.questions, submissions,
+                                           job.expected, workers=workers, cache=cache,
+                                           stats=stats):
+            task = readable[position]
+            kept = 'error' not in result
+            if complete_task(task, result, keep_file=kept):
+                bytes_skipped += result.get('bytes_skipped', 0)
+                graded.append((submissions[position][2], result,
+                               task.file.name if kept else None))
+            lease.renew()
+        _save_graded(job, graded)
+        if stats['lookups'] or bytes_skipped:
+            GradingJob.objects.filter(pk=job.pk).update(
+                formula_lookups=F('formula_lookups') + stats['lookups'],
+                formula_evaluations=F('formula_evaluations') + stats['evaluations'],
+                bytes_skipped=F('bytes_skipped') + bytes_skipped)
+
+
+def _regrade_tasks(job, rubric, tasks, lease):
+    """Grade the stored submissions of a regrade job's tasks and replace their results."""
+    regraded = []
+    for task, result in regrade(job, rubric, tasks):
+        if complete_task(task, result) and 'error' not in result:
+            regraded.append((task.submission, result))
+        lease.renew()
+    if not regraded:
+        return
+    with transaction.atomic():
+        current = _has_current_rubric(job)
+        if current:
+            update_submissions(job, regraded)
+    if not current:
+        # A newer regrade covers these, or they are queued again below.
+        requeue_submissions(job.assignment_id, [submission for submission, _ in regraded])
+
+
+def _has_current_rubric(job):
+    """
+    Lock the job's assignment row until the end of the transaction and report whether the
+    job graded the assignment's current rubric.
+    """
+    assignment = (Assignment.objects.select_for_update().only('pk', 'updated_at')
+                  .filter(pk=job.assignment_id).first())
+    return assignment is not None and rubric_key(assignment) == job.rubric_key
+
+
+def _save_graded(job, graded):
+    """
+    Save a chunk of a job's results (``save_submissions``), and queue a regrade of them if
+    the assignment's rubric changed while they were being graded.
+    """
+    with transaction.atomic():
+        current = _has_current_rubric(job)
+        saved = save_submissions(job, graded)
+    if not current:
+        requeue_submissions(job.assignment_id, saved)
+
+
+def _queue_regrade_tasks(assignment, submissions):
+    try:
+        compiled = compile_rubric(rubric_key(assignment), assignment.questions)
+    except RubricError:
+        return None
+    job = create_job(assignment, compiled, len(submissions))
+    GradingTask.objects.bulk_create([
+        GradingTask(job=job, index=index, file_name=submission.file_name, submission=submission)
+        for index, submission in enumerate(submissions)
+    ])
+    return job
+
+
+def queue_regrade(assignment):
+    """
+    Queue a regrade of an assignment's stored submissions after its rubric or master changed.
+
+    Each graded ``Submission`` gets a task; workers evaluate only the facets whose
+    ``facet_digest`` has no stored result and reuse the rest. Unfinished regrades of earlier
+    rubrics are failed, as this one covers all of their submissions. Returns the job, or
+    None if there is nothing to regrade or the new rubric cannot be compiled.
+    """
+    submissions = list(assignment.submissions.filter(score__isnull=False)
+                       .only('pk', 'file_name'))
+    if not submissions:
+        return None
+    job = _queue_regrade_tasks(assignment, submissions)
+    if job is None:
+        return None
+    superseded = (GradingJob.objects.filter(
+        assignment=assignment, tasks__submission__isnull=False,
+        status__in=[GradingJob.STATUS_PENDING, GradingJob.STATUS_RUNNING])
+        .exclude(rubric_key=job.rubric_key).distinct())
+    for old in superseded:
+        fail_job(old, 'Superseded by a newer regrade')
+    return job
+
+
+def requeue_submissions(assignment_id, submissions):
+    """
+    Queue a regrade, under the assignment's current rubric, of graded submissions whose
+    results came from an earlier one and that no job of the current rubric has a task for.
+    Returns the job, or None if there is nothing to queue.
+    """
+    assignment = Assignment.objects.filter(pk=assignment_id).first()
+    if assignment is None:
+        return None
+    covered = set(GradingTask.objects.filter(
+        job__rubric_key=rubric_key(assignment), submission__in=submissions,
+    ).values_list('submission_id', flat=True))
+    submissions = [submission for submission in submissions
+                   if submission.score is not None and submission.pk not in covered]
+    if not submissions:
+        return None
+    return _queue_regrade_tasks(assignment, submissions)
+
+
+def _facet_counts(questions):
+    return [len(question.get('facets') or []) if isinstance(question, dict) else 0
+            for question in questions or []]
+
+
+def refresh_results(assignment, questions, master):
+    """
+    Bring an assignment's stored results up to date after it was edited.
+
+    ``questions`` and ``master`` are its rubric and master file name before the edit. A
+    change to facets or to the master queues a regrade (``queue_regrade``); a change to
+    facets' points alone rescores the stored outcomes (``outcomes.rescore``) in place.
+    """
+    if facet_digests(assignment.questions) != facet_digests(questions) \
+            or _facet_counts(assignment.questions) != _facet_counts(questions) \
+            or assignment.file.name != master:
+        queue_regrade(assignment)
+        return
+    try:
+        rubric, previous = Rubric(assignment.questions), Rubric(questions)
+    except RubricError:
+        return
+    if any(facet.get_max_score() != old.get_max_score()
+           for facet, old in zip(rubric.facets(), previous.facets())) \
+            and not rescore(assignment, rubric, previous):
+        queue_regrade(assignment)
+
+
+def run_worker(worker=None, batch_size=None, lease_seconds=None, poll_interval=1.0,
+               once=False, workers=None):
+    """
+    Claim and grade tasks until stopped.
+
+    Args:
+        worker: Name recorded on claimed tasks (default ``host:pid``)
+        batch_size: Tasks claimed at a time (default ``GRADING_CHUNK_SIZE`` per worker
+            process)
+        lease_seconds: Lease on each claimed batch (default ``GRADING_TASK_LEASE_SECONDS``)
+        poll_interval: Seconds to sleep when the queue is empty
+        once: Return as soon as the queue is empty instead of polling
+        workers: Processes a claimed batch is graded on (default ``GRADING_WORKERS``)
+
+    Returns:
+        int: The number of tasks processed
+    """
+    worker = worker or worker_name()
+    workers = max(1, settings.GRADING_WORKERS if workers is None else workers)
+    batch_size = batch_size or settings.GRADING_CHUNK_SIZE * workers
+    processed = 0
+    while True:
+        tasks = claim_tasks(worker, batch_size, lease_seconds)
+        if not tasks:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        logger.info('%s claimed %d grading tasks', worker, len(tasks))
+        try:
+            process_tasks(tasks, workers, lease_seconds)
+        except Exception:
+            # The batch's leases run out and its tasks are retried, up to
+            # ``GRADING_TASK_MAX_ATTEMPTS`` times; the pause keeps a failing batch from
+            # spinning.
+            logger.exception('%s failed to grade %d tasks', worker, len(tasks))
+            time.sleep(poll_interval)
+            continue
+        processed += len(tasks)
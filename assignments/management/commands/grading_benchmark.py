@@ -0,0 +1,31 @@
+import inspect
+
+from django.core.management.base import BaseCommand
+
+from assignments.grading.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Run a grading engine benchmark on a synthetic corpus and print the results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--submissions', type=int, help='Number of synthetic submissions')
+        parser.add_argument('--rows', type=int, help='Data rows per synthetic workbook')
+        parser.add_argument('--workers', type=lambda value: [int(v) for v in value.split(',')],
+                            help='Comma-separated worker counts, e.g. 1,2,4,8')
+        parser.add_argument('--chunk-size', type=int, help='Submissions per worker task')
+
+    def handle(self, *args, **options):
+        suite = SUITES[options['suite']]
+        accepted = inspect.signature(suite).parameters
+        kwargs = {name: value for name, value in options.items()
+                  if name in accepted and value is not None}
+        rows = suite(**kwargs)
+        if not rows:
+            return
+        headers = list(rows[0])
+        widths = [max(len(str(h)), *(len(str(row[h])) for row in rows)) for h in headers]
+        self.stdout.write('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[h]).rjust(w) for h, w in zip(headers, widths)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from assignments.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Claim and grade queued grading tasks. Run any number of these, on any number of nodes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Tasks claimed at a time')
+        parser.add_argument('--lease', type=int, help='Seconds a claimed batch is leased for')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of waiting for work')
+        parser.add_argument('--name', help='Worker name recorded on claimed tasks')
+        parser.add_argument('--workers', type=int,
+                            help='Processes each claimed batch is graded on '
+                                 '(default GRADING_WORKERS)')
+
+    def handle(self, *args, **options):
+        processed = run_worker(worker=options['name'], batch_size=options['batch_size'],
+                               lease_seconds=options['lease'],
+                               poll_interval=options['poll_interval'], once=options['once'],
+                               workers=options['workers'])
+        self.stdout.write(f'Processed {processed} grading tasks')
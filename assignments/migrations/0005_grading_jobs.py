@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0004_rename_data_assignment_questions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('rubric_key', models.CharField(max_length=100)),
+                ('questions', models.JSONField(default=list)),
+                ('expected', models.JSONField(blank=True, null=True)),
+                ('max_score', models.FloatField(default=0)),
+                ('task_count', models.PositiveIntegerField(default=0)),
+                ('cache_hits', models.PositiveIntegerField(default=0)),
+                ('cache_misses', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_jobs', to='assignments.assignment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradingTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('file', models.FileField(blank=True, upload_to='grading/')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('lease_token', models.CharField(blank=True, max_length=32)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='assignments.gradingjob')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='grading_task_queue_idx'), models.Index(condition=models.Q(('status', 'running')), fields=['lease_expires_at'], name='grading_task_lease_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='gradingtask',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='unique_grading_task_index'),
+        ),
+    ]
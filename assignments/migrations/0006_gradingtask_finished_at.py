@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0005_grading_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradingtask',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='gradingtask',
+            index=models.Index(fields=['job', 'finished_at'], name='grading_task_finished_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0007_grading_job_formula_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradingjob',
+            name='bytes_skipped',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
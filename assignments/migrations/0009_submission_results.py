@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0008_grading_job_bytes_skipped'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('max_score', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='assignments.assignment')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='submissions', to='assignments.gradingjob')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacetResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.PositiveIntegerField()),
+                ('facet', models.PositiveIntegerField()),
+                ('type', models.CharField(max_length=50)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('score', models.FloatField(default=0)),
+                ('max_score', models.FloatField(default=0)),
+                ('outcome', models.CharField(max_length=10)),
+                ('provided_value', models.JSONField(blank=True, null=True)),
+                ('expected_value', models.JSONField(blank=True, null=True)),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_results', to='assignments.submission')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', 'score'], name='submission_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', 'file_hash'], name='submission_hash_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='facetresult',
+            constraint=models.UniqueConstraint(fields=('submission', 'question', 'facet'), name='unique_facet_result'),
+        ),
+    ]
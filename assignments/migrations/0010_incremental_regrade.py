@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0009_submission_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facetresult',
+            name='facet_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='gradingtask',
+            name='submission',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='regrade_tasks', to='assignments.submission'),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='file',
+            field=models.FileField(blank=True, upload_to='submissions/'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0010_incremental_regrade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutcomeMatrix',
+            fields=[
+                ('assignment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='outcome_matrix', serialize=False, to='assignments.assignment')),
+                ('file', models.FileField(upload_to='outcomes/')),
+                ('submissions', models.JSONField(default=list)),
+                ('facets', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
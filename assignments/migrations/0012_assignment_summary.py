@@ -0,0 +1,126 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:06
+
+import re
+
+from django.db import migrations, models
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# A frozen copy of ``rubric_counts`` and the facets' ``is_valid`` rules as of this migration,
+# so that later changes to the grading engine do not change what it computes.
+
+REGEX_REPETITION_LIMIT = 25
+
+NAMED_GROUP_PATTERN = re.compile(r'(?<!\\)\(\?<(?![=!])')
+NAMED_BACKREFERENCE_PATTERN = re.compile(r'\\k<([A-Za-z_][A-Za-z0-9_]*)>')
+
+
+def _walk_pattern(pattern, star_height, counter):
+    for op, av in pattern:
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                  getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            counter[0] += 1
+            height = star_height + (1 if av[1] == sre_parse.MAXREPEAT else 0)
+            if height > 1 or counter[0] > REGEX_REPETITION_LIMIT:
+                return False
+            if not _walk_pattern(av[2], height, counter):
+                return False
+            continue
+        for child in (av if isinstance(av, (list, tuple)) else (av,)):
+            children = child if isinstance(child, list) else [child]
+            for item in children:
+                if isinstance(item, sre_parse.SubPattern) and not _walk_pattern(
+                        item, star_height, counter):
+                    return False
+    return True
+
+
+def _is_safe_expression(expression):
+    expression = NAMED_GROUP_PATTERN.sub('(?P<', expression)
+    expression = NAMED_BACKREFERENCE_PATTERN.sub(r'(?P=\1)', expression)
+    try:
+        parsed = sre_parse.parse(expression)
+    except (re.error, RecursionError):
+        return False
+    return _walk_pattern(parsed, 0, [0])
+
+
+def _is_valid_formulas(data):
+    formulas = data.get('formulas')
+    return isinstance(formulas, (list, str)) and len(formulas) > 0
+
+
+FACET_RULES = {
+    'ValueFacet': lambda data: data.get('value') is not None,
+    'ValueRangeFacet': lambda data: (data.get('lowerBounds') is not None
+                                     and data.get('upperBounds') is not None),
+    'ValueLengthFacet': lambda data: (data.get('minLength') is not None
+                                      or data.get('maxLength') is not None),
+    'FormulaContainsFacet': lambda data: data.get('formula') is not None,
+    'FormulaRegexFacet': lambda data: (bool(data.get('expression'))
+                                       and _is_safe_expression(str(data['expression']))),
+    'FormulaListFacet': _is_valid_formulas,
+}
+
+
+def _is_valid_facet(data):
+    if not isinstance(data, dict) or data.get('targetCell') is None:
+        return False
+    rule = FACET_RULES.get(data.get('type'))
+    return rule is not None and rule(data)
+
+
+def rubric_counts(questions):
+    if not isinstance(questions, list):
+        return 0, 0, 0
+    facet_count = invalid = 0
+    for question in questions:
+        facets = question.get('facets') if isinstance(question, dict) else None
+        if not isinstance(facets, list):
+            continue
+        facet_count += len(facets)
+        invalid += sum(not _is_valid_facet(data) for data in facets)
+    return len(questions), facet_count, invalid
+
+
+def count_questions(apps, schema_editor):
+    # ``update`` rather than ``save``, which would touch ``updated_at``.
+    Assignment = apps.get_model('assignments', 'Assignment')
+    for pk, questions in Assignment.objects.values_list('pk', 'questions').iterator():
+        question_count, facet_count, invalid_facet_count = rubric_counts(questions)
+        Assignment.objects.filter(pk=pk).update(question_count=question_count,
+                                                facet_count=facet_count,
+                                                invalid_facet_count=invalid_facet_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assignments', '0011_outcome_matrix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='facet_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='invalid_facet_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['owner', 'updated_at'], name='assignment_owner_updated_idx'),
+        ),
+        migrations.RunPython(count_questions, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.db.models import Q
 from rest_framework.exceptions import ValidationError
 
 
@@ -19,7 +20,181 @@ class Assignment(models.Model):
 	file = models.FileField(upload_to='', validators=[validate_file_extension])
 	encrypted = models.BooleanField(default=False)
 	questions = models.JSONField(default=list, blank=True)
+	# Summary of ``questions`` for listing assignments without loading them; kept up to date
+	# by ``save``.
+	question_count = models.PositiveIntegerField(default=0)
+	facet_count = models.PositiveIntegerField(default=0)
+	invalid_facet_count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['owner', 'updated_at'], name='assignment_owner_updated_idx'),
+		]
+
+	def save(self, *args, **kwargs):
+		from .grading.engine import rubric_counts
+
+		self.question_count, self.facet_count, self.invalid_facet_count = \
+			rubric_counts(self.questions)
+		super().save(*args, **kwargs)
 
 	def __str__(self):
 		return self.name
 
+
+class GradingJob(models.Model):
+	"""A batch of submissions graded in the background by ``manage.py grading_worker``."""
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE = 'done'
+	STATUS_FAILED = 'failed'
+	STATUS_CHOICES = [
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_RUNNING, 'Running'),
+		(STATUS_DONE, 'Done'),
+		(STATUS_FAILED, 'Failed'),
+	]
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	assignment = models.ForeignKey(Assignment, related_name='grading_jobs', on_delete=models.CASCADE)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	# The rubric as it was when the job was queued, so later edits do not change its results.
+	rubric_key = models.CharField(max_length=100)
+	questions = models.JSONField(default=list)
+	expected = models.JSONField(null=True, blank=True)
+	max_score = models.FloatField(default=0)
+	task_count = models.PositiveIntegerField(default=0)
+	cache_hits = models.PositiveIntegerField(default=0)
+	cache_misses = models.PositiveIntegerField(default=0)
+	# Formula-matching facet outcomes graded, and those actually computed rather than
+	# remembered from an identical formula earlier in the job.
+	formula_lookups = models.PositiveIntegerField(default=0)
+	formula_evaluations = models.PositiveIntegerField(default=0)
+	# Uncompressed bytes of submission worksheets the rubric never needed to read.
+	bytes_skipped = models.PositiveBigIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	def __str__(self):
+		return f'{self.assignment} - {self.status}'
+
+
+class GradingTask(models.Model):
+	"""One submission of a ``GradingJob``, claimed by a worker under a time-limited lease."""
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE = 'done'
+	STATUS_FAILED = 'failed'
+	STATUS_CHOICES = GradingJob.STATUS_CHOICES
+	FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+	job = models.ForeignKey(GradingJob, related_name='tasks', on_delete=models.CASCADE)
+	index = models.PositiveIntegerField()
+	file_name = models.CharField(max_length=255)
+	file = models.FileField(upload_to='grading/', blank=True)
+	# Set on the tasks of a regrade: the stored submission to grade again.
+	submission = models.ForeignKey('Submission', related_name='regrade_tasks', null=True,
+	                               blank=True, on_delete=models.CASCADE)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	worker = models.CharField(max_length=100, blank=True)
+	lease_token = models.CharField(max_length=32, blank=True)
+	lease_expires_at = models.DateTimeField(null=True, blank=True)
+	result = models.JSONField(null=True, blank=True)
+	error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	# Set by the database when the task finishes; progress streams page through it.
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['job', 'index'], name='unique_grading_task_index'),
+		]
+		indexes = [
+			models.Index(fields=['status', 'created_at'], name='grading_task_queue_idx'),
+			models.Index(fields=['lease_expires_at'], name='grading_task_lease_idx',
+			             condition=Q(status='running')),
+			models.Index(fields=['job', 'finished_at'], name='grading_task_finished_idx'),
+		]
+
+	def get_result(self):
+		"""The task's ``grade_file`` result, or an ``error`` entry if it could not be graded."""
+		if self.status == self.STATUS_DONE and self.result is not None:
+			return self.result
+		return {'file_name': self.file_name, 'error': self.error or 'Not graded yet'}
+
+	def __str__(self):
+		return f'{self.file_name} - {self.status}'
+
+
+class Submission(models.Model):
+	"""A graded submission file, kept after its grading job so results need not be recomputed."""
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	assignment = models.ForeignKey(Assignment, related_name='submissions', on_delete=models.CASCADE)
+	job = models.ForeignKey(GradingJob, related_name='submissions', null=True, blank=True,
+	                        on_delete=models.SET_NULL)
+	file_name = models.CharField(max_length=255)
+	# SHA-256 of the file's contents, as ``grading.cache.submission_digest`` computes it.
+	file_hash = models.CharField(max_length=64)
+	# The graded file, kept so that edits to the rubric can be regraded; blank if unreadable.
+	file = models.FileField(upload_to='submissions/', blank=True)
+	# None if the file could not be graded; ``error`` says why.
+	score = models.FloatField(null=True, blank=True)
+	max_score = models.FloatField(default=0)
+	error = models.TextField(blank=True)
+	metadata = models.JSONField(default=dict, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['assignment', 'score'], name='submission_score_idx'),
+			models.Index(fields=['assignment', 'file_hash'], name='submission_hash_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.file_name} - {self.score}'
+
+
+class FacetResult(models.Model):
+	"""The outcome of one rubric facet for a ``Submission``, from ``Rubric.grade``'s responses."""
+	submission = models.ForeignKey(Submission, related_name='facet_results', on_delete=models.CASCADE)
+	question = models.PositiveIntegerField()
+	facet = models.PositiveIntegerField()
+	# The facet's ``grading.cache.facet_digest``: a regrade reuses results whose facet is unchanged.
+	facet_hash = models.CharField(max_length=64, blank=True)
+	type = models.CharField(max_length=50)
+	name = models.CharField(max_length=255, blank=True)
+	score = models.FloatField(default=0)
+	max_score = models.FloatField(default=0)
+	outcome = models.CharField(max_length=10)
+	provided_value = models.JSONField(null=True, blank=True)
+	expected_value = models.JSONField(null=True, blank=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['submission', 'question', 'facet'],
+			                        name='unique_facet_result'),
+		]
+
+	def __str__(self):
+		return f'{self.submission} - {self.question}.{self.facet}'
+
+
+class OutcomeMatrix(models.Model):
+	"""
+	Which facets every graded ``Submission`` of an assignment passed, as a NumPy array saved
+	in ``.npy`` format: one ``int8`` row per submission, one column per facet digest; 1 passed,
+	0 failed, -1 unknown (``outcomes.UNKNOWN``). Rebuilt from the ``FacetResult`` rows when they
+	change.
+	"""
+	assignment = models.OneToOneField(Assignment, related_name='outcome_matrix', primary_key=True,
+	                                  on_delete=models.CASCADE)
+	file = models.FileField(upload_to='outcomes/')
+	# Row labels: ``Submission`` ids, in row order.
+	submissions = models.JSONField(default=list)
+	# Column labels: ``grading.cache.facet_digest`` values, in column order.
+	facets = models.JSONField(default=list)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f'{self.assignment} - {len(self.submissions)}x{len(self.facets)}'
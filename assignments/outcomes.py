@@ -0,0 +1,220 @@
+"""
+Rescoring graded submissions from a stored pass/fail matrix.
+
+Every facet scores all or nothing, so an edit that changes only facets' points changes no
+facet's outcome. An assignment's ``OutcomeMatrix`` keeps which facets each graded
+``Submission`` passed as one submissions x facet digests array, saved in NumPy's ``.npy``
+format next to the submission files. New totals are then a single matrix-vector product
+with the facets' new points: no workbook is read and no facet evaluated, whether the new
+scores are saved (``rescore``) or only previewed (``preview_rescore``).
+
+The matrix is built from the ``FacetResult`` rows on first use and discarded whenever
+grading or a regrade changes them.
+"""
+import io
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from .grading.cache import facet_digests
+from .grading.engine import OUTCOME_TIMEOUT
+from .grading.mapped import open_stored
+from .models import FacetResult, OutcomeMatrix, Submission
+
+PASSED, FAILED, UNKNOWN = 1, 0, -1
+
+# Bars of the preview's score histogram, spanning 0 to the rubric's maximum score.
+HISTOGRAM_BINS = 10
+
+
+def passed(row, facet=None):
+    """
+    Whether a stored ``FacetResult`` passed, or None if that is unknown.
+
+    Facets score all or nothing, so a result passed if it earned its points. A search that
+    timed out did not decide anything, and a facet worth no points scores 0 either way:
+    their outcome is unknown, unless ``facet`` (the facet now) is worth none and it makes no
+    difference.
+    """
+    if row is None:
+        return None
+    if row.outcome == OUTCOME_TIMEOUT:
+        return False if facet is not None and not facet.get_max_score() else None
+    if row.max_score:
+        return row.score == row.max_score
+    return False if facet is not None and not facet.get_max_score() else None
+
+
+class Outcomes:
+    """
+    An assignment's outcome matrix.
+
+    Attributes:
+        submissions: ``Submission`` ids, one per row
+        facets: Facet digests, one per column
+        matrix: ``int8`` array of ``PASSED``, ``FAILED`` or ``UNKNOWN``
+    """
+
+    def __init__(self, submissions, facets, matrix):
+        self.submissions = submissions
+        self.facets = facets
+        self.matrix = matrix
+
+    def weights(self, questions, rubric):
+        """
+        Return each column's points under a rubric, and the positions (in facet order) of
+        the rubric's facets that cannot be scored from the matrix: new or changed facets,
+        and facets given points whose stored outcome is unknown.
+        """
+        columns = {digest: index for index, digest in enumerate(self.facets)}
+        weights = np.zeros(len(self.facets))
+        unscored = []
+        for position, (digest, facet) in enumerate(zip(facet_digests(questions),
+                                                        rubric.facets())):
+            points = facet.get_max_score()
+            column = columns.get(digest)
+            if column is None or (points and (self.matrix[:, column] == UNKNOWN).any()):
+                if points:
+                    unscored.append(position)
+                continue
+            weights[column] += points
+        return weights, unscored
+
+    def totals(self, weights):
+        """Every row's total score under ``weights``; unknown outcomes count as failed."""
+        return (self.matrix == PASSED) @ weights
+
+
+def build_outcomes(assignment):
+    """Build an assignment's ``Outcomes`` from its graded submissions' ``FacetResult`` rows."""
+    submissions = [str(pk) for pk in Submission.objects.filter(
+        assignment=assignment, score__isnull=False).order_by('created_at', 'pk')
+        .values_list('pk', flat=True)]
+    rows = list(FacetResult.objects.filter(submission__assignment=assignment,
+                                           submission__score__isnull=False)
+                .values_list('submission_id', 'facet_hash', 'score', 'max_score', 'outcome'))
+    facets = sorted({row[1] for row in rows})
+    row_index = {pk: index for index, pk in enumerate(submissions)}
+    column_index = {facet_hash: index for index, facet_hash in enumerate(facets)}
+    matrix = np.full((len(submissions), len(facets)), UNKNOWN, dtype=np.int8)
+    if rows:
+        pks, hashes, scores, max_scores, results = zip(*rows)
+        scores, max_scores = np.array(scores), np.array(max_scores)
+        known = (max_scores != 0) & (np.array(results) != OUTCOME_TIMEOUT)
+        matrix[[row_index[str(pk)] for pk in pks], [column_index[h] for h in hashes]] = \
+            np.where(known, np.where(scores == max_scores, PASSED, FAILED), UNKNOWN)
+    return Outcomes(submissions, facets, matrix)
+
+
+def outcome_matrix(assignment):
+    """Return an assignment's ``Outcomes``, loading the stored matrix or building it."""
+    stored = OutcomeMatrix.objects.filter(assignment=assignment).first()
+    if stored is not None:
+        try:
+            with open_stored(stored.file) as source:
+                matrix = np.load(source, allow_pickle=False)
+            return Outcomes(stored.submissions, stored.facets, matrix)
+        except (OSError, ValueError):
+            discard_outcomes(assignment.pk)
+    outcomes = build_outcomes(assignment)
+    buffer = io.BytesIO()
+    np.save(buffer, outcomes.matrix, allow_pickle=False)
+    stored = OutcomeMatrix(assignment=assignment, submissions=outcomes.submissions,
+                           facets=outcomes.facets)
+    stored.file.save(f'{assignment.pk}.npy', ContentFile(buffer.getvalue()), save=False)
+    stored.save()
+    return outcomes
+
+
+def discard_outcomes(assignment_id):
+    """Delete an assignment's stored matrix, once its ``FacetResult`` rows have changed."""
+    for stored in OutcomeMatrix.objects.filter(assignment_id=assignment_id):
+        stored.file.delete(save=False)
+        stored.delete()
+
+
+def preview_rescore(assignment, questions, rubric):
+    """
+    Score an assignment's graded submissions under ``questions`` without saving anything.
+
+    Args:
+        assignment: The ``Assignment``
+        questions: Candidate ``Assignment.questions``, differing from the graded rubric in
+            facets' points
+        rubric: The candidate's ``Rubric``
+
+    Returns:
+        dict: ``max_score``; per-submission ``score`` and ``previous_score``; a
+        ``histogram`` of the new scores (``HISTOGRAM_BINS`` bars from 0 to ``max_score``,
+        with their ``edges``); and ``unscored``, the facets (``question``, ``facet``) that
+        need a regrade and counted as failed
+    """
+    outcomes = outcome_matrix(assignment)
+    weights, unscored = outcomes.weights(questions, rubric)
+    totals = outcomes.totals(weights)
+    max_score = rubric.get_max_score()
+    counts, edges = np.histogram(totals, bins=HISTOGRAM_BINS,
+                                 range=(0, max_score) if max_score > 0 else (0, 1))
+    stored = {str(submission.pk): submission for submission in
+              Submission.objects.filter(pk__in=outcomes.submissions).only('file_name', 'score')}
+    layout = _layout(rubric)
+    return {
+        'max_score': max_score,
+        'count': len(outcomes.submissions),
+        'submissions': [{
+            'id': pk,
+            'file_name': stored[pk].file_name,
+            'score': float(total),
+            'previous_score': stored[pk].score,
+        } for pk, total in zip(outcomes.submissions, totals)],
+        'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+        'unscored': [{'question': layout[position][0], 'facet': layout[position][1]}
+                     for position in unscored],
+    }
+
+
+def _layout(rubric):
+    """``(question, facet)`` indexes of a rubric's facets, in facet order."""
+    return [(question_index, facet_index)
+            for question_index, question in enumerate(rubric.questions)
+            for facet_index in range(len(question.facets))]
+
+
+def rescore(assignment, rubric, previous):
+    """
+    Save the scores of an assignment whose facets' points changed, and nothing else.
+
+    ``rubric`` and ``previous`` are the ``Rubric`` after and before the edit, with the same
+    facet digests in the same places. Returns False without saving if a facet given points
+    has no known outcome (it was graded worth none), in which case the submissions need
+    ``queue_regrade`` instead.
+    """
+    outcomes = outcome_matrix(assignment)
+    weights, unscored = outcomes.weights(assignment.questions, rubric)
+    if unscored:
+        return False
+    totals = outcomes.totals(weights)
+    max_score = rubric.get_max_score()
+    columns = {digest: index for index, digest in enumerate(outcomes.facets)}
+    changed = [(question_index, facet_index, facet.get_max_score(), columns[digest])
+               for (question_index, facet_index), digest, facet, old in zip(
+                   _layout(rubric), facet_digests(assignment.questions), rubric.facets(),
+                   previous.facets())
+               if facet.get_max_score() != old.get_max_score()]
+    with transaction.atomic():
+        Submission.objects.bulk_update(
+            [Submission(pk=pk, score=float(total), max_score=max_score)
+             for pk, total in zip(outcomes.submissions, totals)], ['score', 'max_score'])
+        for question_index, facet_index, points, column in changed:
+            # Outcomes come from the matrix: a stored score of 0 out of 0 does not say.
+            passing = [outcomes.submissions[row]
+                       for row in np.flatnonzero(outcomes.matrix[:, column] == PASSED)]
+            FacetResult.objects.filter(
+                submission__assignment=assignment, submission__score__isnull=False,
+                question=question_index, facet=facet_index,
+            ).update(score=Case(When(submission_id__in=passing, then=Value(float(points))),
+                                default=Value(0.0)),
+                     max_score=points)
+    return True
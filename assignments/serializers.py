@@ -2,24 +2,52 @@ import time
 import uuid
 
 from rest_framework import serializers
+from .grading import evict_rubrics
+from .jobs import refresh_results
 from .models import Assignment
 
+# Everything but ``questions``, which list queries defer.
+SUMMARY_FIELDS = ('uuid', 'name', 'file', 'created_at', 'updated_at', 'encrypted',
+                  'question_count', 'facet_count', 'invalid_facet_count')
+
 
 class AssignmentSerializer(serializers.ModelSerializer):
+    """An assignment with its rubric; ``fields`` limits the fields serialized."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Assignment
-        fields = ('uuid', 'name', 'file', 'created_at', 'updated_at', 'encrypted', 'questions')
-        read_only_fields = ('uuid', 'created_at', 'updated_at')
+        fields = ('uuid', 'name', 'file', 'created_at', 'updated_at', 'encrypted', 'questions',
+                  'question_count', 'facet_count', 'invalid_facet_count')
+        read_only_fields = ('uuid', 'created_at', 'updated_at', 'question_count', 'facet_count',
+                            'invalid_facet_count')
 
     def create(self, validated_data):
         return Assignment.objects.create(uuid=uuid.uuid4(), created_at=time.time(),
                                          updated_at=time.time(), **validated_data)
 
     def update(self, instance, validated_data):
+        questions, master = instance.questions, instance.file.name
         instance.name = validated_data.get('name', instance.name)
         instance.file = validated_data.get('file', instance.file)
         instance.encrypted = validated_data.get('encrypted', instance.encrypted)
         instance.questions = validated_data.get('questions', instance.questions)
         instance.updated_at = time.time()
         instance.save()
+        evict_rubrics(instance.pk)
+        refresh_results(instance, questions, master)
         return instance
+
+
+class AssignmentSummarySerializer(serializers.ModelSerializer):
+    """An assignment as listed: its rubric is summarized by counts and only ``retrieve`` returns it."""
+
+    class Meta:
+        model = Assignment
+        fields = SUMMARY_FIELDS
+        read_only_fields = SUMMARY_FIELDS
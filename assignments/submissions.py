@@ -0,0 +1,197 @@
+"""
+Persisted grading results and incremental regrades.
+
+Every graded file is saved as a ``Submission`` with one ``FacetResult`` per rubric facet, so
+an assignment's results outlive the grading job (and the browser session) that produced
+them. Results are written a chunk at a time: one transaction per chunk holding two
+``bulk_create`` calls, one for the submissions and one for all of their facet results, so
+a thousand submissions of forty facets cost a handful of queries rather than forty
+thousand inserts.
+
+Each facet result records its facet's ``facet_digest``. When the rubric is edited, a
+regrade grades a stored submission again only for the facets whose digest has no stored
+result (added or changed facets) and reuses the rest; the cells those facets need come
+from the submission's parsed workbook in the grading cache (``cached_workbook``) rather
+than from the xlsx file where possible.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .grading.cache import cached_workbook, facet_digests
+from .grading.exceptions import WorkbookError
+from .grading.mapped import open_stored
+from .grading.reader import load_workbook
+from .models import FacetResult, Submission
+from .outcomes import discard_outcomes, passed
+
+
+def _facet_results(submission, result, hashes):
+    return [
+        FacetResult(
+            submission=submission,
+            question=response['question'],
+            facet=response['facet'],
+            facet_hash=hashes[position] if position < len(hashes) else '',
+            type=response['type'],
+            name=response.get('name') or '',
+            score=response['score'],
+            max_score=response['max_score'],
+            outcome=response.get('outcome', ''),
+            provided_value=response.get('provided_value'),
+            expected_value=response.get('expected_value'),
+        )
+        for position, response in enumerate(result.get('responses', ()))
+    ]
+
+
+def build_submission(job, file_hash, result, file='', hashes=()):
+    """
+    Return the unsaved ``Submission`` and ``FacetResult`` rows for a ``grade_file`` result.
+
+    ``file`` is the storage name of the graded file and ``hashes`` the rubric's
+    ``facet_digests``, in facet order like the result's responses.
+    """
+    submission = Submission(
+        assignment_id=job.assignment_id,
+        job_id=job.pk,
+        file_name=result.get('file_name', ''),
+        file_hash=file_hash,
+        file=file or '',
+        score=result.get('score'),
+        max_score=result.get('max_score') or 0,
+        error=result.get('error', ''),
+        metadata=result.get('metadata') or {},
+    )
+    return submission, _facet_results(submission, result, hashes)
+
+
+def save_submissions(job, graded, batch_size=None):
+    """
+    Persist a chunk of a grading job's ``grade_file`` results, in one transaction.
+
+    Args:
+        job: The ``GradingJob`` that graded them
+        graded: ``(file_hash, result, file)`` triples, in order; ``file`` is the storage
+            name of the graded file, kept for regrades, or None
+        batch_size: Rows per insert (default ``GRADING_RESULTS_BATCH_SIZE``); the database
+            may lower it to fit its limit on query parameters
+
+    Returns:
+        list: The saved ``Submission`` objects
+    """
+    batch_size = batch_size or settings.GRADING_RESULTS_BATCH_SIZE
+    hashes = facet_digests(job.questions)
+    submissions, facet_results = [], []
+    for file_hash, result, file in graded:
+        submission, rows = build_submission(job, file_hash, result, file, hashes)
+        submissions.append(submission)
+        facet_results.extend(rows)
+    if not submissions:
+        return []
+    with transaction.atomic():
+        Submission.objects.bulk_create(submissions, batch_size=batch_size)
+        FacetResult.objects.bulk_create(facet_results, batch_size=batch_size)
+        discard_outcomes(job.assignment_id)
+    return submissions
+
+
+def _load_stored(submission, plan):
+    if not submission.file:
+        raise OSError('Submission file is missing')
+    with open_stored(submission.file) as source:
+        return load_workbook(source, plan)
+
+
+def regrade(job, rubric, tasks):
+    """
+    Grade the stored submissions of regrade tasks under the job's rubric.
+
+    Facets with a stored result under the same digest are not evaluated again: their
+    stored outcome is reused, renumbered to the facet's new place in the rubric, scored at
+    its current points and given the job's expected value. Yields ``(task, result)`` pairs
+    with full ``grade_file`` results, or ``error`` entries for submissions whose file
+    cannot be read.
+    """
+    hashes = facet_digests(job.questions)
+    facets = list(rubric.facets())
+    layout = [(question_index, facet_index)
+              for question_index, question in enumerate(rubric.questions)
+              for facet_index in range(len(question.facets))]
+    stored, timeouts = {}, Counter()
+    for row in FacetResult.objects.filter(submission__in=[task.submission_id for task in tasks]):
+        stored.setdefault(row.submission_id, {})[row.facet_hash] = row
+    for task in tasks:
+        submission = task.submission
+        reusable = stored.get(submission.pk, {})
+        positions = {position for position, facet_hash in enumerate(hashes)
+                     if passed(reusable.get(facet_hash), facets[position]) is None}
+        graded = {}
+        if positions:
+            try:
+                workbook = cached_workbook(
+                    submission.file_hash, rubric.read_plan(positions),
+                    lambda plan, submission=submission: _load_stored(submission, plan))
+            except OSError:
+                yield task, {'file_name': submission.file_name,
+                             'error': 'Submission file is missing'}
+                continue
+            except WorkbookError as exc:
+                yield task, {'file_name': submission.file_name, 'error': str(exc)}
+                continue
+            graded = dict(zip(sorted(positions),
+                              rubric.grade(workbook, job.expected, positions,
+                                           timeouts=timeouts)['responses']))
+        responses = []
+        for position, facet_hash in enumerate(hashes):
+            response = graded.get(position)
+            if response is None:
+                row, facet = reusable[facet_hash], facets[position]
+                question_index, facet_index = layout[position]
+                response = {
+                    'question': question_index,
+                    'facet': facet_index,
+                    'type': facet.type,
+                    'name': facet.name,
+                    'score': facet.get_max_score() if passed(row, facet) else 0,
+                    'outcome': row.outcome,
+                    'max_score': facet.get_max_score(),
+                    'provided_value': row.provided_value,
+                    'expected_value': job.expected[position] if job.expected else None,
+                }
+            responses.append(response)
+        yield task, {
+            'file_name': submission.file_name,
+            'score': sum(response['score'] for response in responses),
+            'max_score': rubric.get_max_score(),
+            'responses': responses,
+            'metadata': submission.metadata,
+        }
+
+
+def update_submissions(job, regraded, batch_size=None):
+    """
+    Replace the stored results of regraded submissions, in one transaction.
+
+    Args:
+        job: The regrade's ``GradingJob``
+        regraded: ``(submission, result)`` pairs from ``regrade``
+        batch_size: Rows per insert (default ``GRADING_RESULTS_BATCH_SIZE``)
+    """
+    if not regraded:
+        return
+    batch_size = batch_size or settings.GRADING_RESULTS_BATCH_SIZE
+    hashes = facet_digests(job.questions)
+    submissions, facet_results = [], []
+    for submission, result in regraded:
+        submission.score = result['score']
+        submission.max_score = result['max_score']
+        submissions.append(submission)
+        facet_results.extend(_facet_results(submission, result, hashes))
+    with transaction.atomic():
+        FacetResult.objects.filter(submission__in=submissions).delete()
+        Submission.objects.bulk_update(submissions, ['score', 'max_score'],
+                                       batch_size=batch_size)
+        FacetResult.objects.bulk_create(facet_results, batch_size=batch_size)
+        discard_outcomes(job.assignment_id)
@@ -110,8 +110,8 @@ class TestAssignmentListAPI:
         response = authenticated_client.get(url)
         
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 1
-        assert response.data[0]['name'] == assignment.name
+        assert len(response.data['results']) == 1
+        assert response.data['results'][0]['name'] == assignment.name
     
     def test_list_assignments_unauthenticated(self, api_client):
         """Test that unauthenticated users cannot list assignments."""
@@ -135,10 +135,41 @@ class TestAssignmentListAPI:
         response = authenticated_client.get(url)
         
         assert response.status_code == status.HTTP_200_OK
-        names = [a['name'] for a in response.data]
+        names = [a['name'] for a in response.data['results']]
         assert 'Own Assignment' in names
         assert 'Other Assignment' not in names
 
+    def test_list_assignments_summarizes_questions(self, authenticated_client,
+                                                   assignment_factory, user,
+                                                   django_assert_num_queries):
+        """Test that listed assignments carry question counts instead of questions."""
+        assignment_factory(owner=user, questions=[
+            {'name': 'Q1', 'facets': [{'type': 'ValueFacet', 'value': '1', 'targetCell': {
+                'sheetName': 'Sheet1', 'address': 'A1', 'row': 1, 'col': 1}},
+                                      {'type': 'UnknownFacet'}]},
+            {'name': 'Q2', 'facets': []},
+        ])
+        with django_assert_num_queries(2) as queries:  # the user, then one page
+            response = authenticated_client.get('/api/v1/assignments/')
+        assert 'questions' not in queries.captured_queries[-1]['sql']
+        listed, = response.data['results']
+        assert 'questions' not in listed
+        assert (listed['question_count'], listed['facet_count'],
+                listed['invalid_facet_count']) == (2, 2, 1)
+
+    def test_list_assignments_pages_by_cursor(self, authenticated_client, assignment_factory,
+                                              user):
+        """Test that pages follow the ``next`` cursor, most recently updated first."""
+        for index in range(5):
+            assignment_factory(owner=user, name=f'Assignment {index}')
+        names, url = [], '/api/v1/assignments/?page_size=2'
+        while url:
+            response = authenticated_client.get(url)
+            assert len(response.data['results']) <= 2
+            names.extend(a['name'] for a in response.data['results'])
+            url = response.data['next']
+        assert names == [f'Assignment {index}' for index in reversed(range(5))]
+
 
 @pytest.mark.unit
 @pytest.mark.django_db
@@ -208,6 +239,34 @@ class TestAssignmentRetrieveAPI:
         
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
+    def test_retrieve_not_modified(self, authenticated_client, assignment,
+                                   django_assert_num_queries):
+        """Test that a matching If-None-Match is answered 304 without loading the record."""
+        url = f'/api/v1/assignments/{assignment.uuid}/'
+        etag = authenticated_client.get(url)['ETag']
+        with django_assert_num_queries(2) as queries:  # the user, then updated_at
+            response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+        assert 'questions' not in queries.captured_queries[-1]['sql']
+
+        assignment.name = 'Renamed'
+        assignment.save()
+        response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+        assert response.data['name'] == 'Renamed'
+
+    def test_retrieve_selected_fields(self, authenticated_client, assignment):
+        """Test that ``fields=`` limits the response and has its own ETag."""
+        url = f'/api/v1/assignments/{assignment.uuid}/'
+        response = authenticated_client.get(url, {'fields': 'name,uuid'})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {'uuid', 'name'}
+        assert response['ETag'] != authenticated_client.get(url)['ETag']
+        response = authenticated_client.get(url, {'fields': 'name,secret'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 
 @pytest.mark.unit
 @pytest.mark.django_db
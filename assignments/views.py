@@ -1,10 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .gradebook import (
+    BASE_COLUMNS, assignment_results, date_column_indexes, gradebook_columns, gradebook_row,
+    iter_csv, iter_xlsx, job_results,
+)
+from .grading import (
+    ArchiveError, Rubric, RubricError, SubmissionArchive, WorkbookError, compile_rubric,
+    read_metadata, rubric_key, shared_origins,
+)
+from .grading.mapped import open_stored, open_upload
+from .jobs import add_tasks, create_job, fail_job, job_summary
 from .models import Assignment
-from .serializers import AssignmentSerializer
+from .outcomes import preview_rescore
+from .serializers import SUMMARY_FIELDS, AssignmentSerializer, AssignmentSummarySerializer
+
+
+def assignment_etag(uuid, updated_at, fields=None):
+    """A strong ETag for one revision of an assignment, as serialized with ``fields``."""
+    text = f'{uuid}:{updated_at.isoformat()}:{",".join(fields or ())}'
+    return quote_etag(hashlib.sha256(text.encode()).hexdigest()[:32])
+
+
+class AssignmentPagination(CursorPagination):
+    """
+    Keyset pagination of a user's assignments, most recently updated first: each page is
+    one range scan of the ``(owner, updated_at)`` index, however far into the list.
+    """
+    ordering = '-updated_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
 
 
 class AssignmentViewSet(viewsets.ViewSet):
@@ -16,8 +53,14 @@ class AssignmentViewSet(viewsets.ViewSet):
         return queryset
 
     def list(self, request):
-        serializer = self.serializer_class(self.get_queryset(), many=True)
-        return Response(serializer.data)
+        """
+        List the user's assignments a page at a time (``?cursor=`` from ``next``), as
+        summaries: rubrics are not loaded, only their question and facet counts.
+        """
+        paginator = AssignmentPagination()
+        queryset = self.get_queryset().only(*SUMMARY_FIELDS)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(AssignmentSummarySerializer(page, many=True).data)
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data)
@@ -26,9 +69,39 @@ class AssignmentViewSet(viewsets.ViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def retrieve(self, request, pk=None):
-        assignment = get_object_or_404(self.get_queryset(), pk=pk)
-        serializer = self.serializer_class(assignment)
-        return Response(serializer.data)
+        """
+        Return an assignment; ``?fields=`` picks the fields, e.g. ``uuid,name,updated_at``.
+
+        The response carries a strong ``ETag`` for this revision of the assignment and the
+        fields requested. A request whose ``If-None-Match`` matches it is answered 304 after
+        one indexed lookup of ``updated_at``, without loading or serializing the assignment.
+        """
+        fields = self._fields(request)
+        uuid, updated_at = get_object_or_404(
+            self.get_queryset().values_list('uuid', 'updated_at'), pk=pk)
+        etag = assignment_etag(uuid, updated_at, fields)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        matches = {tag.removeprefix('W/')
+                   for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if etag in matches or '*' in matches:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        queryset = self.get_queryset()
+        if fields:
+            queryset = queryset.only(*fields)
+        assignment = get_object_or_404(queryset, pk=pk)
+        serializer = self.serializer_class(assignment, fields=fields)
+        return Response(serializer.data, headers=headers)
+
+    def _fields(self, request):
+        """The fields named in ``?fields=``, in serializer order, or None for all of them."""
+        requested = [name for name in request.query_params.get('fields', '').split(',') if name]
+        if not requested:
+            return None
+        available = self.serializer_class.Meta.fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown fields: {", ".join(unknown)}']})
+        return tuple(name for name in available if name in requested)
 
     def update(self, request, pk=None):
         assignment = get_object_or_404(self.get_queryset(), pk=pk)
@@ -41,3 +114,188 @@ class AssignmentViewSet(viewsets.ViewSet):
         assignment = get_object_or_404(self.get_queryset(), pk=pk)
         assignment.delete()
         return Response(status=204)
+
+    def _rubric(self, assignment):
+        """Return the assignment's ``CompiledRubric``, rejecting rubrics that cannot be graded."""
+        try:
+            return compile_rubric(rubric_key(assignment), assignment.questions)
+        except RubricError as exc:
+            raise ValidationError({'questions': [str(exc)]})
+
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
+    def grade(self, request, pk=None):
+        """
+        Queue uploaded xlsx submissions (``files``) for grading against the assignment's rubric.
+
+        Responds at once with the job; ``manage.py grading_worker`` grades it and the results
+        are read from ``jobs/<id>/``.
+        """
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        files = request.FILES.getlist('files')
+        if not files:
+            raise ValidationError({'files': ['At least one submission file is required.']})
+        job = create_job(assignment, self._rubric(assignment), len(files))
+        add_tasks(job, ((upload.name, upload.read()) for upload in files))
+        job.refresh_from_db()
+        return Response(job_summary(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser],
+            url_path='grade-archive')
+    def grade_archive(self, request, pk=None):
+        """
+        Queue every xlsx file in an uploaded zip archive (``file``), e.g. an LMS bulk export.
+
+        Members are queued in chunks as they are read, so workers start on the first ones
+        while later ones are still being decompressed. Members that are too large, encrypted
+        or corrupt are recorded as failed submissions.
+        """
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['A zip archive of submissions is required.']})
+        rubric = self._rubric(assignment)
+        try:
+            archive = SubmissionArchive(upload, settings.GRADING_ARCHIVE_MAX_MEMBER_SIZE,
+                                        settings.GRADING_ARCHIVE_MAX_TOTAL_SIZE)
+        except ArchiveError as exc:
+            raise ValidationError({'file': [str(exc)]})
+        with archive:
+            job = create_job(assignment, rubric, len(archive) + len(archive.rejected))
+            try:
+                queued, chunk = 0, []
+                for submission in archive:
+                    chunk.append(submission)
+                    if len(chunk) == settings.GRADING_CHUNK_SIZE:
+                        queued += add_tasks(job, chunk, start=queued)
+                        chunk = []
+                # Members found corrupt while reading were appended to ``rejected``.
+                add_tasks(job, chunk, start=queued, rejected=archive.rejected)
+            except Exception:
+                fail_job(job, 'Archive could not be queued')
+                raise
+        job.refresh_from_db()
+        return Response(job_summary(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
+    def scan(self, request, pk=None):
+        """
+        Report the document properties of uploaded submissions without grading them.
+
+        Accepts xlsx ``files`` and/or a zip ``archive`` of them. Only each file's
+        ``docProps`` parts are read, so thousands of files scan in seconds. ``shared_origins``
+        groups files created at the same instant (other than the master's), which usually
+        means they were copied from one another.
+        """
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        files = request.FILES.getlist('files')
+        upload = request.FILES.get('archive')
+        if not files and upload is None:
+            raise ValidationError({'files': ['At least one submission file is required.']})
+        scanned, submissions = [], []
+
+        def scan_file(file_name, source):
+            try:
+                properties = read_metadata(source)
+            except WorkbookError as exc:
+                submissions.append({'file_name': file_name, 'error': str(exc)})
+                return
+            scanned.append((file_name, properties))
+            submissions.append({'file_name': file_name, **properties.as_dict()})
+
+        for file in files:
+            scan_file(file.name, file)
+        if upload is not None:
+            with open_upload(upload) as source:
+                try:
+                    archive = SubmissionArchive(source, settings.GRADING_ARCHIVE_MAX_MEMBER_SIZE,
+                                                settings.GRADING_ARCHIVE_MAX_TOTAL_SIZE)
+                except ArchiveError as exc:
+                    raise ValidationError({'archive': [str(exc)]})
+                with archive:
+                    for file_name, member in archive.files():
+                        scan_file(file_name, member)
+                    submissions.extend(archive.rejected)
+        try:
+            with open_stored(assignment.file) as source:
+                template = read_metadata(source)
+        except (OSError, ValueError, WorkbookError):
+            template = None
+        return Response({
+            'count': len(submissions),
+            'submissions': submissions,
+            'shared_origins': shared_origins(scanned, template),
+        })
+
+    @action(detail=True, methods=['post'], url_path='preview-rescore')
+    def preview_rescore(self, request, pk=None):
+        """
+        Report the scores the assignment's graded submissions would get under ``questions``
+        (default: the saved rubric) and a histogram of them, without saving anything.
+
+        Scores come from each submission's stored facet outcomes, so a change of points is
+        previewed instantly; facets that would need a regrade are listed as ``unscored``.
+        """
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        questions = request.data.get('questions', assignment.questions)
+        try:
+            rubric = Rubric(questions)
+        except RubricError as exc:
+            raise ValidationError({'questions': [str(exc)]})
+        return Response(preview_rescore(assignment, questions, rubric))
+
+    @action(detail=True, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]+)')
+    def job(self, request, pk=None, job_id=None):
+        """Report a grading job's progress and the results of its finished submissions."""
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        job = get_object_or_404(assignment.grading_jobs.all(), pk=job_id)
+        return Response(job_summary(job, results=True))
+
+    @action(detail=True, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]+)/export')
+    def export_job(self, request, pk=None, job_id=None):
+        """Stream a grading job's gradebook, as the job graded it; see ``_export``."""
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        job = get_object_or_404(assignment.grading_jobs.all(), pk=job_id)
+        return self._export(request, assignment, job.questions, job_results(job))
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Stream the gradebook of the assignment's stored submissions under its current rubric,
+        with any regrades and rescores since they were graded; see ``_export``.
+        """
+        assignment = get_object_or_404(self.get_queryset(), pk=pk)
+        if not assignment.grading_jobs.exists():
+            raise Http404('This assignment has not been graded on the server')
+        return self._export(request, assignment, assignment.questions,
+                            assignment_results(assignment))
+
+    def _export(self, request, assignment, questions, results):
+        """
+        Stream a gradebook as CSV (``?type=csv``, the default) or xlsx (``?type=xlsx``).
+
+        ``?columns=`` picks and orders columns by key, e.g. ``fileName,points,creator``; the
+        default is every file and document-property column. Facet columns are keyed
+        ``expected-<question>-<facet>`` and ``provided-<question>-<facet>``.
+        """
+        export_type = request.query_params.get('type', 'csv')
+        if export_type not in ('csv', 'xlsx'):
+            raise ValidationError({'type': ['Must be "csv" or "xlsx".']})
+        available = gradebook_columns(questions)
+        columns = [column for column in request.query_params.get('columns', '').split(',')
+                   if column] or list(BASE_COLUMNS)
+        unknown = [column for column in columns if column not in available]
+        if unknown:
+            raise ValidationError({'columns': [f'Unknown columns: {", ".join(unknown)}']})
+        headers = [available[column] for column in columns]
+        rows = (gradebook_row(result, columns) for result in results)
+        title = f'Submissions - {assignment.name}'
+        if export_type == 'csv':
+            response = StreamingHttpResponse(iter_csv(headers, rows),
+                                             content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(
+                iter_xlsx(headers, rows, title=title, date_columns=date_column_indexes(columns)),
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        file_name = ''.join(char for char in title if char not in '"\\/\r\n')
+        response['Content-Disposition'] = f'attachment; filename="{file_name}.{export_type}"'
+        return response
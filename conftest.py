@@ -6,6 +6,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 
+from assignments.grading.synthetic import build_xlsx
 from users.models import User
 
 
@@ -72,6 +73,12 @@ def sample_xlsx_file():
     )
 
 
+@pytest.fixture
+def xlsx_factory():
+    """Factory for building in-memory xlsx workbooks (see ``build_xlsx``)."""
+    return build_xlsx
+
+
 @pytest.fixture
 def assignment_factory(db, user_factory):
     """Factory for creating test assignments."""
@@ -170,4 +170,48 @@ FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:4200')
 
 # Email verification settings
 EMAIL_VERIFICATION_EXPIRY_DAYS = 7
-EMAIL_RATE_LIMIT_MINUTES = 15
\ No newline at end of file
+EMAIL_RATE_LIMIT_MINUTES = 15
+
+# Server-side grading
+# Processes each grading_worker grades a claimed batch on (1 grades in the grading_worker
+# process itself) and the number of submissions handed to one of them at a time.
+GRADING_WORKERS = int(os.environ.get('GRADING_WORKERS', os.cpu_count() or 1))
+GRADING_CHUNK_SIZE = int(os.environ.get('GRADING_CHUNK_SIZE', 16))
+# Background grading queue (manage.py grading_worker): how long a claimed batch of tasks is
+# leased to a worker before another may retry it, and how many attempts a task gets. The
+# lease is renewed while the batch is graded, so it must only cover grading one chunk.
+GRADING_TASK_LEASE_SECONDS = int(os.environ.get('GRADING_TASK_LEASE_SECONDS', 300))
+GRADING_TASK_MAX_ATTEMPTS = int(os.environ.get('GRADING_TASK_MAX_ATTEMPTS', 3))
+# Grading progress streams: seconds between polls, and most results sent in one event.
+GRADING_EVENTS_INTERVAL = float(os.environ.get('GRADING_EVENTS_INTERVAL', 1.0))
+GRADING_EVENTS_BATCH_SIZE = int(os.environ.get('GRADING_EVENTS_BATCH_SIZE', 500))
+# Seconds a job summary's ``events_token`` may be used to open that job's progress stream.
+GRADING_EVENTS_TOKEN_MAX_AGE = int(os.environ.get('GRADING_EVENTS_TOKEN_MAX_AGE', 300))
+# Rows per insert when graded submissions and their facet results are saved.
+GRADING_RESULTS_BATCH_SIZE = int(os.environ.get('GRADING_RESULTS_BATCH_SIZE', 1000))
+# Seconds a Formula Regex facet's search of one formula may take before it is reported
+# as timed out.
+GRADING_REGEX_TIMEOUT = float(os.environ.get('GRADING_REGEX_TIMEOUT', 1.0))
+# Uncompressed size limits for zip archives of submissions, in bytes.
+GRADING_ARCHIVE_MAX_MEMBER_SIZE = int(os.environ.get('GRADING_ARCHIVE_MAX_MEMBER_SIZE',
+                                                     25 * 1024 * 1024))
+GRADING_ARCHIVE_MAX_TOTAL_SIZE = int(os.environ.get('GRADING_ARCHIVE_MAX_TOTAL_SIZE',
+                                                    1024 * 1024 * 1024))
+
+# Grading result cache: results keyed by rubric and submission content hashes, evicted
+# least-recently-used once MAX_ENTRIES is reached. Set GRADING_CACHE to '' to disable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'grading': {
+        'BACKEND': 'assignments.grading.cache.LRUFileBasedCache',
+        'LOCATION': os.environ.get('GRADING_CACHE_DIR', os.path.join(BASE_DIR, 'grading_cache')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('GRADING_CACHE_MAX_ENTRIES', 20000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+GRADING_CACHE = os.environ.get('GRADING_CACHE', 'grading')
@@ -33,7 +33,11 @@ MIGRATION_MODULES = DisableMigrations()
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'grading': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'grading',
+    },
 }
 
 # Disable debug mode in tests
@@ -42,3 +46,5 @@ DEBUG = False
 # Media files for tests
 MEDIA_ROOT = '/tmp/excel-autograder-test-media/'
 
+# Grade in-process; the worker pool is exercised explicitly where needed
+GRADING_WORKERS = 1
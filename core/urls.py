@@ -12,6 +12,7 @@ from users.views import (
     UserViewSet, UserLogin, UserLogout, UserCreate, UserMe, ChangePassword,
     VerifyEmail, ResendVerification, ChangeEmail, CancelEmailChange
 )
+from assignments.events import job_events
 from assignments.views import AssignmentViewSet
 from assignments.models import Assignment
 
@@ -55,6 +56,7 @@ router.register(r'assignments', AssignmentViewSet, basename='assignment')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/assignments/<uuid:pk>/jobs/<uuid:job_id>/events/', job_events),
     path('api/v1/', include(router.urls)),
     path('api/v1/auth/login/', UserLogin.as_view()),
     path('api/v1/auth/register/', UserCreate.as_view()),
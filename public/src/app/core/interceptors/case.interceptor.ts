@@ -12,7 +12,7 @@ import { map } from 'rxjs/operators';
 /**
  * Converts object keys from snake_case to camelCase
  */
-function toCamelCase(obj: unknown): unknown {
+export function toCamelCase(obj: unknown): unknown {
   if (obj === null || obj === undefined) {
     return obj;
   }
@@ -1,3 +1,3 @@
 export { AuthInterceptor } from './auth.interceptor';
-export { CaseInterceptor } from './case.interceptor';
+export { CaseInterceptor, toCamelCase } from './case.interceptor';
 export { ErrorInterceptor } from './error.interceptor';
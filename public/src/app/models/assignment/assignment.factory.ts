@@ -1,4 +1,5 @@
 import { Injectable } from '@angular/core';
+import { toCamelCase } from '../../core/interceptors';
 import { QuestionFactory } from '../question/question.factory';
 import { AssignmentService } from './assignment.service';
 import { Assignment, IAssignmentPartial } from './assignment';
@@ -12,8 +13,16 @@ export class AssignmentFactory {
     private assignmentService: AssignmentService,
   ) { }
 
+  /**
+   * Build an assignment from an API payload; snake_case keys such as the list's
+   * `question_count` are read as their camelCase fields
+   */
   create(assignment: IAssignmentPartial): Assignment {
     if (assignment instanceof Assignment) return assignment;
-    return new Assignment(assignment, this.questionFactory, this.assignmentService);
+    return new Assignment(
+      toCamelCase(assignment) as IAssignmentPartial,
+      this.questionFactory,
+      this.assignmentService,
+    );
   }
 }
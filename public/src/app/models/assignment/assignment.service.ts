@@ -1,7 +1,7 @@
 import { Injectable } from '@angular/core';
 import { Observable } from 'rxjs';
 import { ApiService } from '../../services/api/api.service';
-import { IAssignment } from './assignment';
+import { IAssignment, IAssignmentPage } from './assignment';
 
 @Injectable({
   providedIn: 'root',
@@ -10,11 +10,21 @@ export class AssignmentService {
   constructor(private api: ApiService) {}
 
   /**
-   * List all assignments. Does not auto-resolve
-   * @returns Observable<Array<IAssignment>>
+   * List a page of assignments, most recently updated first, without their questions.
+   * Does not auto-resolve
+   * @param cursor The cursor of the page to fetch, from {@link nextCursor}; the first if omitted
+   * @returns Observable<IAssignmentPage>
    */
-  public list(): Observable<Array<IAssignment>> {
-    return this.api.get<Array<IAssignment>>('assignments/');
+  public list(cursor?: string): Observable<IAssignmentPage> {
+    return this.api.get<IAssignmentPage>('assignments/', cursor ? { params: { cursor } } : {});
+  }
+
+  /**
+   * The cursor of the page after a listed page, or null if it is the last
+   * @param page
+   */
+  public static nextCursor(page: IAssignmentPage): string | null {
+    return page.next ? new URL(page.next).searchParams.get('cursor') : null;
   }
 
   /**
@@ -0,0 +1,56 @@
+import { TestBed } from '@angular/core/testing';
+import { HttpClientTestingModule } from '@angular/common/http/testing';
+import { of } from 'rxjs';
+
+import { AssignmentFactory } from './assignment.factory';
+import { AssignmentService } from './assignment.service';
+import { IAssignmentPartial } from './assignment';
+
+// One entry of `GET /api/v1/assignments/`, as AssignmentSummarySerializer sends it
+const LISTED = {
+  uuid: '2f1b6c4e-8d4a-4f43-9a55-0c3b1d0f6a11',
+  name: 'Budget',
+  file: '/files/budget.xlsx',
+  created_at: '2024-01-02T03:04:05Z',
+  updated_at: '2024-01-03T03:04:05Z',
+  encrypted: false,
+  question_count: 2,
+  facet_count: 5,
+  invalid_facet_count: 1,
+} as unknown as IAssignmentPartial;
+
+describe('Assignment', () => {
+  let factory: AssignmentFactory;
+  let service: AssignmentService;
+
+  beforeEach(() => {
+    TestBed.configureTestingModule({
+      imports: [HttpClientTestingModule],
+    });
+    factory = TestBed.inject(AssignmentFactory);
+    service = TestBed.inject(AssignmentService);
+  });
+
+  it('reads the counts of a listed assignment', () => {
+    const assignment = factory.create(LISTED);
+    expect(assignment.questionCount).toBe(2);
+    expect(assignment.facetCount).toBe(5);
+    expect(assignment.invalidFacetCount).toBe(1);
+    expect(assignment.createdAt).toBe('2024-01-02T03:04:05Z');
+  });
+
+  it('has no questions until they are retrieved', () => {
+    expect(factory.create(LISTED).hasQuestions()).toBeFalse();
+    const empty = factory.create({ ...LISTED, question_count: 0 } as unknown as IAssignmentPartial);
+    expect(empty.hasQuestions()).toBeFalse();
+    const retrieved = factory.create({ ...LISTED, questions: [] } as IAssignmentPartial);
+    expect(retrieved.hasQuestions()).toBeTrue();
+  });
+
+  it('does not save the questions of a listed assignment', () => {
+    const put = spyOn(service, 'put').and.returnValue(of({}));
+    factory.create(LISTED).save();
+    const form = put.calls.mostRecent().args[1] as FormData;
+    expect(form.has('questions')).toBeFalse();
+  });
+});
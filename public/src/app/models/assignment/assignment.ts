@@ -22,6 +22,16 @@ export interface IAssignmentPartial {
   file: string;
   encrypted: boolean;
   questions: Array<IQuestion>
+  // Sent by the server; listed assignments carry these instead of their questions
+  readonly questionCount?: number;
+  readonly facetCount?: number;
+  readonly invalidFacetCount?: number;
+}
+
+export interface IAssignmentPage {
+  readonly next: string | null;
+  readonly previous: string | null;
+  readonly results: Array<IAssignmentPartial>;
 }
 
 export interface IAssignment extends IAssignmentPartial, IApiModel<IAssignmentPartial> {
@@ -35,7 +45,7 @@ export interface IAssignment extends IAssignmentPartial, IApiModel<IAssignmentPa
 }
 
 export class Assignment implements IAssignment {
-  specialTypes: Array<string> = ['file', 'questions'];
+  specialTypes: Array<string> = ['file', 'questions', 'questionsLoaded'];
 
   readonly uuid: string;
 
@@ -53,6 +63,16 @@ export class Assignment implements IAssignment {
 
   questions: Array<Question>;
 
+  readonly questionCount: number;
+
+  readonly facetCount: number;
+
+  readonly invalidFacetCount: number;
+
+  // False for listed assignments, which carry only the counts of their questions; a new
+  // assignment has nothing to load
+  private questionsLoaded: boolean;
+
   cache: {
     file?: Blob|File
     key?: string
@@ -70,9 +90,22 @@ export class Assignment implements IAssignment {
     this.name = assignment.name;
     this.file = assignment.file;
     this.encrypted = assignment.encrypted;
+    this.questionsLoaded = Array.isArray(assignment.questions) || !assignment.uuid;
     this.questions = assignment.questions?.map(
       (question) => this.questionFactory.create(question),
     ) ?? [];
+    const facets = this.questions.flatMap((question) => question.getFacets());
+    this.questionCount = assignment.questionCount ?? this.questions.length;
+    this.facetCount = assignment.facetCount ?? facets.length;
+    this.invalidFacetCount = assignment.invalidFacetCount
+      ?? facets.filter((facet) => !facet.isValid()).length;
+  }
+
+  /**
+   * Whether the questions were loaded: listed assignments only carry their counts
+   */
+  hasQuestions(): boolean {
+    return this.questionsLoaded;
   }
 
   public getSerializable(): IAssignmentPartial {
@@ -97,7 +130,8 @@ export class Assignment implements IAssignment {
       ([key, value]) => { if (!this.specialTypes.includes(key)) form.append(key, value); },
     );
 
-    if (this.questions) {
+    // Questions that were never loaded must not be saved as an empty rubric
+    if (this.hasQuestions()) {
       form.append('questions', JSON.stringify(this.questions.map((q: Question) => q.getSerializable())));
     }
 
@@ -133,6 +167,7 @@ export class Assignment implements IAssignment {
 
   setQuestions(questions: Array<Question>) {
     this.questions = questions;
+    this.questionsLoaded = true;
   }
 
   addQuestion() {
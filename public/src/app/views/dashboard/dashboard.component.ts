@@ -1,4 +1,5 @@
 import { Component, EventEmitter, OnInit } from '@angular/core';
+import { Observable, map, of } from 'rxjs';
 import { MatDialog } from '@angular/material/dialog';
 import { MatTableDataSource } from '@angular/material/table';
 import { AssignmentService } from '../../models/assignment/assignment.service';
@@ -35,6 +36,9 @@ export class DashboardComponent implements OnInit {
 
   isLoading = true;
 
+  // Cursor of the next page of assignments, or null when all are shown
+  nextCursor: string | null = null;
+
   constructor(
     public dialog: MatDialog,
     public assignmentService: AssignmentService,
@@ -44,15 +48,46 @@ export class DashboardComponent implements OnInit {
   }
 
   ngOnInit(): void {
-    this.assignmentService.list().subscribe((assignments) => {
-      this.assignments = assignments.map(
+    this.loadMore();
+  }
+
+  /**
+   * Append the next page of assignments. Listed assignments come without their questions,
+   * only their counts; {@link withQuestions} fetches them when an action needs them.
+   */
+  loadMore(): void {
+    this.isLoading = true;
+    this.assignmentService.list(this.nextCursor ?? undefined).subscribe((page) => {
+      this.assignments = this.assignments.concat(page.results.map(
         (assignment) => this.assignmentFactory.create(assignment),
-      );
+      ));
+      this.nextCursor = AssignmentService.nextCursor(page);
       this.dataSource.data = this.assignments;
       this.isLoading = false;
     });
   }
 
+  /**
+   * Resolve to the assignment with its questions, retrieving it if it was only listed.
+   */
+  withQuestions(assignment: Assignment): Observable<Assignment> {
+    if (assignment.hasQuestions()) return of(assignment);
+    return this.assignmentService.retrieve(assignment.uuid).pipe(
+      map((iAssignment) => {
+        const full = this.assignmentFactory.create(iAssignment);
+        this.replace(assignment, full);
+        return full;
+      }),
+    );
+  }
+
+  private replace(assignment: Assignment, updated: Assignment): void {
+    this.assignments = this.assignments.map(
+      (listed) => (listed.uuid === assignment.uuid ? updated : listed),
+    );
+    this.dataSource.data = this.assignments;
+  }
+
   openNewDialog(): void {
     const newAssignmentEmitter = new EventEmitter<Assignment | null>();
     newAssignmentEmitter.subscribe((assignment: Assignment | null) => {
@@ -117,7 +152,11 @@ export class DashboardComponent implements OnInit {
     });
   }
 
-  openExportDialog(assignment: Assignment) {
+  openExportDialog(listed: Assignment) {
+    this.withQuestions(listed).subscribe((assignment) => this.exportAssignment(assignment));
+  }
+
+  private exportAssignment(assignment: Assignment) {
     assignment.getFile().subscribe((file) => {
       encodeBlobToBase64(file).then((base64) => {
         const exportData = {
@@ -156,14 +195,19 @@ export class DashboardComponent implements OnInit {
     });
   }
 
-  openEditDialog(assignment: Assignment) {
+  openEditDialog(listed: Assignment) {
+    // Saving sends the questions, so they must be loaded first.
+    this.withQuestions(listed).subscribe((assignment) => this.editAssignment(assignment));
+  }
+
+  private editAssignment(assignment: Assignment) {
     const assignmentEmitter = new EventEmitter<Assignment | null>();
     assignmentEmitter.subscribe((as: Assignment | null) => {
       if (as) {
         as.save().subscribe({
-          next: () => {
+          next: (iLiveAssignment: IAssignment) => {
             this.notification.success('Assignment updated!');
-            this.dataSource.data = this.assignments;
+            this.replace(as, this.assignmentFactory.create(iLiveAssignment));
           },
           error: () => {
             this.notification.error('Failed to update assignment!');
@@ -183,36 +227,28 @@ export class DashboardComponent implements OnInit {
    * Returns false if any facet is invalid.
    */
   areAllFacetsValid(assignment: Assignment): boolean {
-    const questions = assignment.getQuestions();
-    if (!questions.length) return false;
-
-    // Check if there's at least one facet across all questions
-    const hasFacets = questions.some((q) => q.getFacets().length > 0);
-    if (!hasFacets) return false;
-
-    // Check if all facets are valid
-    return questions.every((q) => q.getFacets().every((f) => f.isValid()));
+    return this.hasAnyFacets(assignment) && !assignment.invalidFacetCount;
   }
 
   /**
    * Check if an assignment has any facets at all.
    */
   hasAnyFacets(assignment: Assignment): boolean {
-    return assignment.getQuestions().some((q) => q.getFacets().length > 0);
+    return assignment.facetCount > 0;
   }
 
   /**
    * Count the number of invalid facets in an assignment.
    */
   countInvalidFacets(assignment: Assignment): number {
-    return assignment.getQuestions().reduce((count, q) => count + q.getFacets().filter((f) => !f.isValid()).length, 0);
+    return assignment.invalidFacetCount;
   }
 
   /**
    * Get the status class for styling based on assignment state.
    */
   getStatusClass(assignment: Assignment): string {
-    if (!assignment.getQuestions().length) {
+    if (!assignment.questionCount) {
       return 'status-setup';
     }
     if (!this.hasAnyFacets(assignment)) {
@@ -228,7 +264,7 @@ export class DashboardComponent implements OnInit {
    * Get the status icon based on assignment state.
    */
   getStatusIcon(assignment: Assignment): string {
-    if (!assignment.getQuestions().length) {
+    if (!assignment.questionCount) {
       return 'construction';
     }
     if (!this.hasAnyFacets(assignment)) {
@@ -244,7 +280,7 @@ export class DashboardComponent implements OnInit {
    * Get human-readable status text based on assignment state.
    */
   getStatusText(assignment: Assignment): string {
-    if (!assignment.getQuestions().length) {
+    if (!assignment.questionCount) {
       return 'Needs Setup';
     }
     if (!this.hasAnyFacets(assignment)) {
@@ -262,6 +298,9 @@ export class DashboardComponent implements OnInit {
    */
   getStatusTooltip(assignment: Assignment): string {
     if (!this.areAllFacetsValid(assignment) && this.hasAnyFacets(assignment)) {
+      if (!assignment.hasQuestions()) {
+        return 'Open the rules editor to see which rules need fixing';
+      }
       const invalidFacets: string[] = [];
       assignment.getQuestions().forEach((q) => {
         q.getFacets().forEach((f) => {